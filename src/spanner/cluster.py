@@ -0,0 +1,123 @@
+"""
+Runs the bot as several processes ("clusters"), each owning a contiguous range of the shards.
+
+The supervisor starts one worker process per cluster, prefixes and forwards their output, restarts workers that crash
+and runs the IPC broker that lets the clusters talk to each other (see utils.ipc).
+"""
+import asyncio
+import os
+import signal
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from .utils.ipc import IPCBroker
+
+__all__ = ("ClusterSupervisor", "run_clusters")
+
+# A worker that stays up this long is considered healthy again, and its restart delay is reset.
+HEALTHY_AFTER = 300
+MAX_RESTART_DELAY = 60
+
+
+class ClusterSupervisor:
+    def __init__(self, clusters: int, shard_count: int, *, echo: Callable[[str], None] = print):
+        if clusters < 1:
+            raise ValueError("There must be at least one cluster.")
+        if shard_count < clusters:
+            raise ValueError("There must be at least as many shards as clusters.")
+        self.clusters = clusters
+        self.shard_count = shard_count
+        self.echo = echo
+        self.ipc_path = Path(tempfile.gettempdir()) / ("spanner-ipc-%d.sock" % os.getpid())
+        self.broker = IPCBroker(self.ipc_path)
+        self.processes: Dict[int, asyncio.subprocess.Process] = {}
+        self.restarts: Dict[int, int] = {}
+        self._stopping = False
+
+    def shard_ids_for(self, cluster_id: int) -> List[int]:
+        start = cluster_id * self.shard_count // self.clusters
+        end = (cluster_id + 1) * self.shard_count // self.clusters
+        return list(range(start, end))
+
+    def _environment(self, cluster_id: int) -> Dict[str, str]:
+        env = os.environ.copy()
+        env.update(
+            SPANNER_CLUSTER_ID=str(cluster_id),
+            SPANNER_SHARD_COUNT=str(self.shard_count),
+            SPANNER_SHARD_IDS=":".join(map(str, self.shard_ids_for(cluster_id))),
+            SPANNER_IPC_PATH=str(self.ipc_path),
+            PYTHONUNBUFFERED="1",
+        )
+        return env
+
+    async def _spawn(self, cluster_id: int) -> asyncio.subprocess.Process:
+        return await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-c",
+            "from spanner import cli; cli()",
+            "run",
+            cwd=Path(__file__).parents[1],
+            env=self._environment(cluster_id),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            start_new_session=True,  # so that Ctrl+C reaches the supervisor only, which then stops workers cleanly.
+        )
+
+    async def _forward_output(self, cluster_id: int, stream: asyncio.StreamReader) -> None:
+        prefix = "[cluster %d] " % cluster_id
+        while True:
+            line = await stream.readline()
+            if not line:
+                break
+            self.echo(prefix + line.decode(errors="replace").rstrip())
+
+    async def _supervise(self, cluster_id: int) -> None:
+        failures = 0
+        while not self._stopping:
+            shard_ids = self.shard_ids_for(cluster_id)
+            self.echo("Starting cluster %d (shards %d-%d)." % (cluster_id, shard_ids[0], shard_ids[-1]))
+            started = time.monotonic()
+            process = self.processes[cluster_id] = await self._spawn(cluster_id)
+            await self._forward_output(cluster_id, process.stdout)
+            code = await process.wait()
+            if self._stopping or code == 0:
+                self.echo("Cluster %d stopped." % cluster_id)
+                return
+
+            if time.monotonic() - started >= HEALTHY_AFTER:
+                failures = 0
+            failures += 1
+            self.restarts[cluster_id] = self.restarts.get(cluster_id, 0) + 1
+            delay = min(2**failures, MAX_RESTART_DELAY)
+            self.echo("Cluster %d exited with code %d. Restarting in %d seconds." % (cluster_id, code, delay))
+            await asyncio.sleep(delay)
+
+    def stop(self) -> None:
+        """Asks every worker to shut down. Workers are not restarted after this."""
+        if self._stopping:
+            return
+        self._stopping = True
+        self.echo("Stopping all clusters...")
+        for process in self.processes.values():
+            if process.returncode is None:
+                process.send_signal(signal.SIGINT)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stop)
+
+        await self.broker.start()
+        try:
+            await asyncio.gather(*(self._supervise(cluster_id) for cluster_id in range(self.clusters)))
+        finally:
+            await self.broker.close()
+
+
+def run_clusters(clusters: int, shard_count: Optional[int] = None, *, echo: Callable[[str], None] = print) -> None:
+    """Starts and supervises the clusters until they all stop, or the supervisor is interrupted."""
+    supervisor = ClusterSupervisor(clusters, shard_count or clusters, echo=echo)
+    asyncio.run(supervisor.run())
@@ -1,7 +1,7 @@
 import discord
 from discord.ext import commands
 
-from utils import get_guild_config
+from utils import get_guild_config, update_guild_config
 
 
 async def is_owner(ctx: discord.ApplicationContext) -> bool:
@@ -56,7 +56,7 @@ class ConfigCog(commands.Cog):
                 )
             channel_id = channel.id
 
-        await guild.update(log_channel=channel_id)
+        await update_guild_config(guild, log_channel=channel_id)
         if channel:
             return await ctx.respond(f"Set your log channel to {channel.mention}.")
         else:
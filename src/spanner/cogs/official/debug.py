@@ -1,10 +1,11 @@
+import asyncio
 import io
 import json
 import subprocess
 import sys
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Union, List
+from typing import Union, List, Optional
 
 import discord
 import httpx
@@ -13,20 +14,29 @@ from discord.ext import commands, pages as pagination, tasks
 from humanize import naturalsize, naturaltime
 
 from bot.client import Bot
-from database import Errors, models
+from database import Errors, error_ids, models
 from utils import utils
+from utils.ipc import IPCError, ipc
+from utils.profiler import SamplingProfiler
+from utils.timings import timings
+from utils.unfurler import unfurler
+from utils.watchdog import watchdog
 
 
 async def get_similar_case_ids(ctx: discord.AutocompleteContext) -> List[str]:
-    results: List[int] = [x.id for x in await Errors.objects.all() if str(ctx.value) in str(x.id)]
-    results.sort(reverse=True)  # brings the newest case IDs first
-    return list(map(str, results))
+    return list(map(str, error_ids.search(str(ctx.value or ""))))
 
 
 class Debug(commands.Cog):
     def __init__(self, bot: Bot):
         self.bot: Bot = bot
         self.loaded_at = datetime.now()
+        ipc.add_handler("trace", self._ipc_trace)
+        ipc.add_handler("profile", self._ipc_profile)
+
+    def cog_unload(self):
+        ipc.remove_handler("trace")
+        ipc.remove_handler("profile")
 
     @commands.command(name="type", hidden=True)
     @commands.is_owner()
@@ -76,7 +86,17 @@ class Debug(commands.Cog):
     @commands.slash_command(name="ping")
     async def ping(self, ctx: discord.ApplicationContext):
         """Shows the bot's latency."""
-        await ctx.respond(f"Pong! {round(self.bot.latency * 1000, 2)}ms")
+        shards = self.bot.shard_info()
+        if len(shards) <= 1:
+            return await ctx.respond(f"Pong! {utils.format_latency(self.bot.latency)}")
+
+        lines = [f"Pong! {utils.format_latency(self.bot.latency)} average, {len(shards)} shards:"]
+        for shard_id, (latency, guild_count) in list(shards.items())[:20]:
+            current = " (this server)" if ctx.guild and ctx.guild.shard_id == shard_id else ""
+            lines.append(f"Shard {shard_id}: {utils.format_latency(latency)}, {guild_count:,} guilds{current}")
+        if len(shards) > 20:
+            lines.append(f"...and {len(shards) - 20} more.")
+        await ctx.respond("\n".join(lines))
 
     @commands.slash_command(name="clean")
     async def clean_bot_message(self, ctx: discord.ApplicationContext, max_search: discord.Option(int, default=100)):
@@ -140,14 +160,12 @@ class Debug(commands.Cog):
     async def get_error_case(
         self,
         ctx: discord.ApplicationContext,
-        case_id: discord.Option(
-            str, "The ID of the case", autocomplete=discord.utils.basic_autocomplete(get_similar_case_ids)
-        ),
+        case_id: discord.Option(str, "The ID of the case", autocomplete=get_similar_case_ids),
         ephemeral: discord.Option(bool, "Whether to send the error message as an ephemeral message", default=False),
     ):
         """Fetches an error case"""
 
-        if models.DB_STAT is None:
+        if models.DB_STAT is None and (Path.cwd() / "main.db").exists():
             models.DB_STAT = datetime.fromtimestamp((Path.cwd() / "main.db").stat().st_ctime, timezone.utc)
 
         try:
@@ -168,18 +186,22 @@ class Debug(commands.Cog):
             full_message = "unavailable"
             if case.full_message is not None:
                 try:
-                    async with utils.session.post(
-                        "https://h.nexy7574.cyou/documents", data=case.full_message
-                    ) as response:
-                        full_message = "[available here](https://h.nexy7574.cyou/" + response.json()["key"] + ")"
+                    response = await utils.session.post("https://h.nexy7574.cyou/documents", content=case.full_message)
+                    response.raise_for_status()
+                    full_message = "[available here](https://h.nexy7574.cyou/" + response.json()["key"] + ")"
                 except httpx.HTTPError:
                     pass
 
             traceback_text = "```py\n{}\n```".format(case.traceback_text)
             if len(traceback_text) > 2000:
-                async with utils.session.post(
-                    "https://h.nexy7574.cyou/documents", data=case.traceback_text
-                ) as response:
+                try:
+                    response = await utils.session.post(
+                        "https://h.nexy7574.cyou/documents", content=case.traceback_text
+                    )
+                    response.raise_for_status()
+                except httpx.HTTPError:
+                    traceback_text = traceback_text[:1993] + "\n...```"
+                else:
                     traceback_text = "[traceback available here](https://h.nexy7574.cyou/{})".format(
                         response.json()["key"]
                     )
@@ -205,6 +227,7 @@ class Debug(commands.Cog):
                 @discord.ui.button(label="Delete", style=discord.ButtonStyle.red, emoji="\N{WASTEBASKET}")
                 async def delete_callback(self, button: discord.ui.Button, interaction: discord.Interaction):
                     await case.delete()
+                    error_ids.discard(case.id)
                     button.disabled = True
                     await paginator.update(pages, show_disabled=False, timeout=300, custom_view=self)
                     await interaction.response.send_message(f"Deleted case #{case.id}.", ephemeral=True)
@@ -212,9 +235,58 @@ class Debug(commands.Cog):
             paginator = pagination.Paginator(pages, show_disabled=False, timeout=300, custom_view=CustomView())
             await paginator.respond(ctx.interaction, ephemeral=ephemeral)
 
-    @commands.command()
+    async def record_trace(self, seconds: int) -> str:
+        """Traces this process' resource usage for the given number of seconds, returning the trace as JSON."""
+        from utils import Tracer
+
+        t = Tracer(self.bot)
+        t.start()
+        await asyncio.sleep(seconds)
+        data = io.BytesIO()
+        t.stop(data)
+        return data.getvalue().decode()
+
+    async def _ipc_trace(self, data: dict) -> str:
+        return await self.record_trace(data["seconds"])
+
+    async def record_profile(self, seconds: int, rate: float) -> dict:
+        """Profiles this process for the given number of seconds, returning the results in both export formats."""
+        profiler = SamplingProfiler(rate)
+        profiler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            await utils.run_blocking(profiler.stop)
+        return {
+            "summary": profiler.summary(),
+            "speedscope": profiler.speedscope("spanner cluster %d" % ipc.cluster_id),
+            "collapsed": profiler.collapsed(),
+        }
+
+    async def _ipc_profile(self, data: dict) -> dict:
+        return await self.record_profile(data["seconds"], data["rate"])
+
+    @staticmethod
+    async def _run_on_clusters(cluster: Optional[str], handler, name: str, data: dict, timeout: float) -> dict:
+        # Runs a recording on this cluster (cluster=None), one other cluster, or all of them ("all").
+        if cluster is None:
+            return {ipc.cluster_id: await handler(data)}
+        if cluster == "all":
+            return await ipc.request_all(name, data, timeout=timeout)
+        try:
+            result = await ipc.request(name, data, target=int(cluster), timeout=timeout)
+        except (IPCError, asyncio.TimeoutError) as e:
+            result = e
+        return {int(cluster): result}
+
+    @commands.group(invoke_without_command=True)
     @commands.is_owner()
-    async def trace(self, ctx: commands.Context, *, seconds: int = 30):
+    async def trace(self, ctx: commands.Context, seconds: int = 30, cluster: str = None):
+        """
+        Traces resource usage. Pass a cluster ID, or "all", to trace other clusters instead of this one.
+
+        Use `trace profile` to find out which functions are using the CPU.
+        """
         if seconds % 5:
             return await ctx.send("Seconds must be a multiple of 5.")
 
@@ -223,31 +295,185 @@ class Debug(commands.Cog):
         except ImportError:
             return await ctx.send("Tracer is not ready.")
 
-        t = Tracer(self.bot)
+        if cluster is not None and cluster != "all" and not cluster.isdigit():
+            return await ctx.send("Cluster must be a cluster ID or 'all'.")
+
         ends_at = discord.utils.utcnow() + timedelta(seconds=seconds)
         message = await ctx.send("Tracing... (competes {})".format(discord.utils.format_dt(ends_at, "R")))
-        t.start()
+        # Remote clusters get a little longer than the trace itself to send their results back.
+        timeout = seconds + 30
         async with ctx.channel.typing():
-            await discord.utils.sleep_until(ends_at)  # may end up being inaccurate but like, who cares
-        data = io.BytesIO()
-        t.stop(data)
-        data.seek(0)
+            results = await self._run_on_clusters(cluster, self._ipc_trace, "trace", {"seconds": seconds}, timeout)
+
+        files = []
+        errors = []
+        for cluster_id, result in results.items():
+            if isinstance(result, Exception):
+                errors.append("Cluster %d failed: %s" % (cluster_id, str(result) or result.__class__.__name__))
+            else:
+                filename = "trace.json" if cluster is None else "trace-cluster-%d.json" % cluster_id
+                files.append(discord.File(io.BytesIO(result.encode()), filename=filename))
         try:
-            await message.edit(
-                content="Trace complete.\n",
-                file=discord.File(data, filename="trace.json"),
-            )
+            await message.edit(content="\n".join(["Trace complete.", *errors]), files=files[:10])
         except discord.HTTPException:
             return
-        finally:
-            del t
 
-    @commands.group(name="cogs", invoke_without_subcommand=True)
+    @trace.command(name="profile")
+    @commands.is_owner()
+    async def trace_profile(self, ctx: commands.Context, seconds: int = 60, cluster: str = None, rate: float = 100):
+        """
+        Samples the event loop's and executors' stacks `rate` times a second, to find out what is using the CPU.
+
+        Sends a speedscope file (open it at https://www.speedscope.app) and collapsed stacks (for flame graph tools).
+        """
+        if not 1 <= seconds <= 600:
+            return await ctx.send("Seconds must be between 1 and 600.")
+        if not 1 <= rate <= 1000:
+            return await ctx.send("The rate must be between 1 and 1000 samples per second.")
+        if cluster is not None and cluster != "all" and not cluster.isdigit():
+            return await ctx.send("Cluster must be a cluster ID or 'all'.")
+
+        ends_at = discord.utils.utcnow() + timedelta(seconds=seconds)
+        message = await ctx.send("Profiling... (completes {})".format(discord.utils.format_dt(ends_at, "R")))
+        data = {"seconds": seconds, "rate": rate}
+        async with ctx.channel.typing():
+            results = await self._run_on_clusters(cluster, self._ipc_profile, "profile", data, seconds + 30)
+
+        files = []
+        lines = ["Profile complete."]
+        for cluster_id, result in results.items():
+            if isinstance(result, Exception):
+                lines.append("Cluster %d failed: %s" % (cluster_id, str(result) or result.__class__.__name__))
+                continue
+            lines.append("Cluster %d: %s" % (cluster_id, result["summary"]))
+            name = "profile" if cluster is None else "profile-cluster-%d" % cluster_id
+            files.append(discord.File(io.BytesIO(result["speedscope"].encode()), filename=name + ".speedscope.json"))
+            files.append(discord.File(io.BytesIO(result["collapsed"].encode()), filename=name + ".collapsed.txt"))
+        try:
+            await message.edit(content="\n".join(lines)[:2000], files=files[:10])
+        except discord.HTTPException:
+            return
+
+    @commands.command(name="cache-stats")
+    @commands.is_owner()
+    async def cache_stats(self, ctx: commands.Context):
+        """Shows hit/miss statistics for the in-memory caches."""
+        caches = {"Guild configs": utils.guild_config_cache, "Invite unfurls": unfurler.cache}
+        lines = []
+        for name, cache in caches.items():
+            stats = cache.stats()
+            lines.append(
+                "**{0}**: {1[size]:,}/{1[max_size]:,} entries, {1[hits]:,} hits, {1[misses]:,} misses "
+                "({2:.1%} hit ratio), {1[evictions]:,} evictions, {1[ttl]:,.0f}s TTL".format(
+                    name, stats, stats["hit_ratio"]
+                )
+            )
+        await ctx.reply("\n".join(lines))
+
+    @commands.command(name="slow-commands")
+    @commands.is_owner()
+    async def slow_commands(self, ctx: commands.Context, limit: int = 10):
+        """Shows the commands with the worst latency, and the most recent slow invocations."""
+        lines = ["**Slowest commands** (by p99 total time):"]
+        for command, kind, stats in timings.slowest(limit):
+            lines.append(
+                "`{}` ({}): {:,} runs, p50 {:.0f}ms, p95 {:.0f}ms, p99 {:.0f}ms, max {:.0f}ms, first response p95 "
+                "{:.0f}ms, avg DB {:.0f}ms, avg REST {:.0f}ms".format(
+                    command,
+                    kind,
+                    stats.total.count,
+                    stats.total.percentile(50) * 1000,
+                    stats.total.percentile(95) * 1000,
+                    stats.total.percentile(99) * 1000,
+                    stats.total.max * 1000,
+                    stats.first_response.percentile(95) * 1000,
+                    stats.db_time / stats.total.count * 1000,
+                    stats.rest_time / stats.total.count * 1000,
+                )
+            )
+        if len(lines) == 1:
+            lines.append("No commands have been run yet.")
+
+        lines.append("\n**Recent slow invocations** (over %.1fs):" % timings.slow_threshold)
+        recent = list(timings.slow_log)[-5:]
+        for timestamp, timing in reversed(recent):
+            lines.append("<t:%d:R>: %s" % (timestamp, timing.describe()))
+        if not recent:
+            lines.append("None.")
+        await ctx.reply("\n".join(lines)[:2000])
+
+    @commands.command(name="loop-stats")
+    @commands.is_owner()
+    async def loop_stats(self, ctx: commands.Context):
+        """Shows the event loop's recent lag, and the last times something blocked it (with stacks)."""
+        if not watchdog.running:
+            return await ctx.reply("The event loop watchdog is not running.")
+        lines = []
+        for window in (60, 300):
+            lag = sorted(watchdog.recent_lag(window))
+            if lag:
+                lines.append(
+                    "**Lag over the last %ds**: p50 %.1fms, p99 %.1fms, max %.1fms (%d ticks)"
+                    % (window, lag[len(lag) // 2] * 1000, lag[int(len(lag) * 0.99)] * 1000, lag[-1] * 1000, len(lag))
+                )
+        blocks = list(watchdog.blocks)
+        lines.append(
+            "**Blocked over %.0fms**: %d times recently%s"
+            % (watchdog.threshold * 1000, len(blocks), ", stacks attached." if blocks else ".")
+        )
+        for block in reversed(blocks[-5:]):
+            duration = "ongoing" if block.duration is None else "%.0fms" % (block.duration * 1000)
+            innermost = block.stack[-1].strip().splitlines()[0] if block.stack else "unknown"
+            lines.append("<t:%d:R>: %s, in `%s`" % (block.timestamp, duration, innermost[:150]))
+
+        file = None
+        if blocks:
+            report = "\n\n".join(
+                "%s\n%s" % (datetime.fromtimestamp(block.timestamp, timezone.utc).isoformat(), block.describe())
+                for block in reversed(blocks)
+            )
+            file = discord.File(io.BytesIO(report.encode()), filename="blocked-loop-stacks.txt")
+        await ctx.reply("\n".join(lines)[:2000], file=file)
+
+    @commands.group(name="cogs", invoke_without_command=True)
     @commands.is_owner()
     async def cogs(self, ctx: commands.Context):
         """Cog management. This command on its own lists all cogs."""
         return await ctx.reply("wip")
 
+    @cogs.command(name="reload")
+    @commands.is_owner()
+    async def reload_cog(self, ctx: commands.Context, extension: str):
+        """Reloads an extension (e.g. `cogs.official.mod`) on every cluster."""
+        async with ctx.channel.typing():
+            results = await ipc.request_all("reload_extension", extension, timeout=30)
+        lines = []
+        for cluster_id, result in results.items():
+            if isinstance(result, Exception):
+                lines.append("Cluster %d: failed (%s)" % (cluster_id, str(result) or result.__class__.__name__))
+            else:
+                lines.append("Cluster %d: reloaded" % cluster_id)
+        await ctx.reply("\n".join(lines))
+
+    @commands.command(name="clusters")
+    @commands.is_owner()
+    async def list_clusters(self, ctx: commands.Context):
+        """Shows the status of every cluster."""
+        async with ctx.channel.typing():
+            results = await ipc.request_all("stats", timeout=5)
+        lines = []
+        for cluster_id, result in results.items():
+            this = " (this cluster)" if cluster_id == ipc.cluster_id else ""
+            if isinstance(result, Exception):
+                lines.append(f"**Cluster {cluster_id}**{this}: not responding ({result!s})")
+            else:
+                lines.append(
+                    f"**Cluster {cluster_id}**{this}: {result['shards']} shards, {result['guilds']:,} guilds, "
+                    f"{result['users']:,} users, {result['errors']:,} errors, worst latency "
+                    f"{utils.format_latency(result['worst_latency'])}"
+                )
+        await ctx.reply("\n".join(lines))
+
     @commands.command()
     @commands.is_owner()
     async def speedtest(self, ctx: commands.Context):
@@ -260,7 +486,8 @@ class Debug(commands.Cog):
                     subprocess.run,
                     ("speedtest", "-f", "json"),
                     capture_output=True,
-                    encoding=sys.stdout.encoding
+                    encoding=sys.stdout.encoding,
+                    pool="io",
                 )
             except FileNotFoundError:
                 await msg.delete()
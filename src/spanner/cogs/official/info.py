@@ -1,3 +1,5 @@
+import asyncio
+import collections
 import datetime
 import json
 import os
@@ -10,19 +12,21 @@ import time
 from io import BytesIO
 from pathlib import Path
 from textwrap import shorten
-from typing import Union, Tuple, Optional, List, Dict
+from typing import AsyncIterator, Awaitable, Union, Tuple, Optional, List, Dict
 from urllib.parse import urlparse, quote_plus
 
-import bs4
 import discord
 import httpx
 import humanize
 import unicodedata
-from bs4 import BeautifulSoup
 from discord.ext import commands, pages
 
 import utils
 from bot.client import Bot
+from utils.bans import BanCounter
+from utils.ipc import ipc
+from utils.sampler import sampler
+from utils.unfurler import unfurler
 from utils.views import StealEmojiView
 
 verification_levels = {
@@ -55,107 +59,22 @@ nsfw_levels = {
     discord.NSFWLevel.age_restricted: "Guild *may* contain NSFW content",
 }
 
-
-async def unfurl_invite_url(url: str) -> Union[Tuple[str, re.Match], Tuple[None, None]]:
-    from bot.client import bot
-
-    # bot.console.log(f"(UNFURLER) Preparing to unfurl {url}")
-    # Dear maintainers,
-    # This dictionary is designed to fully automate and streamline the gathering of scraped data.
-    # If it has to have its own function, define it in a lambda. If you cannot do that, the service cannot be used.
-    # Make sure that:
-    # * The `domain` regex returns a URl that can be parsed.
-    # * The `invites.server` regex has a `url` group in it that returns the invite URL
-    # * The `invites.bot` regex has a `client_id` group in it that returns the client ID
-    # * The `invites.server` regex returns a discord(app).gg|com URL
-    # * Do not include an invite type in the `invites` dictionary if that domain does not support that type of invite.
-    # * `query_tags.names` is as minimal as possible. The more we search, the more performance hit we take.
-    # * `query_tags.max_search` is also as minimal as can be, if not exact. Again, fewer iterations = more performance
-
-    s_r = r"(?:https?://)?discord(app)?\.(com|gg)(/invite)?/.{5,16}"
-    b_r = r"(?:https?://)?discord.com/oauth2/authorize\?.*(?P<client_id>client_id=\d+).*"
-    regexes = (
-        {
-            "domain": re.compile(r"(https?://)?dsc.(gg|lol)/.+"),
-            "invites": {
-                "server": re.compile(r"window\.location\.href(\s)?=(\s)?\"(?P<url>%s)\"" % s_r),
-                "bot": re.compile(r"window\.location\.href\s?=\s?\"(?P<url>%s)\"" % b_r),
-            },
-            "query_tags": {"names": ("script",), "max_search": 3},
-        },
-        {
-            "domain": re.compile(r"(https?://)?invite.gg/.+"),
-            "invites": {"server": re.compile(r"href=([\"'])(?P<url>%s)([\"'])" % s_r)},
-            "query_tags": {"names": ("a",), "max_search": 2},
-        },
-        {
-            "domain": re.compile(r"(https?://)?bit.ly/.+"),
-            "trust_status": (301, 302, 307, 308),
-            "invites": {"server": re.compile(s_r), "bot": re.compile(b_r)},
-            "query_tags": {
-                # backup
-                "names": ("a",),
-                "max_search": 3,  # there's only one A tag there
-            },
-        },
-    )
-
-    def qualify(unsanitary_url: str) -> str:
-        return urlparse(unsanitary_url, "https").geturl()
-
-    url = qualify(url)
-
-    if re.compile(b_r).match(url):
-        return "bot", re.compile(b_r).match(url)  # lazy
-
-    if re.compile(s_r).match(url):
-        return "server", re.compile(s_r).match(url)
-
-    try:
-        _invite = await bot.fetch_invite(url)
-    except discord.HTTPException:
-        pass
-    else:
-        return "server", _invite.url
-
-    for entry in regexes:
-        if entry["domain"].match(url):
-            trusted_statuses = entry.get("trust_status", None)
-            if trusted_statuses is not None:
-                try:
-                    bot.console.log(f"(UNFURLER) HEAD {url!r}")
-                    head: httpx.Response = await utils.session.head(url, follow_redirects=True)
-                except httpx.HTTPError:
-                    raise
-                else:
-                    if head.status_code in trusted_statuses and head.headers.get("Location") is not None:
-                        location = qualify(head.headers["Location"])
-                        for invite_type, invite_regex in entry["invites"].items():
-                            if _m := invite_regex.match(location):
-                                return invite_type, _m
-
-            try:
-                get: httpx.Response = await utils.session.get(url, follow_redirects=True)
-                get.raise_for_status()
-            except httpx.HTTPError:
-                raise
-            else:
-                soup = await utils.run_blocking(BeautifulSoup, get.text, features="html.parser")
-                # noinspection PyTypeChecker
-                for tag_name in entry["query_tags"]["names"]:
-                    found_tags = soup.html.find_all(tag_name)
-                    for tag in found_tags[: entry["query_tags"]["max_search"]]:
-                        tag: bs4.Tag
-                        for invite_type, invite_regex in entry["invites"].items():
-                            location = tag.get_text(strip=True)
-                            if _m := invite_regex.match(location):
-                                return invite_type, _m
-    return None, None
+# How long (in seconds) each slow section of the server info embed can take before it's shown as timed out.
+SERVER_INFO_TIMEOUTS = {"invites": 10, "automod_rules": 10, "webhooks": 10, "bans": 30}
 
 
 class Info(commands.Cog):
     def __init__(self, bot: Bot):
         self.bot: Bot = bot
+        self.ban_counts = BanCounter(ceiling=int(bot.get_config_value("ban_count_ceiling", default=100_000)))
+
+    @commands.Cog.listener()
+    async def on_member_ban(self, guild: discord.Guild, _):
+        self.ban_counts.invalidate(guild.id)
+
+    @commands.Cog.listener()
+    async def on_member_unban(self, guild: discord.Guild, _):
+        self.ban_counts.invalidate(guild.id)
 
     def get_user_data(self, user: Union[discord.User, discord.Member], guild: discord.Guild = None) -> List[str]:
         truth_table = {True: "\N{white heavy check mark}", False: "\N{cross mark}"}
@@ -201,10 +120,12 @@ class Info(commands.Cog):
 
     async def get_server_data(
         self, ctx: Union[discord.ApplicationContext, commands.Context], guild: discord.Guild = None
-    ) -> discord.Embed:
+    ) -> AsyncIterator[discord.Embed]:
+        """
+        Yields the server info embed. The first embed is yielded straight away, with placeholders for the sections
+        that need an API call. Those calls run concurrently, and the embed is yielded again as each one finishes.
+        """
         guild = guild or ctx.guild
-        filter_level_name = content_filter_names[guild.explicit_content_filter]
-        filter_level_description = content_filters[guild.explicit_content_filter]
         system_channel_flags = []
         if guild.system_channel:
             _flag_items = {
@@ -217,31 +138,70 @@ class Info(commands.Cog):
                 if getattr(guild.system_channel_flags, flag) is True:
                     system_channel_flags.append(name)
 
-        automod_rules = "Missing 'manage server' permission."
-        if guild.me.guild_permissions.manage_guild:
-            invites = len(await guild.invites())
+        async def count(coro: Awaitable[list]) -> str:
+            return f"{len(await coro):,}"
+
+        permissions = guild.me.guild_permissions
+        sections = {
+            "invites": "Missing 'manage server' permission.",
+            "automod_rules": "Missing 'manage server' permission.",
+            "webhooks": "Missing 'manage webhooks' permission.",
+            "bans": "Missing 'ban members' permission.",
+        }
+        fetches = {}
+        if permissions.manage_guild:
+            fetches["invites"] = count(guild.invites())
             if "AUTO_MODERATION" in guild.features:
-                automod_rules = len(await guild.fetch_auto_moderation_rules())
-        else:
-            invites = "Missing 'manage server' permission."
-
-        if guild.me.guild_permissions.manage_webhooks:
-            webhooks = len(await guild.webhooks())
-        else:
-            webhooks = "Missing 'manage webhooks' permission."
+                fetches["automod_rules"] = count(guild.fetch_auto_moderation_rules())
+            else:
+                sections["automod_rules"] = "Not enabled."
+        if permissions.manage_webhooks:
+            fetches["webhooks"] = count(guild.webhooks())
+        if permissions.ban_members:
+            fetches["bans"] = self.count_bans(guild)
+
+        async def fetch(name: str, coro: Awaitable[str]) -> str:
+            # Each section degrades on its own, so one slow or failing endpoint can't hold up the others.
+            try:
+                return await asyncio.wait_for(coro, SERVER_INFO_TIMEOUTS.get(name, 10))
+            except asyncio.TimeoutError:
+                return "Timed out."
+            except discord.HTTPException as e:
+                return "Failed to load (HTTP %d)." % e.status
 
-        if guild.me.guild_permissions.ban_members:
-            bans = f"{len(await guild.bans().flatten()):,}"
-        else:
-            bans = "Missing 'ban members' permission."
+        tasks = {}
+        for name, coro in fetches.items():
+            sections[name] = "Loading..."
+            tasks[asyncio.create_task(fetch(name, coro))] = name
 
+        try:
+            yield self.render_server_data(ctx, guild, sections, system_channel_flags)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    sections[tasks[task]] = task.result()
+                yield self.render_server_data(ctx, guild, sections, system_channel_flags)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def count_bans(self, guild: discord.Guild) -> str:
+        return self.ban_counts.format(*await self.ban_counts.get(guild))
+
+    def render_server_data(
+        self,
+        ctx: Union[discord.ApplicationContext, commands.Context],
+        guild: discord.Guild,
+        sections: Dict[str, str],
+        system_channel_flags: List[str],
+    ) -> discord.Embed:
+        filter_level_name = content_filter_names[guild.explicit_content_filter]
+        filter_level_description = content_filters[guild.explicit_content_filter]
         discovery_splash = "No discovery splash"
         if guild.discovery_splash:
             discovery_splash = self.hyperlink(guild.discovery_splash.url)
 
-        if guild.owner is None:
-            await guild.query_members(user_ids=[guild.owner_id], cache=True)
-
         if len(guild.members) == guild.member_count:
             humans = len([x for x in guild.members if not x.bot])
             bots = len([x for x in guild.members if x.bot])
@@ -256,7 +216,7 @@ class Info(commands.Cog):
             f"**Banner URL**: {self.hyperlink(guild.banner.url)}" if guild.banner else None,
             f"**Splash URL**: {self.hyperlink(guild.splash.url)}" if guild.splash else None,
             f"**Discovery Splash URL**: {discovery_splash}",
-            f"**Owner**: {guild.owner.mention}",
+            f"**Owner**: <@{guild.owner_id}>",
             f"**Created**: {discord.utils.format_dt(guild.created_at, 'R')}",
             f"**Locale**: {guild.preferred_locale}",
             f"**NSFW Level**: {nsfw_levels[guild.nsfw_level]}",
@@ -275,11 +235,11 @@ class Info(commands.Cog):
             f"**Boost Level**: {guild.premium_tier}",
             f"**Boost Count**: {guild.premium_subscription_count:,}",  # if a guild has over 1k boosts im sad
             f"**Boost Progress Bar Enabled?** {utils.Emojis.bool(guild.premium_progress_bar_enabled)}",
-            f"**Invites**: {invites}",
+            f"**Invites**: {sections['invites']}",
             f"**Invites Paused?** {utils.Emojis.bool('INVITES_DISABLED' in guild.features)}",
-            f"**Webhooks**: {webhooks}",
-            f"**Bans**: {bans}",
-            f"**AutoModeration Rules:** {automod_rules}",
+            f"**Webhooks**: {sections['webhooks']}",
+            f"**Bans**: {sections['bans']}",
+            f"**AutoModeration Rules:** {sections['automod_rules']}",
             f"**Categories**: {len(guild.categories)}",
             f"**Text Channels**: {len(guild.text_channels)}",
             f"**Voice Channels**: {len(guild.voice_channels)}",
@@ -428,6 +388,7 @@ class Info(commands.Cog):
                     ("python3", "-m", "pipx", "runpip", "spanner", "list", "--format=json"),
                     capture_output=True,
                     encoding="utf-8",
+                    pool="io",
                 )
                 stdout = proc.stdout.strip()
                 if "not found" in stdout or not stdout:
@@ -452,7 +413,11 @@ class Info(commands.Cog):
 
             except FileNotFoundError:
                 proc = await utils.run_blocking(
-                    subprocess.run, ("git", "rev-parse", "--short", "HEAD"), capture_output=True, encoding="utf-8"
+                    subprocess.run,
+                    ("git", "rev-parse", "--short", "HEAD"),
+                    capture_output=True,
+                    encoding="utf-8",
+                    pool="io",
                 )
                 spanner_version = proc.stdout.strip()
 
@@ -462,46 +427,25 @@ class Info(commands.Cog):
             if platform.system().lower() == "windows":
                 os_version = f"{platform.system()} {platform.release()}"
             else:  # linux
-                with open("/etc/os-release") as release_file:
-                    version_name = "Linux"
-                    version_id = "0 (unknown)"
-                    for line in release_file.readlines():
-                        if line.startswith("NAME="):
-                            version_name = line.split("=")[1].strip().strip('"')
-                        elif line.startswith("VERSION="):
-                            version_id = line.split("=")[1].strip().strip('"')
-
-                    version_string = "%s %s" % (version_name, version_id)
-
-                    kernel_version = await utils.run_blocking(
-                        subprocess.run, ("uname", "-r"), capture_output=True, encoding="utf-8", check=True
-                    )
-                    version_string += ", kernel version `%s`" % kernel_version.stdout.strip()
-                    os_version = version_string
+                # Reading files blocks, so it's done in a thread to keep the event loop (and heartbeats) running.
+                release_lines = (await utils.run_blocking(Path("/etc/os-release").read_text, pool="io")).splitlines()
+                version_name = "Linux"
+                version_id = "0 (unknown)"
+                for line in release_lines:
+                    if line.startswith("NAME="):
+                        version_name = line.split("=")[1].strip().strip('"')
+                    elif line.startswith("VERSION="):
+                        version_id = line.split("=")[1].strip().strip('"')
+
+                version_string = "%s %s" % (version_name, version_id)
+
+                kernel_version = await utils.run_blocking(
+                    subprocess.run, ("uname", "-r"), capture_output=True, encoding="utf-8", check=True, pool="io"
+                )
+                version_string += ", kernel version `%s`" % kernel_version.stdout.strip()
+                os_version = version_string
             return os_version
 
-        ram_used = system_ram_used = system_ram_total = cpu_percent = system_cpu = 0.0
-        per_cpu = [0.0] * os.cpu_count()
-        disk_usage = (0.0, 1.0)
-        proc_id = 0
-        try:
-            import psutil
-        except ImportError:
-            psutil = None
-        else:
-            system_cpu = await utils.run_blocking(psutil.cpu_percent, 1)
-            per_cpu = [round(x, 1) for x in await utils.run_blocking(psutil.cpu_percent, 1, True)]
-            system_ram = await utils.run_blocking(psutil.virtual_memory)
-            system_ram_used = system_ram.used
-            system_ram_total = system_ram.total
-            process = psutil.Process()
-            with process.oneshot():
-                cpu_percent = await utils.run_blocking(process.cpu_percent, 1)
-                _mem_info = await utils.run_blocking(process.memory_full_info)
-                ram_used = _mem_info.uss
-                proc_id = process.pid
-            disk_usage = psutil.disk_usage(Path(__file__).drive or "/")
-
         appinfo = await self.bot.application_info()
         embed = discord.Embed(
             title="My Information:",
@@ -522,11 +466,11 @@ class Info(commands.Cog):
             )
         yield embed.copy()
 
-        latency = round(self.bot.latency * 1000, 2)
+        latency = utils.format_latency(self.bot.latency)
         sys_started = discord.utils.utcnow() - datetime.timedelta(seconds=time.monotonic())
         embed.add_field(
             name="Timing information",
-            value=f"WebSocket Latency (ping): {latency}ms\n"
+            value=f"WebSocket Latency (ping): {latency}\n"
                   f"Bot Started: {discord.utils.format_dt(self.bot.started_at, 'R')}\n"
                   f"System Started: {discord.utils.format_dt(sys_started, 'R')}\n"
                   f"Bot Last Connected: {discord.utils.format_dt(self.bot.last_logged_in, 'R')}\n"
@@ -535,7 +479,7 @@ class Info(commands.Cog):
         yield embed.copy()
 
         embed.add_field(
-            name="Cache & stats info",
+            name="Cache & stats info" + (f" (cluster {ipc.cluster_id})" if ipc.connected else ""),
             value=f"Cached Users: {len(self.bot.users):,}\n"
                   f"Guilds: {len(self.bot.guilds):,}\n"
                   f"Total Channels: {len(tuple(self.bot.get_all_channels())):,}\n"
@@ -543,6 +487,31 @@ class Info(commands.Cog):
                   f"Cached Messages: {len(self.bot.cached_messages):,}",
             inline=False,
         )
+        if ipc.connected:
+            results = await ipc.request_all("stats", timeout=5)
+            responded = [result for result in results.values() if not isinstance(result, Exception)]
+            totals = collections.Counter()
+            for result in responded:
+                result.pop("worst_latency", None)
+                totals.update(result)
+            embed.add_field(
+                name=f"Cluster totals ({len(responded)}/{len(results)} clusters responded)",
+                value=f"Cached Users: {totals['users']:,}\n"
+                      f"Guilds: {totals['guilds']:,}\n"
+                      f"Total Channels: {totals['channels']:,}\n"
+                      f"Total Emojis: {totals['emojis']:,}\n"
+                      f"Cached Messages: {totals['messages']:,}\n"
+                      f"Shards: {totals['shards']:,}\n"
+                      f"Errors since startup: {totals['errors']:,}",
+                inline=False,
+            )
+        shards = self.bot.shard_info()
+        if len(shards) > 1:
+            lines = [
+                f"Shard {shard_id}: {utils.format_latency(latency)}, {guild_count:,} guilds"
+                for shard_id, (latency, guild_count) in shards.items()
+            ]
+            embed.add_field(name=f"Shards ({len(shards)}/{self.bot.shard_count})", value="\n".join(lines)[:1024])
         yield embed.copy()
 
         _v = await get_spanner_version()
@@ -558,20 +527,24 @@ class Info(commands.Cog):
         )
         yield embed.copy()
 
-        if psutil:
+        sample = sampler.latest()
+        if sample is not None:
+            sampled_at = datetime.datetime.fromtimestamp(sample.timestamp, datetime.timezone.utc)
             b = os.name != "nt"
-            disk_used_nice = humanize.naturalsize(disk_usage.used, binary=b)
-            disk_total_nice = humanize.naturalsize(disk_usage.total, binary=b)
-            proc_mem = humanize.naturalsize(ram_used, binary=b)
-            sys_mem_u = humanize.naturalsize(system_ram_used, binary=b)
-            sys_mem_t = humanize.naturalsize(system_ram_total, binary=b)
+            disk_used_nice = humanize.naturalsize(sample.disk_used, binary=b)
+            disk_total_nice = humanize.naturalsize(sample.disk_total, binary=b)
+            proc_mem = humanize.naturalsize(sample.ram_process, binary=b)
+            sys_mem_u = humanize.naturalsize(sample.ram_used, binary=b)
+            sys_mem_t = humanize.naturalsize(sample.ram_total, binary=b)
             embed.add_field(
                 name="System Stats",
-                value=f"CPU Usage: {system_cpu}% ({cpu_percent}% for this process, per-core: "
-                      f"{' '.join(map(lambda p: f'{p}%', per_cpu))})\n"
+                value=f"CPU Usage: {sample.cpu_total}% ({sample.cpu_process}% for this process, per-core: "
+                      f"{' '.join(map(lambda p: f'{round(p, 1)}%', sample.cpu_per_core))})\n"
                       f"RAM Usage: {sys_mem_u}/{sys_mem_t} ({proc_mem} for this process)\n"
                       f"Disk Usage: {disk_used_nice}/{disk_total_nice}\n"
-                      f"Process ID: {proc_id}",
+                      f"Threads: {sample.threads}\n"
+                      f"Process ID: {os.getpid()}\n"
+                      f"Sampled {discord.utils.format_dt(sampled_at, 'R')}",
                 inline=False,
             )
             yield embed.copy()
@@ -923,7 +896,7 @@ class Info(commands.Cog):
         await ctx.defer(ephemeral=True)
         # self.bot.console.log(invite)
         try:
-            invite_matches = await unfurl_invite_url(invite)
+            unfurled = await unfurler.unfurl(invite)
         except httpx.HTTPError as e:
             return await ctx.respond(str(e) + ".", ephemeral=True)
         except (KeyError, ValueError, TypeError):
@@ -935,12 +908,9 @@ class Info(commands.Cog):
             else:
                 invite: discord.Invite = converted
         else:
-            self.bot.console.log(invite_matches)
-            if all(v is not None for v in invite_matches) and invite_matches[0] == "bot":
-                self.bot.console.log()
-                client_id = int(invite_matches[1].group("client_id").split("=")[-1])
+            if unfurled.kind == "bot":
                 try:
-                    user: discord.User = await self.bot.get_or_fetch_user(client_id)
+                    user: discord.User = await self.bot.get_or_fetch_user(unfurled.client_id)
                 except discord.HTTPException as e:
                     return await ctx.respond(f"Failed to resolve invite data: {e}", ephemeral=True)
                 else:
@@ -951,7 +921,7 @@ class Info(commands.Cog):
                     embed.set_thumbnail(url=user.display_avatar.url)
                     return await ctx.respond(embed=embed, ephemeral=True)
 
-            invite: str = invite_matches[-1].group("url") if invite_matches[-1] == "server" else invite
+            invite: str = unfurled.url if unfurled.kind == "server" else invite
 
             try:
                 invite: discord.Invite = await self.bot.fetch_invite(invite)
@@ -1020,8 +990,12 @@ class Info(commands.Cog):
             return await ctx.respond("This command can only be used in a server.")
 
         await ctx.defer()
-        embed = await self.get_server_data(ctx)
-        return await ctx.respond(embed=embed)
+        message = None
+        async for embed in self.get_server_data(ctx):
+            if message is None:
+                message = await ctx.respond(embed=embed)
+            else:
+                await message.edit(embed=embed)
 
     @commands.command(name="server-info")
     @commands.is_owner()
@@ -1036,9 +1010,12 @@ class Info(commands.Cog):
                     guild = g
                     break
 
-        async with ctx.typing():
-            embed = await self.get_server_data(ctx, guild)
-        return await ctx.reply(embed=embed)
+        message = None
+        async for embed in self.get_server_data(ctx, guild):
+            if message is None:
+                message = await ctx.reply(embed=embed)
+            else:
+                await message.edit(embed=embed)
 
     @commands.slash_command(name="emoji-info")
     async def emoji_info(self, ctx: discord.ApplicationContext, emoji: str):
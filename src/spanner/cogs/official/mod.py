@@ -1,15 +1,24 @@
 import datetime
 import re
+import tempfile
 import textwrap
-from typing import Optional, List
+import uuid
+from typing import Dict, List, Optional, Tuple
 
 import discord
+import httpx
 from discord import SlashCommandGroup
-from discord.ext import commands, pages
+from discord.ext import commands
+from humanize import naturalsize
 
-from database import Cases, CaseType, Guild, NoMatch
-from utils import utils
-from utils.views import YesNoPrompt
+from database import Cases, CaseType, Guild, NoMatch, case_ids, case_index, transfer
+from utils import mass_actions, utils
+from utils.debounce import Debouncer
+from utils.views import LazyPaginator, YesNoPrompt
+
+
+MAX_MASS_TARGETS = 1000
+MAX_ID_FILE_SIZE = 1024 * 1024
 
 
 class PermissionsError(commands.CommandError):
@@ -20,11 +29,65 @@ class PermissionsError(commands.CommandError):
         return self.reason
 
 
-async def case_id_autocomplete(ctx: discord.AutocompleteContext):
+class CaseListing:
+    """
+    Fetches a guild's cases (optionally only those against one user) a page at a time, newest first.
+
+    Pages next to one that has already been fetched are found by case number (keyset pagination), which is just as
+    fast however deep into the list they are. The last page is fetched from the other end. Only pages that can't be
+    reached either way fall back to an offset.
+    """
+
+    def __init__(self, guild: Guild, per_page: int, *, target: Optional[int] = None):
+        self.per_page = per_page
+        self.filters = {"guild": guild} if target is None else {"guild": guild, "target": target}
+        self.total: Optional[int] = None
+        self._bounds: Dict[int, Tuple[int, int]] = {}  # page number -> (newest, oldest) case number on it
+
+    @property
+    def page_count(self) -> int:
+        return -(-self.total // self.per_page)
+
+    async def count(self) -> int:
+        self.total = await Cases.objects.filter(**self.filters).count()
+        return self.total
+
+    async def fetch(self, page: int) -> List[Cases]:
+        query = Cases.objects.filter(**self.filters)
+        if page - 1 in self._bounds:
+            cases = await query.filter(id__lt=self._bounds[page - 1][1]).order_by("-id").limit(self.per_page).all()
+        elif page + 1 in self._bounds:
+            cases = await query.filter(id__gt=self._bounds[page + 1][0]).order_by("id").limit(self.per_page).all()
+            cases.reverse()
+        elif self.total is not None and page == self.page_count - 1:
+            cases = await query.order_by("id").limit(self.total - page * self.per_page).all()
+            cases.reverse()
+        else:
+            cases = await query.order_by("-id").offset(page * self.per_page).limit(self.per_page).all()
+        if cases:
+            self._bounds[page] = (cases[0].id, cases[-1].id)
+        return cases
+
+
+autocomplete_debouncer = Debouncer()
+
+
+async def case_id_autocomplete(ctx: discord.AutocompleteContext) -> List[str]:
     if not ctx.interaction.guild_id:
-        return
-    cases: List[Cases] = await Cases.objects.filter(guild__id=ctx.interaction.guild_id).limit(20).order_by("-id").all()
-    return [f"(#{case.id}) {str(case.entry_id).upper()}" for case in cases]
+        return []
+    # Keystrokes from the same user are answered together, with the results for the newest one.
+    cases = await autocomplete_debouncer.run(
+        (ctx.interaction.guild_id, ctx.interaction.user.id),
+        case_index.search,
+        ctx.interaction.guild_id,
+        str(ctx.value or ""),
+    )
+    return [
+        textwrap.shorten(
+            f"(#{case.id}) {utils.case_type_names[case.type.value].title()}: {case.reason}", 100, placeholder="..."
+        )
+        for case in cases
+    ]
 
 
 class Moderation(commands.Cog):
@@ -37,10 +100,51 @@ class Moderation(commands.Cog):
 
     @staticmethod
     async def get_next_case_id(guild: Guild) -> int:
-        last_case = await Cases.objects.filter(guild=guild).order_by("-id").limit(2).first()
-        if not last_case:
-            return 1
-        return last_case.id + 1
+        return await case_ids.next(guild.id)
+
+    async def create_case(self, guild: Guild, **kwargs) -> Cases:
+        """Records a case under the guild's next case number."""
+        case = await Cases.objects.create(id=await self.get_next_case_id(guild), guild=guild, **kwargs)
+        case_index.add(guild.id, case)
+        return case
+
+    async def create_cases(self, guild: Guild, targets: List[int], **kwargs) -> List[Cases]:
+        """
+        Records a case against each target under a block of the guild's next case numbers. The numbers are allocated in
+        the same transaction, so they aren't used up if the cases can't be inserted.
+        """
+        now = discord.utils.utcnow()
+        async with Cases.database.transaction():
+            numbers = await case_ids.allocate(guild.id, len(targets))
+            cases = [
+                Cases(
+                    entry_id=uuid.uuid4(),
+                    id=number,
+                    guild=guild,
+                    target=target,
+                    created_at=now,
+                    expire_at=None,
+                    **kwargs,
+                )
+                for number, target in zip(numbers, targets)
+            ]
+            rows = [{**{name: getattr(case, name) for name in Cases.fields}, "guild": guild.entry_id} for case in cases]
+            for start in range(0, len(rows), transfer.INSERT_ROWS):
+                await Cases.database.execute(Cases.table.insert().values(rows[start : start + transfer.INSERT_ROWS]))
+        for case in cases:
+            case_index.add(guild.id, case)
+        return cases
+
+    @staticmethod
+    async def delete_case_record(guild: Guild, case: Cases) -> None:
+        await case.delete()
+        case_index.discard(guild.id, case.id)
+
+    @staticmethod
+    def parse_case_id(value: str) -> Optional[int]:
+        """Gets the case number from an autocomplete choice ("(#12) Ban: ..."), or from a typed "#12" or "12"."""
+        if match := re.match(r"\s*\(?#?(\d+)", value):
+            return int(match.group(1))
 
     @staticmethod
     @discord.utils.deprecated("commands.[bot]_has_permissions and check_hierarchy")
@@ -159,9 +263,8 @@ class Moderation(commands.Cog):
         await ctx.defer(ephemeral=True)
 
         guild = await utils.get_guild_config(ctx.guild)
-        case = await Cases.objects.create(
-            id=await self.get_next_case_id(guild),
-            guild=guild,
+        case = await self.create_case(
+            guild,
             moderator=ctx.user.id,
             target=member.id,
             reason=reason,
@@ -218,10 +321,9 @@ class Moderation(commands.Cog):
         if not view.confirm:
             return await ctx.respond("Hackban cancelled.", ephemeral=True, view=None, embed=None)
 
-        guild = await Guild.objects.get(id=ctx.guild.id)
-        case = await Cases.objects.create(
-            id=await self.get_next_case_id(guild),
-            guild=guild,
+        guild = await utils.get_guild_config(ctx.guild)
+        case = await self.create_case(
+            guild,
             moderator=ctx.user.id,
             target=user.id,
             reason=reason,
@@ -233,10 +335,10 @@ class Moderation(commands.Cog):
         try:
             await ctx.guild.ban(user, reason=f"Case#{case.entry_id!s}| " + reason, delete_message_seconds=7*86400)
         except discord.HTTPException as e:
-            await case.delete()
+            await self.delete_case_record(guild, case)
             return await ctx.edit(content="Failed to ban user: {!s}".format(e), embed=None, view=None)
         except Exception:
-            await case.delete()
+            await self.delete_case_record(guild, case)
             raise
         else:
             return await ctx.edit(
@@ -278,9 +380,8 @@ class Moderation(commands.Cog):
             if not view.confirm:
                 return await ctx.edit(content="Did not unban %s." % ban.user, embed=None, view=None)
             else:
-                case = await Cases.objects.create(
-                    id=await self.get_next_case_id(guild),
-                    guild=guild,
+                case = await self.create_case(
+                    guild,
                     moderator=ctx.user.id,
                     target=ban.user.id,
                     reason=reason,
@@ -331,10 +432,9 @@ class Moderation(commands.Cog):
             if not view.confirm:
                 return await ctx.edit(content="Ban cancelled.", embed=None, view=None)
 
-            guild = await Guild.objects.get(id=ctx.guild.id)
-            case = await Cases.objects.create(
-                id=await self.get_next_case_id(guild),
-                guild=guild,
+            guild = await utils.get_guild_config(ctx.guild)
+            case = await self.create_case(
+                guild,
                 moderator=ctx.user.id,
                 target=member.id,
                 reason=reason,
@@ -346,10 +446,10 @@ class Moderation(commands.Cog):
             try:
                 await member.ban(reason=f"Case#{case.entry_id!s}| " + reason, delete_message_seconds=delete_messages * 86400)
             except discord.HTTPException as e:
-                await case.delete()
+                await self.delete_case_record(guild, case)
                 return await ctx.edit(content="Failed to ban user: {!s}".format(e), embed=None, view=None)
             except Exception:
-                await case.delete()
+                await self.delete_case_record(guild, case)
                 raise
             else:
                 return await ctx.edit(
@@ -382,10 +482,9 @@ class Moderation(commands.Cog):
         if not view.confirm:
             return await ctx.edit(content="Kick cancelled.", embed=None, view=None)
 
-        guild = await Guild.objects.get(id=ctx.guild.id)
-        case = await Cases.objects.create(
-            id=await self.get_next_case_id(guild),
-            guild=guild,
+        guild = await utils.get_guild_config(ctx.guild)
+        case = await self.create_case(
+            guild,
             moderator=ctx.user.id,
             target=member.id,
             reason=reason,
@@ -395,10 +494,10 @@ class Moderation(commands.Cog):
         try:
             await member.kick(reason=f"Case#{case.entry_id!s}| " + reason)
         except discord.HTTPException as e:
-            await case.delete()
+            await self.delete_case_record(guild, case)
             return await ctx.edit(content="Failed to kick user: {!s}".format(e), embed=None)
         except Exception:
-            await case.delete()
+            await self.delete_case_record(guild, case)
             raise
         else:
             await self.log_case(ctx, case)
@@ -406,6 +505,186 @@ class Moderation(commands.Cog):
                 content="User {!s} has been kicked.\nCase ID: {!s}".format(member, case.id), embed=None, view=None
             )
 
+    @staticmethod
+    async def get_mass_targets(
+        ctx: discord.ApplicationContext,
+        users: Optional[str],
+        file: Optional[discord.Attachment],
+        joined_within: Optional[str],
+    ) -> List[int]:
+        """
+        Gets the user IDs a mass action was given, in the order they were given.
+
+        Raises:
+            ValueError: None were given, or one of the options was invalid. The message can be shown to the user.
+        """
+        user_ids = mass_actions.parse_user_ids(users or "")
+        if file is not None:
+            if file.size > MAX_ID_FILE_SIZE:
+                raise ValueError(f"That file is too big. It can be at most {naturalsize(MAX_ID_FILE_SIZE)}.")
+            user_ids += mass_actions.parse_user_ids((await file.read()).decode("utf-8", "replace"))
+        if joined_within is not None:
+            try:
+                seconds = utils.parse_time(joined_within)
+            except ValueError:
+                raise ValueError("Invalid join window. Try something like `10m` or `1h30m`.")
+            user_ids += [member.id for member in await mass_actions.members_joined_within(ctx.guild, seconds)]
+        if not user_ids:
+            raise ValueError("You must give a list of users, a file of user IDs or a join window.")
+        return list(dict.fromkeys(user_ids))
+
+    @staticmethod
+    def generate_mass_action_log_embed(
+        ctx: discord.ApplicationContext, cases: List[Cases], failed: int, reason: str
+    ) -> discord.Embed:
+        case_type = cases[0].type.name.replace("_", "-")
+        embed = discord.Embed(
+            title=f"Cases #{cases[0].id}-#{cases[-1].id} - Mass {case_type.title()}",
+            description=f"**Moderator**: {ctx.author.mention} (`{ctx.author.id}`)\n"
+            f"**Targets**: {len(cases):,}\n"
+            f"**Failed**: {failed:,}\n"
+            f"**Created**: {discord.utils.format_dt(discord.utils.utcnow(), 'R')}\n"
+            f"**Type**: {case_type.lower()}",
+            colour=discord.Colour.blurple(),
+            timestamp=discord.utils.utcnow(),
+        )
+        embed.set_author(name=ctx.author, icon_url=(ctx.author.avatar or ctx.author.default_avatar).url)
+        embed.add_field(name="Reason:", value=textwrap.shorten(reason, 1024, placeholder="..."), inline=False)
+
+        mentions = []
+        length = 0
+        for case in cases:
+            mention = f"<@{case.target}>"
+            if length + len(mention) + 1 > 1000:
+                mentions.append(f"and {len(cases) - len(mentions):,} more")
+                break
+            mentions.append(mention)
+            length += len(mention) + 1
+        embed.add_field(name="Targets:", value=" ".join(mentions), inline=False)
+        return embed
+
+    async def run_mass_action(
+        self,
+        ctx: discord.ApplicationContext,
+        case_type: CaseType,
+        users: Optional[str],
+        file: Optional[discord.Attachment],
+        joined_within: Optional[str],
+        reason: str,
+        delete_messages: int = 0,
+    ):
+        verb, doing, done = ("ban", "Banning", "Banned") if case_type == CaseType.BAN else ("kick", "Kicking", "Kicked")
+        await ctx.defer(ephemeral=True)
+        try:
+            user_ids = await self.get_mass_targets(ctx, users, file, joined_within)
+        except ValueError as e:
+            return await ctx.respond(str(e), ephemeral=True)
+
+        if not ctx.guild.chunked:
+            await ctx.guild.chunk()  # so that every member given is checked against the role hierarchy
+        targets = []
+        skipped = 0
+        for user_id in user_ids:
+            member = ctx.guild.get_member(user_id)
+            if user_id in (ctx.author.id, ctx.guild.owner_id, self.bot.user.id):
+                skipped += 1
+            elif member is None and case_type == CaseType.KICK:
+                skipped += 1  # not in the server
+            elif member is not None and not (
+                self.check_hierarchy(ctx.author, member, cannot_be_equal=True)
+                and self.check_hierarchy(ctx.guild.me, member, cannot_be_equal=True)
+            ):
+                skipped += 1
+            else:
+                targets.append(member or discord.Object(id=user_id))
+        if not targets:
+            return await ctx.respond(f"There is no one there that you can {verb}.", ephemeral=True)
+        if len(targets) > MAX_MASS_TARGETS:
+            return await ctx.respond(f"You can only {verb} up to {MAX_MASS_TARGETS:,} users at once.", ephemeral=True)
+
+        embed = discord.Embed(
+            title=f"Are you sure you want to {verb} {len(targets):,} users?",
+            description=textwrap.shorten(" ".join(f"<@{target.id}>" for target in targets), 4000, placeholder="..."),
+            colour=discord.Colour.orange(),
+        )
+        if skipped:
+            embed.set_footer(text=f"{skipped:,} users were skipped, as you can't {verb} them.")
+        view = YesNoPrompt(ctx.interaction, timeout=300.0)
+        await ctx.respond(embed=embed, view=view, ephemeral=True)
+        await view.wait()
+        if not view.confirm:
+            return await ctx.edit(content=f"Mass {verb} cancelled.", embed=None, view=None)
+        await ctx.edit(content=f"{doing} {len(targets):,} users...", embed=None, view=None)
+
+        audit_reason = f"Mass {verb} by {ctx.author}| " + reason
+        if case_type == CaseType.BAN:
+            result = await mass_actions.mass_ban(
+                ctx.guild,
+                [target.id for target in targets],
+                reason=audit_reason,
+                delete_message_seconds=delete_messages * 86400,
+            )
+        else:
+            result = await mass_actions.mass_kick(targets, reason=audit_reason)
+        if not result.succeeded:
+            if result.error is not None:
+                return await ctx.edit(content=f"Failed to {verb} users: {result.error}")
+            return await ctx.edit(content=f"Failed to {verb} any of those users.")
+
+        guild = await utils.get_guild_config(ctx.guild)
+        cases = await self.create_cases(guild, result.succeeded, moderator=ctx.user.id, reason=reason, type=case_type)
+        await self.log_event(guild, embed=self.generate_mass_action_log_embed(ctx, cases, len(result.failed), reason))
+
+        content = f"{done} {len(cases):,} users.\n"
+        content += f"Case IDs: {cases[0].id}-{cases[-1].id}"
+        if result.failed:
+            content += f"\nFailed to {verb} {len(result.failed):,} users."
+        if result.error is not None:
+            content += f"\nStopped early: {result.error}"
+        return await ctx.edit(content=content)
+
+    @commands.slash_command(name="mass-ban")
+    @discord.default_permissions(ban_members=True)
+    @commands.has_permissions(ban_members=True)
+    @commands.bot_has_permissions(ban_members=True)
+    async def mass_ban(
+        self,
+        ctx: discord.ApplicationContext,
+        users: discord.Option(str, description="The IDs or mentions of the users to ban.", default=None),
+        file: discord.Option(discord.Attachment, description="A text file of user IDs to ban.", default=None),
+        joined_within: discord.Option(
+            str, description="Ban everyone that joined within this long ago, e.g. 10m.", default=None
+        ),
+        delete_messages: discord.Option(
+            int,
+            description="How many days of their recent messages to delete",
+            default=7,
+            min_value=0,
+            max_value=7,
+            autocomplete=discord.utils.basic_autocomplete([0, 1, 2, 3, 4, 5, 6, 7]),
+        ),
+        reason: discord.Option(str, description="The reason for the bans.", default="No Reason Provided."),
+    ):
+        """Bans many users at once, e.g. during a raid. Users that aren't in the server are banned too."""
+        await self.run_mass_action(ctx, CaseType.BAN, users, file, joined_within, reason, delete_messages)
+
+    @commands.slash_command(name="mass-kick")
+    @discord.default_permissions(kick_members=True)
+    @commands.has_permissions(kick_members=True)
+    @commands.bot_has_permissions(kick_members=True)
+    async def mass_kick(
+        self,
+        ctx: discord.ApplicationContext,
+        users: discord.Option(str, description="The IDs or mentions of the members to kick.", default=None),
+        file: discord.Option(discord.Attachment, description="A text file of user IDs to kick.", default=None),
+        joined_within: discord.Option(
+            str, description="Kick everyone that joined within this long ago, e.g. 10m.", default=None
+        ),
+        reason: discord.Option(str, description="The reason for the kicks.", default="No Reason Provided."),
+    ):
+        """Kicks many members at once, e.g. during a raid."""
+        await self.run_mass_action(ctx, CaseType.KICK, users, file, joined_within, reason)
+
     @commands.slash_command(name="mute")
     @discord.default_permissions(moderate_members=True)
     async def mute(
@@ -444,9 +723,8 @@ class Moderation(commands.Cog):
         await ctx.edit(view=None)
 
         guild = await utils.get_guild_config(ctx.guild)
-        case = await Cases.objects.create(
-            id=await self.get_next_case_id(guild),
-            guild=guild,
+        case = await self.create_case(
+            guild,
             moderator=ctx.user.id,
             target=member.id,
             reason=reason,
@@ -459,10 +737,10 @@ class Moderation(commands.Cog):
             end = discord.utils.utcnow() + datetime.timedelta(seconds=seconds)  # recalculate
             await member.timeout(until=end, reason=f"Case#{case.entry_id!s}| " + reason)
         except discord.HTTPException as e:
-            await case.delete()
+            await self.delete_case_record(guild, case)
             return await ctx.edit(content="Failed to unmute user: {!s}".format(e), embed=None)
         except Exception:
-            await case.delete()
+            await self.delete_case_record(guild, case)
             raise
         else:
             return await ctx.edit(
@@ -499,9 +777,8 @@ class Moderation(commands.Cog):
         await ctx.edit(view=None)
 
         guild = await utils.get_guild_config(ctx.guild)
-        case = await Cases.objects.create(
-            id=await self.get_next_case_id(guild),
-            guild=guild,
+        case = await self.create_case(
+            guild,
             moderator=ctx.user.id,
             target=member.id,
             reason=reason,
@@ -512,10 +789,10 @@ class Moderation(commands.Cog):
         try:
             await member.remove_timeout(reason=f"Case#{case.entry_id!s}| " + reason)
         except discord.HTTPException as e:
-            await case.delete()
+            await self.delete_case_record(guild, case)
             return await ctx.edit(content="Failed to mute user: {!s}".format(e), embed=None)
         except Exception:
-            await case.delete()
+            await self.delete_case_record(guild, case)
             raise
         else:
             return await ctx.edit(
@@ -533,15 +810,14 @@ class Moderation(commands.Cog):
         case_id: discord.Option(
             str,
             description="The case ID you want to delete",
-            autocomplete=discord.utils.basic_autocomplete(case_id_autocomplete),
+            autocomplete=case_id_autocomplete,
         ),
     ):
         """Deletes a case from records."""
         await ctx.defer(ephemeral=True)
-        case_id = re.match(r"\(#(\d+)\)", case_id).group(1)
         guild = await utils.get_guild_config(ctx.guild)
         try:
-            case: Cases = await Cases.objects.get(id=case_id, guild=guild)
+            case: Cases = await Cases.objects.get(id=self.parse_case_id(case_id), guild=guild)
         except NoMatch:
             return await ctx.respond("Case not found.", ephemeral=True)
 
@@ -554,7 +830,7 @@ class Moderation(commands.Cog):
         await view.wait()
         if not view.confirm:
             return await ctx.edit(content="Case deletion cancelled.", view=None)
-        await case.delete()
+        await self.delete_case_record(guild, case)
         await self.log_event(
             guild,
             embed=discord.Embed(
@@ -567,6 +843,71 @@ class Moderation(commands.Cog):
         )
         return await ctx.edit(content="Deleted case #{!s}.".format(case.entry_id), view=None)
 
+    @cases_group.command(name="export")
+    @commands.has_permissions(administrator=True)
+    async def export_cases(self, ctx: discord.ApplicationContext):
+        """Exports every case in this server to a file, which /cases import can load into another instance."""
+        await ctx.defer(ephemeral=True)
+        with tempfile.TemporaryFile() as file:
+            count = await transfer.export_cases(ctx.guild.id, file)
+            if not count:
+                return await ctx.respond("No cases found.", ephemeral=True)
+            if file.tell() > ctx.guild.filesize_limit:
+                return await ctx.respond(
+                    f"The export ({naturalsize(file.tell())}) is too big to upload here. The bot's host can export it "
+                    f"with `spanner db export-cases {ctx.guild.id} cases.ndjson.gz` instead.",
+                    ephemeral=True,
+                )
+            file.seek(0)
+            return await ctx.respond(
+                f"Exported {count:,} cases.",
+                file=discord.File(file, f"cases-{ctx.guild.id}.ndjson.gz"),
+                ephemeral=True,
+            )
+
+    @cases_group.command(name="import")
+    @commands.has_permissions(administrator=True)
+    async def import_cases(
+        self,
+        ctx: discord.ApplicationContext,
+        export: discord.Option(discord.Attachment, description="A file made by /cases export."),
+    ):
+        """Imports cases exported from another instance. This server must not have any cases yet."""
+        # The import is one transaction, and on SQLite every other write waits for it to finish. Big imports would hold
+        # up the whole bot, so they're left to the CLI, which can be run while the bot is stopped.
+        if export.size > ctx.guild.filesize_limit:
+            return await ctx.respond(
+                f"That export ({naturalsize(export.size)}) is too big to import here. The bot's host can import it "
+                f"with `spanner db import-cases {export.filename} --guild {ctx.guild.id}` instead.",
+                ephemeral=True,
+            )
+        await ctx.defer(ephemeral=True)
+        with tempfile.TemporaryFile() as file:
+            try:
+                async with utils.session.stream("GET", export.url) as response:
+                    response.raise_for_status()
+                    async for chunk in response.aiter_bytes():
+                        file.write(chunk)
+            except httpx.HTTPError as e:
+                return await ctx.respond(f"Failed to download the export: {e}", ephemeral=True)
+            file.seek(0)
+            try:
+                count = await transfer.import_cases(file, guild_id=ctx.guild.id)
+            except ValueError as e:
+                return await ctx.respond(str(e), ephemeral=True)
+        case_index.invalidate(ctx.guild.id)
+
+        guild = await utils.get_guild_config(ctx.guild)
+        await self.log_event(
+            guild,
+            embed=discord.Embed(
+                title=f"\N{INBOX TRAY} {ctx.author} imported {count:,} cases.",
+                colour=discord.Colour.blue(),
+                timestamp=discord.utils.utcnow(),
+            ),
+        )
+        return await ctx.respond(f"Imported {count:,} cases.", ephemeral=True)
+
     @cases_group.command(name="view")
     async def get_case(
         self,
@@ -574,15 +915,14 @@ class Moderation(commands.Cog):
         case_id: discord.Option(
             str,
             description="The case ID you want to view.",
-            autocomplete=discord.utils.basic_autocomplete(case_id_autocomplete),
+            autocomplete=case_id_autocomplete,
         ),
     ):
         """Displays details on a provided case."""
         await ctx.defer(ephemeral=True)
-        case_id = re.match(r"\(#(\d+)\)", case_id).group(1)
         guild = await utils.get_guild_config(ctx.guild)
         try:
-            case: Cases = await Cases.objects.get(id=case_id, guild=guild)
+            case: Cases = await Cases.objects.get(id=self.parse_case_id(case_id), guild=guild)
         except NoMatch:
             return await ctx.respond("Case not found.", ephemeral=True)
 
@@ -612,15 +952,14 @@ class Moderation(commands.Cog):
         case_id: discord.Option(
             str,
             description="The case ID you want to edit.",
-            autocomplete=discord.utils.basic_autocomplete(case_id_autocomplete),
+            autocomplete=case_id_autocomplete,
         ),
     ):
         """Edits the details of a case."""
         # await ctx.defer(ephemeral=True)
-        case_id = re.match(r"\(#(\d+)\)", case_id).group(1)
         guild = await utils.get_guild_config(ctx.guild)
         try:
-            case: Cases = await Cases.objects.get(id=case_id, guild=guild)
+            case: Cases = await Cases.objects.get(id=self.parse_case_id(case_id), guild=guild)
         except NoMatch:
             return await ctx.respond("Case not found.", ephemeral=True)
 
@@ -667,6 +1006,7 @@ class Moderation(commands.Cog):
                             changes.append("(failed) " + child.custom_id)
                         else:
                             changes.append(child.custom_id)
+                            case_index.add(guild.id, case)
 
                 if len(changes) != 0:
                     await self.cog.log_event(
@@ -688,6 +1028,37 @@ class Moderation(commands.Cog):
 
     cases_list = cases_group.create_subgroup("list", "List cases matching a criteria")
 
+    async def send_case_list(self, ctx: discord.ApplicationContext, listing: CaseListing):
+        """Responds with a paginator over the listed cases. Pages are only fetched when they're first shown."""
+        if not await listing.count():
+            return await ctx.respond("No cases found.", ephemeral=True)
+
+        fmt = "{0!s}: {1!s} | `{2!s}` | <t:{3}>"
+
+        async def get_page(index: int) -> discord.Embed:
+            cases = await listing.fetch(index)
+            lines = [f"{len(cases)} entries:", ""]
+            for case in cases:
+                lines.append(
+                    fmt.format(
+                        case.id,
+                        utils.case_type_names[case.type.value].title(),
+                        self.bot.get_user(case.target) or case.target,
+                        round(case.created_at.timestamp()),
+                    )
+                )
+            n = index + 1
+            percent = round(n / listing.page_count * 100)
+            return discord.Embed(
+                title="Cases | Page #{!s}".format(n),
+                description="\n".join(lines),
+                colour=discord.Colour.blue(),
+                timestamp=discord.utils.utcnow(),
+            ).set_footer(text=f"{percent}% ({n}/{listing.page_count} pages, {listing.total:,} cases)")
+
+        paginator = LazyPaginator(listing.page_count, get_page, timeout=300, loop_pages=True)
+        return await paginator.respond(ctx.interaction, ephemeral=True)
+
     @cases_list.command(name="all")
     async def list_cases(
         self,
@@ -703,43 +1074,7 @@ class Moderation(commands.Cog):
             return await ctx.respond(str(e), ephemeral=True)
 
         guild = await utils.get_guild_config(ctx.guild)
-        cases = await Cases.objects.filter(guild=guild).order_by("-id").all()
-        if not cases:
-            return await ctx.respond("No cases found.", ephemeral=True)
-        else:
-            paginator = commands.Paginator("", "", max_size=4069)
-            fmt = "{0!s}: {1!s} | `{2!s}` | <t:{3}>"
-            for chunk in utils.chunk(cases, per_page):
-                paginator.add_line(f"{len(chunk)} entries:", empty=True)
-                for case in chunk:
-                    paginator.add_line(
-                        fmt.format(
-                            case.id,
-                            utils.case_type_names[case.type.value].title(),
-                            self.bot.get_user(case.target) or case.target,
-                            round(case.created_at.timestamp()),
-                        )
-                    )
-                paginator.close_page()
-
-            made_pages = paginator.pages
-
-            def get_page(n: int, desc: str) -> discord.Embed:
-                percent = round(n / len(made_pages) * 100)
-                return discord.Embed(
-                    title="Cases | Page #{!s}".format(n),
-                    description=desc,
-                    colour=discord.Colour.blue(),
-                    timestamp=discord.utils.utcnow(),
-                ).set_footer(text=f"{percent}% ({n}/{len(made_pages)} pages)")
-
-            paginator = pages.Paginator(
-                [get_page(*args) for args in enumerate(made_pages, 1)], timeout=300, loop_pages=True
-            )
-            return await paginator.respond(
-                ctx.interaction,
-                ephemeral=True,
-            )
+        return await self.send_case_list(ctx, CaseListing(guild, per_page))
 
     @cases_list.command(name="user")
     async def list_cases_for(
@@ -757,43 +1092,7 @@ class Moderation(commands.Cog):
             return await ctx.respond(str(e), ephemeral=True)
 
         guild = await utils.get_guild_config(ctx.guild)
-        cases = await Cases.objects.filter(guild=guild, target=user.id).order_by("-id").all()
-        if not cases:
-            return await ctx.respond("No cases found.", ephemeral=True)
-        else:
-            paginator = commands.Paginator("", "", max_size=4069)
-            fmt = "{0!s}: {1!s} | `{2!s}` | <t:{3}>"
-            for chunk in utils.chunk(cases, per_page):
-                paginator.add_line(f"{len(chunk)} entries:", empty=True)
-                for case in chunk:
-                    paginator.add_line(
-                        fmt.format(
-                            case.id,
-                            utils.case_type_names[case.type.value].title(),
-                            self.bot.get_user(case.target) or case.target,
-                            round(case.created_at.timestamp()),
-                        )
-                    )
-                paginator.close_page()
-
-            made_pages = paginator.pages
-
-            def get_page(n: int, desc: str) -> discord.Embed:
-                percent = round(n / len(made_pages) * 100)
-                return discord.Embed(
-                    title="Cases | Page #{!s}".format(n),
-                    description=desc,
-                    colour=discord.Colour.blue(),
-                    timestamp=discord.utils.utcnow(),
-                ).set_footer(text=f"{percent}% ({n}/{len(made_pages)} pages)")
-
-            paginator = pages.Paginator(
-                [get_page(*args) for args in enumerate(made_pages, 1)], timeout=300, loop_pages=True
-            )
-            return await paginator.respond(
-                ctx.interaction,
-                ephemeral=True,
-            )
+        return await self.send_case_list(ctx, CaseListing(guild, per_page, target=user.id))
 
 
 def setup(bot):
@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import re
 
 import discord
 from discord import SlashCommandGroup
@@ -7,12 +8,44 @@ from discord.commands import Option
 from discord.ext import commands
 
 from bot.client import Bot
+from utils.purge import PatternTimeout, PurgeFilter, PurgeResult, Purger
 from utils.views import EmbedCreatorView, AutoDisableView
 
 logger = logging.getLogger(__name__)
 
 
 MAX_SEARCH_OPT = Option(int, "How many messages to delete. Defaults to 100.", min_value=10, max_value=5000, default=100)
+IGNORE_PINNED_OPT = Option(bool, "If pinned messages should be left alone. Defaults to True.", default=True)
+
+
+class MaxMessagesModal(discord.ui.Modal):
+    def __init__(self, ctx: discord.ApplicationContext):
+        super().__init__(
+            discord.ui.InputText(
+                label="Maximum messages to delete:",
+                placeholder="Enter a number between 1 and 5,000.",
+                min_length=1,
+                max_length=4,
+                value="100",
+            ),
+            discord.ui.InputText(
+                label="Ignore pinned messages?",
+                placeholder="Yes or No",
+                min_length=2,
+                max_length=3,
+                value="Yes",
+            ),
+            title="Purge settings",
+        )
+        self.ctx = ctx
+        self.max_messages = None
+        self.ignore_pins = True
+
+    async def callback(self, interaction: discord.Interaction):
+        self.max_messages = min(5000, max(0, int(self.children[0].value)))
+        self.ignore_pins = self.children[1].value[0].lower() == "y"
+        self.ctx.interaction = interaction
+        self.stop()
 
 
 class Utility(commands.Cog):
@@ -28,34 +61,57 @@ class Utility(commands.Cog):
         guild_only=True,
     )
 
+    @staticmethod
+    async def run_purge(
+        ctx: discord.ApplicationContext,
+        description: str,
+        max_search: int,
+        purge_filter: PurgeFilter,
+        *,
+        before: discord.Message = None,
+        after: discord.Message = None,
+    ):
+        """Purges the channel, editing the (deferred) response with progress and then an author breakdown."""
+
+        async def progress(result: PurgeResult):
+            await ctx.edit(content=f"Deleted {result.deleted:,} messages {description} so far...")
+
+        purger = Purger(
+            ctx.channel,
+            limit=max_search,
+            check=purge_filter,
+            before=before,
+            after=after,
+            reason=f"Authorised by {ctx.author}.",
+        )
+        try:
+            result = await purger.run(progress)
+        except discord.Forbidden:
+            result = purger.result
+            value = f"Missing permissions to delete messages, stopped after deleting {result.deleted:,} messages."
+        except PatternTimeout:
+            result = purger.result
+            value = f"The pattern took too long to run, stopped after deleting {result.deleted:,} messages."
+        else:
+            value = f"Deleted {result.deleted:,} messages {description}."
+        if result.failed:
+            value += f"\nFailed to delete {result.failed:,} messages."
+        if result.deleted:
+            value += "\nAuthor breakdown:\n" + result.breakdown()
+        return await ctx.edit(content=value)
+
     @purge.command(name="number")
     @commands.bot_has_permissions(manage_messages=True, read_messages=True, read_message_history=True)
     async def limit(
         self,
         ctx: discord.ApplicationContext,
         max_search: MAX_SEARCH_OPT,
-        ignore_pinned: Option(bool, "If pinned messages should be left alone. Defaults to True.", default=True),
+        ignore_pinned: IGNORE_PINNED_OPT,
     ):
         """Deletes up to <max_search> messages."""
 
         await ctx.defer(ephemeral=True)
-        messages = await ctx.channel.purge(
-            limit=max_search,
-            check=lambda _m: (_m.pinned is False) if ignore_pinned else True,
-            reason=f"Authorised by {ctx.author}.",
-        )
-        authors = [x.author.id for x in messages]
-        authors_count = {}
-        for author in authors:
-            authors_count[author] = authors_count.get(author, 0) + 1
-        top_authors = list(set(authors))
-        top_authors.sort(key=lambda a: authors_count[a], reverse=True)
-        top_authors = top_authors[:10]
-        value = f"Deleted {len(messages):,} messages.\nAuthor breakdown:\n" + "\n".join(
-            f"<@{uid}>: {authors_count[uid]:,} ({round(authors_count[uid] / len(messages))}% of messages)"
-            for uid in top_authors
-        )
-        return await ctx.respond(value, ephemeral=True)
+        await self.run_purge(ctx, "in this channel", max_search, PurgeFilter(include_pinned=not ignore_pinned))
 
     @purge.command(name="messages-by")
     @commands.bot_has_permissions(manage_messages=True, read_messages=True, read_message_history=True)
@@ -64,225 +120,100 @@ class Utility(commands.Cog):
         ctx: discord.ApplicationContext,
         author: discord.User,
         max_search: MAX_SEARCH_OPT,
-        ignore_pinned: Option(bool, "If pinned messages should be left alone. Defaults to True.", default=True),
+        ignore_pinned: IGNORE_PINNED_OPT,
     ):
         """Deletes up to <max_search> messages by <author>."""
 
-        def check(_m: discord.Message):
-            if ignore_pinned is False:
-                if _m.pinned:
-                    return False
-
-            return _m.author == author
-
         await ctx.defer(ephemeral=True)
-        messages = await ctx.channel.purge(
-            limit=max_search,
-            check=check,
-            reason=f"Authorised by {ctx.author}.",
+        await self.run_purge(
+            ctx, f"by {author.mention}", max_search, PurgeFilter(authors=[author.id], include_pinned=not ignore_pinned)
         )
-        value = f"Deleted {len(messages):,} messages by {author.mention}."
-        return await ctx.respond(value, ephemeral=True)
 
     @purge.command(name="messages-by-bots")
     @commands.bot_has_permissions(manage_messages=True, read_messages=True, read_message_history=True)
-    async def by(
+    async def by_bots(
         self,
         ctx: discord.ApplicationContext,
         max_search: MAX_SEARCH_OPT,
-        ignore_pinned: Option(bool, "If pinned messages should be left alone. Defaults to True.", default=True),
+        ignore_pinned: IGNORE_PINNED_OPT,
     ):
         """Deletes up to <max_search> messages by non-humans."""
 
-        def check(_m: discord.Message):
-            if ignore_pinned is False:
-                if _m.pinned:
-                    return False
-
-            return _m.author.bot or _m.author.system
-
         await ctx.defer(ephemeral=True)
-        messages = await ctx.channel.purge(
-            limit=max_search,
-            check=check,
-            reason=f"Authorised by {ctx.author}.",
+        await self.run_purge(
+            ctx, "by bots or system", max_search, PurgeFilter(bots=True, include_pinned=not ignore_pinned)
         )
-        authors = [x.author.id for x in messages]
-        authors_count = {}
-        for author in authors:
-            authors_count[author] = authors_count.get(author, 0) + 1
-        top_authors = list(set(authors))
-        top_authors.sort(key=lambda a: authors_count[a], reverse=True)
-        top_authors = top_authors[:10]
-        value = f"Deleted {len(messages):,} messages by bots or system.\nAuthor breakdown:\n" + "\n".join(
-            f"<@{uid}>: {authors_count[uid]:,} ({round(authors_count[uid] / len(messages))}% of messages)"
-            for uid in top_authors
-        )
-        return await ctx.respond(value, ephemeral=True)
 
     @purge.command(name="messages-by-humans")
     @commands.bot_has_permissions(manage_messages=True, read_messages=True, read_message_history=True)
-    async def by(
+    async def by_humans(
         self,
         ctx: discord.ApplicationContext,
         max_search: MAX_SEARCH_OPT,
-        ignore_pinned: Option(bool, "If pinned messages should be left alone. Defaults to True.", default=True),
+        ignore_pinned: IGNORE_PINNED_OPT,
     ):
         """Deletes up to <max_search> messages by humans."""
 
-        def check(_m: discord.Message):
-            if ignore_pinned is False:
-                if _m.pinned:
-                    return False
+        await ctx.defer(ephemeral=True)
+        await self.run_purge(ctx, "by humans", max_search, PurgeFilter(bots=False, include_pinned=not ignore_pinned))
 
-            return not any((_m.author.bot, _m.author.system))
+    @purge.command(name="messages-matching")
+    @commands.bot_has_permissions(manage_messages=True, read_messages=True, read_message_history=True)
+    async def matching(
+        self,
+        ctx: discord.ApplicationContext,
+        pattern: Option(str, "A regular expression to search message content for.", max_length=200),
+        max_search: MAX_SEARCH_OPT,
+        ignore_pinned: IGNORE_PINNED_OPT,
+    ):
+        """Deletes up to <max_search> messages with content matching <pattern>."""
 
+        try:
+            purge_filter = PurgeFilter(content=pattern, include_pinned=not ignore_pinned)
+        except re.error as e:
+            return await ctx.respond(f"Invalid pattern: {e}", ephemeral=True)
         await ctx.defer(ephemeral=True)
-        messages = await ctx.channel.purge(
-            limit=max_search,
-            check=check,
-            reason=f"Authorised by {ctx.author}.",
-        )
-        authors = [x.author.id for x in messages]
-        authors_count = {}
-        for author in authors:
-            authors_count[author] = authors_count.get(author, 0) + 1
-        top_authors = list(set(authors))
-        top_authors.sort(key=lambda a: authors_count[a], reverse=True)
-        top_authors = top_authors[:10]
-        value = f"Deleted {len(messages):,} messages by humans.\nAuthor breakdown:\n" + "\n".join(
-            f"<@{uid}>: {authors_count[uid]:,} ({round(authors_count[uid] / len(messages))}% of messages)"
-            for uid in top_authors
-        )
-        return await ctx.respond(value, ephemeral=True)
+        await self.run_purge(ctx, "matching that pattern", max_search, purge_filter)
 
     @commands.message_command(name="Delete after this")
     @commands.bot_has_permissions(manage_messages=True, read_messages=True, read_message_history=True)
     @commands.has_permissions(manage_messages=True, read_messages=True, read_message_history=True)
     @discord.default_permissions(manage_messages=True, read_messages=True, read_message_history=True)
     async def purge_after_message(self, ctx: discord.ApplicationContext, message: discord.Message):
-        max_messages = None
-        ignore_pins = True
-
-        class MaxMessagesModal(discord.ui.Modal):
-            def __init__(self):
-                super().__init__(
-                    discord.ui.InputText(
-                        label="Maximum messages to delete:",
-                        placeholder="Enter a number between 1 and 5,000.",
-                        min_length=1,
-                        max_length=4,
-                        value="100",
-                    ),
-                    discord.ui.InputText(
-                        label="Ignore pinned messages?",
-                        placeholder="Yes or No",
-                        min_length=2,
-                        max_length=3,
-                        value="Yes",
-                    ),
-                    title="Purge settings",
-                )
-
-            async def callback(self, interaction: discord.Interaction):
-                nonlocal max_messages, ignore_pins
-                max_messages = min(5000, max(0, int(self.children[0].value)))
-                ignore_pins = self.children[1].value[0].lower() == "y"
-                ctx.interaction = interaction
-                self.stop()
-
-        modal = MaxMessagesModal()
+        modal = MaxMessagesModal(ctx)
         await ctx.send_modal(modal)
         try:
             await asyncio.wait_for(modal.wait(), timeout=120)
         except asyncio.TimeoutError:
             return
-        await ctx.defer()
-        messages = await ctx.channel.purge(
-            limit=max_messages,
-            check=lambda _m: (_m.pinned is False) if ignore_pins else True,
-            reason=f"Authorised by {ctx.author}.",
+        await ctx.defer(ephemeral=True)
+        await self.run_purge(
+            ctx,
+            f"after [this message]({message.jump_url})",
+            modal.max_messages,
+            PurgeFilter(include_pinned=not modal.ignore_pins),
             after=message,
         )
-        authors = [x.author.id for x in messages]
-        authors_count = {}
-        for author in authors:
-            authors_count[author] = authors_count.get(author, 0) + 1
-        top_authors = list(set(authors))
-        top_authors.sort(key=lambda a: authors_count[a], reverse=True)
-        top_authors = top_authors[:10]
-        value = (
-            f"Deleted {len(messages):,} messages after [this message]({message.jump_url}).\nAuthor breakdown:\n"
-            + "\n".join(
-                f"<@{uid}>: {authors_count[uid]:,} ({round(authors_count[uid] / len(messages) * 100)}% of messages)"
-                for uid in top_authors
-            )
-        )
-        return await ctx.respond(value, ephemeral=True)
 
     @commands.message_command(name="Delete before this")
     @commands.bot_has_permissions(manage_messages=True, read_messages=True, read_message_history=True)
     @commands.has_permissions(manage_messages=True, read_messages=True, read_message_history=True)
     @discord.default_permissions(manage_messages=True, read_messages=True, read_message_history=True)
     async def purge_before_message(self, ctx: discord.ApplicationContext, message: discord.Message):
-        max_messages = None
-        ignore_pins = True
-
-        class MaxMessagesModal(discord.ui.Modal):
-            def __init__(self):
-                super().__init__(
-                    discord.ui.InputText(
-                        label="Maximum messages to delete:",
-                        placeholder="Enter a number between 1 and 5,000.",
-                        min_length=1,
-                        max_length=4,
-                        value="100",
-                    ),
-                    discord.ui.InputText(
-                        label="Ignore pinned messages?",
-                        placeholder="Yes or No",
-                        min_length=2,
-                        max_length=3,
-                        value="Yes",
-                    ),
-                    title="Purge settings",
-                )
-
-            async def callback(self, interaction: discord.Interaction):
-                nonlocal max_messages, ignore_pins
-                max_messages = min(5000, max(0, int(self.children[0].value)))
-                ignore_pins = self.children[1].value[0].lower() == "y"
-                ctx.interaction = interaction
-                self.stop()
-
-        modal = MaxMessagesModal()
+        modal = MaxMessagesModal(ctx)
         await ctx.send_modal(modal)
         try:
             await asyncio.wait_for(modal.wait(), timeout=120)
         except asyncio.TimeoutError:
             return
         await ctx.defer(ephemeral=True)
-        messages = await ctx.channel.purge(
-            limit=max_messages,
-            check=lambda _m: (_m.pinned is False) if ignore_pins else True,
-            reason=f"Authorised by {ctx.author}.",
+        await self.run_purge(
+            ctx,
+            f"before [this message]({message.jump_url})",
+            modal.max_messages,
+            PurgeFilter(include_pinned=not modal.ignore_pins),
             before=message,
         )
-        authors = [x.author.id for x in messages]
-        authors_count = {}
-        for author in authors:
-            authors_count[author] = authors_count.get(author, 0) + 1
-        top_authors = list(set(authors))
-        top_authors.sort(key=lambda a: authors_count[a], reverse=True)
-        top_authors = top_authors[:10]
-        value = (
-            f"Deleted {len(messages):,} messages before [this message]({message.jump_url}).\nAuthor breakdown:\n"
-            + "\n".join(
-                f"<@{uid}>: {authors_count[uid]:,} ({round(authors_count[uid] / len(messages) * 100)}% of messages)"
-                for uid in top_authors
-            )
-        )
-        return await ctx.respond(value, ephemeral=True)
 
     embed_command = discord.SlashCommandGroup("embed", description="Embed management")
 
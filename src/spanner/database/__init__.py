@@ -1,2 +1,4 @@
 from .models import *
+from .counters import case_ids
+from .indexes import case_index, error_ids
 from orm import NoMatch, MultipleMatches
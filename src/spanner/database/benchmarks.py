@@ -0,0 +1,55 @@
+"""
+Benchmarks for the in-memory indexes. Run with ``python -m database.benchmarks`` from src/spanner.
+"""
+import random
+import time
+
+import discord
+
+from .indexes import IDIndex
+
+
+def benchmark_error_ids(size: int, queries: int = 2000) -> None:
+    now = discord.utils.time_snowflake(discord.utils.utcnow())
+    # about a year's worth of errors, at random times
+    ids = [now - random.randrange(0, 365 * 86400 * 1000) * (1 << 22) for _ in range(size)]
+    started = time.perf_counter()
+    index = IDIndex(ids)
+    index.search("9" * 20)  # builds the substring text
+    print("%d IDs: built in %.0fms" % (len(index), (time.perf_counter() - started) * 1000))
+
+    samples = random.sample(ids, min(queries, size))
+    cases = {
+        "empty": lambda _: "",
+        "prefix (4 digits)": lambda i: str(i)[:4],
+        "prefix (12 digits)": lambda i: str(i)[:12],
+        "substring (5 digits)": lambda i: str(i)[7:12],
+        "substring (last 6 digits)": lambda i: str(i)[-6:],
+        "no match": lambda _: "999999999999999999999",
+    }
+    for name, make_query in cases.items():
+        timings = []
+        for sample in samples:
+            query = make_query(sample)
+            started = time.perf_counter()
+            index.search(query)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        print(
+            "  %-26s p50 %7.1fus   p99 %7.1fus   max %7.1fus"
+            % (
+                name,
+                timings[len(timings) // 2] * 1e6,
+                timings[int(len(timings) * 0.99)] * 1e6,
+                timings[-1] * 1e6,
+            )
+        )
+
+    started = time.perf_counter()
+    index.add(now + 1)
+    print("  add (newest)               %7.1fus" % ((time.perf_counter() - started) * 1e6))
+
+
+if __name__ == "__main__":
+    for _size in (10_000, 100_000, 1_000_000):
+        benchmark_error_ids(_size)
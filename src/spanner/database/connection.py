@@ -0,0 +1,279 @@
+"""
+Connection management for the SQLite database.
+
+The stock `databases` SQLite backend opens (and closes) a brand-new connection, on its own thread, for every query
+that isn't part of a transaction, and leaves SQLite in its default rollback-journal mode where a writer blocks every
+reader. Under bursts of moderation commands plus autocomplete traffic that surfaces as ``database is locked`` errors.
+
+This module swaps in a backend that:
+* keeps a small pool of open connections, so queries don't pay for a connect each time;
+* applies a set of pragmas (WAL journaling, ``synchronous=NORMAL``, mmap and page cache sizes, a busy timeout) to
+  every connection as it is opened, so readers are never blocked by the writer;
+* funnels every write through a single writer lock, so writers queue up in-process instead of fighting over
+  SQLite's file lock. Reads are never held up by the lock.
+
+create_database also gives every task its own connection (see TaskLocalDatabase), for any kind of database. Without
+that, tasks share one connection, so their queries never run in parallel and their transactions get mixed up.
+
+Every query's duration (including any wait for the writer lock) is passed to the functions in ``query_listeners``.
+"""
+import asyncio
+import contextlib
+import logging
+import time
+import typing
+import weakref
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import aiosqlite
+import databases
+from databases.backends.sqlite import SQLiteBackend, SQLiteConnection, SQLiteTransaction
+from databases.core import Connection, DatabaseURL
+
+__all__ = (
+    "DEFAULT_PRAGMAS",
+    "PooledSQLiteBackend",
+    "TaskLocalDatabase",
+    "create_database",
+    "default_database_url",
+    "query_listeners",
+)
+
+logger = logging.getLogger(__name__)
+
+# Functions called with (operation, duration in seconds) after every query, e.g. to record metrics.
+query_listeners: List[Callable[[str, float], None]] = []
+
+DEFAULT_PRAGMAS: Dict[str, Any] = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "mmap_size": 256 * 1024 * 1024,  # bytes
+    "cache_size": -16 * 1024,  # negative values are KiB, so 16MiB
+    "busy_timeout": 5000,  # milliseconds
+    "temp_store": "memory",
+}
+
+
+@contextlib.contextmanager
+def _timed(operation: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        for listener in query_listeners:
+            listener(operation, duration)
+
+
+class PooledSQLitePool:
+    """Hands out open aiosqlite connections, keeping up to ``size`` idle ones around for re-use."""
+
+    def __init__(self, url: DatabaseURL, *, pragmas: Dict[str, Any], size: int, **options: Any):
+        self._url = url
+        self._pragmas = pragmas
+        self._options = options
+        self.size = size
+        self._idle: List[aiosqlite.Connection] = []
+        self.opened = 0
+        self.reused = 0
+        self.in_use = 0
+
+    async def _open(self) -> aiosqlite.Connection:
+        connection = aiosqlite.connect(database=self._url.database, isolation_level=None, **self._options)
+        await connection.__aenter__()
+        for name, value in self._pragmas.items():
+            async with connection.execute("PRAGMA %s=%s" % (name, value)) as cursor:
+                await cursor.close()
+        self.opened += 1
+        return connection
+
+    async def acquire(self) -> aiosqlite.Connection:
+        if self._idle:
+            connection = self._idle.pop()
+            self.reused += 1
+        else:
+            connection = await self._open()
+        self.in_use += 1
+        return connection
+
+    async def release(self, connection: aiosqlite.Connection) -> None:
+        self.in_use -= 1
+        if connection.in_transaction:
+            # Something went wrong mid-transaction; don't hand an open transaction to the next user.
+            await connection.rollback()
+        if len(self._idle) < self.size:
+            self._idle.append(connection)
+        else:
+            await connection.__aexit__(None, None, None)
+
+    async def close(self) -> None:
+        while self._idle:
+            await self._idle.pop().__aexit__(None, None, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": self.size,
+            "idle": len(self._idle),
+            "in_use": self.in_use,
+            "opened": self.opened,
+            "reused": self.reused,
+        }
+
+
+class _PooledSQLiteTransaction(SQLiteTransaction):
+    _connection: "_PooledSQLiteConnection"
+
+    async def start(self, is_root: bool, extra_options: typing.Dict[typing.Any, typing.Any]) -> None:
+        if is_root:
+            await self._connection.writer.acquire()
+            self._connection.owner = asyncio.current_task()
+        try:
+            await super().start(is_root, extra_options)
+        except BaseException:
+            if is_root:
+                self._release_writer()
+            raise
+
+    def _release_writer(self) -> None:
+        self._connection.owner = None
+        self._connection.writer.release()
+
+    async def commit(self) -> None:
+        try:
+            await super().commit()
+        finally:
+            if self._is_root:
+                self._release_writer()
+
+    async def rollback(self) -> None:
+        try:
+            await super().rollback()
+        finally:
+            if self._is_root:
+                self._release_writer()
+
+
+class _PooledSQLiteConnection(SQLiteConnection):
+    def __init__(self, pool: PooledSQLitePool, dialect, writer: asyncio.Lock):
+        super().__init__(pool, dialect)
+        self.writer = writer
+        self.owner: Optional[asyncio.Task] = None  # the task whose transaction holds the writer lock
+
+    def _in_own_transaction(self) -> bool:
+        # Statements in a transaction are already covered by the transaction holding the writer lock, but only for the
+        # task that started it. Anyone else has to wait for it to finish, or they'd be rolled back along with it.
+        return self.owner is not None and self.owner is asyncio.current_task()
+
+    async def fetch_all(self, query) -> List[Any]:
+        with _timed("fetch_all"):
+            return await super().fetch_all(query)
+
+    async def fetch_one(self, query) -> Optional[Any]:
+        with _timed("fetch_one"):
+            return await super().fetch_one(query)
+
+    async def execute(self, query) -> Any:
+        with _timed("execute"):
+            if self._in_own_transaction():
+                return await super().execute(query)
+            async with self.writer:
+                return await super().execute(query)
+
+    async def execute_many(self, queries) -> None:
+        with _timed("execute_many"):
+            if self._in_own_transaction():
+                return await super().execute_many(queries)
+            async with self.writer:
+                return await super().execute_many(queries)
+
+    def transaction(self) -> _PooledSQLiteTransaction:
+        return _PooledSQLiteTransaction(self)
+
+
+class PooledSQLiteBackend(SQLiteBackend):
+    def __init__(
+        self,
+        database_url: typing.Union[DatabaseURL, str],
+        *,
+        pragmas: Optional[Dict[str, Any]] = None,
+        pool_size: int = 4,
+        **options: Any,
+    ):
+        super().__init__(database_url, **options)
+        self.pragmas = {**DEFAULT_PRAGMAS, **(pragmas or {})}
+        self._pool = PooledSQLitePool(self._database_url, pragmas=self.pragmas, size=pool_size, **options)
+        self._writer: Optional[asyncio.Lock] = None
+
+    @property
+    def pool(self) -> PooledSQLitePool:
+        return self._pool
+
+    async def disconnect(self) -> None:
+        await self._pool.close()
+
+    def connection(self) -> _PooledSQLiteConnection:
+        if self._writer is None:
+            # Created lazily so that it belongs to the running event loop, not whatever loop existed at import.
+            self._writer = asyncio.Lock()
+        return _PooledSQLiteConnection(self._pool, self._dialect, self._writer)
+
+
+class TaskLocalDatabase(databases.Database):
+    """
+    A database that gives every task its own connection.
+
+    ``databases`` keeps the current connection in a context variable, which tasks inherit from whichever task created
+    them. So once the first query has run, every task started after it shares one connection: their queries queue up
+    behind each other, and a transaction started by one task takes in every other task's queries until it ends (and
+    rolls them back with it). Here, a transaction only ever covers the task that started it.
+
+    A task running a transaction mustn't wait on another task that writes to the database, as that write waits for
+    the transaction to finish first.
+    """
+
+    def __init__(self, url: typing.Union[str, DatabaseURL], **options: Any):
+        super().__init__(url, **options)
+        self._task_connections: "weakref.WeakKeyDictionary[asyncio.Task, Connection]" = weakref.WeakKeyDictionary()
+
+    def connection(self) -> Connection:
+        task = asyncio.current_task()
+        if self._global_connection is not None or task is None:
+            return super().connection()
+        connection = self._task_connections.get(task)
+        if connection is None:
+            connection = self._task_connections[task] = Connection(self._backend)
+        return connection
+
+
+def create_database(
+    url: str, *, pragmas: Optional[Dict[str, Any]] = None, pool_size: int = 4, **options: Any
+) -> databases.Database:
+    """
+    Creates a database for the given URL, with a connection per task. SQLite databases get a pooled, tuned connection
+    backend.
+
+    Args:
+        url: The database URL, such as ``sqlite:///main.db``.
+        pragmas: SQLite pragmas to apply on top of DEFAULT_PRAGMAS. Ignored for other databases.
+        pool_size: How many idle SQLite connections to keep open. Ignored for other databases.
+        **options: Extra options to pass to the database driver.
+    """
+    database = TaskLocalDatabase(url, **options)
+    if database.url.dialect == "sqlite":
+        # `databases` has no hook for picking a custom backend class, so replace the one it made.
+        database._backend = PooledSQLiteBackend(database.url, pragmas=pragmas, pool_size=pool_size, **options)
+    return database
+
+
+def default_database_url(debug: bool = False) -> str:
+    """
+    The database to use when no ``database_url`` is configured: main.db in ~/.config/spanner-v2, or in the working
+    directory in debug mode or when there's no ~/.config. A main.db already in the working directory is kept in use,
+    as that's where older versions always put it.
+    """
+    config_dir = Path("~/.config").expanduser()
+    if debug or Path("main.db").exists() or not config_dir.is_dir():
+        return "sqlite:///main.db"
+    (config_dir / "spanner-v2").mkdir(exist_ok=True)
+    return "sqlite:///" + str(config_dir / "spanner-v2" / "main.db")
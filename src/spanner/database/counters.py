@@ -0,0 +1,56 @@
+from .models import CaseCounter, Cases, Guild, models
+
+__all__ = ("CaseIDAllocator", "case_ids")
+
+# INSERT ... SELECT seeds a new guild's counter from its highest case number, and ON CONFLICT bumps an existing one
+# instead. SQLite needs the WHERE clause to tell the ON CONFLICT apart from a join's ON. Both SQLite (3.35+) and
+# PostgreSQL accept this as written.
+_ALLOCATE = """
+INSERT INTO {counters} (id, last_case_id)
+SELECT :guild_id, COALESCE(MAX({cases}.id), 0) + :count
+FROM {cases} JOIN {guilds} ON {cases}.guild = {guilds}.entry_id
+WHERE {guilds}.id = :guild_id
+ON CONFLICT (id) DO UPDATE SET last_case_id = {counters}.last_case_id + :count
+RETURNING last_case_id
+""".format(counters=CaseCounter.table.name, cases=Cases.table.name, guilds=Guild.table.name)
+
+
+class CaseIDAllocator:
+    """
+    Hands out per-guild case numbers atomically.
+
+    The last number given out for each guild is persisted in the ``case_counters`` table, so numbers survive restarts
+    and are never re-used, even if the case they were given to is later deleted.
+    The first allocation for a guild seeds its counter from the highest existing case number, which is the only time
+    the cases table is looked at.
+
+    Each allocation is a single upsert, so it's atomic in the database itself: concurrent allocations, whether for the
+    same guild or different ones, in this process or another sharing the database, can never see the same value.
+    """
+
+    async def allocate(self, guild_id: int, count: int = 1) -> range:
+        """
+        Reserves a block of case numbers for a guild.
+
+        Args:
+            guild_id: The discord ID of the guild the cases belong to.
+            count: How many case numbers to reserve. Use more than one for mass actions.
+
+        Returns:
+            The reserved case numbers, in ascending order.
+        """
+        if count < 1:
+            raise ValueError("count must be at least 1.")
+
+        # In a transaction so that, on SQLite, it goes through the writer lock like every other write.
+        async with models.database.transaction():
+            last = await models.database.fetch_val(_ALLOCATE, {"guild_id": guild_id, "count": count})
+        return range(last - count + 1, last + 1)
+
+    async def next(self, guild_id: int) -> int:
+        """Reserves a single case number for a guild."""
+        return (await self.allocate(guild_id, 1))[0]
+
+
+case_ids = CaseIDAllocator()
+
@@ -0,0 +1,277 @@
+"""
+In-memory indexes that serve autocomplete lookups without querying the database.
+
+Run ``python -m database.benchmarks`` (from src/spanner) to benchmark lookups against large indexes.
+"""
+import asyncio
+import bisect
+import logging
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set
+
+import sqlalchemy
+
+from .models import Cases, CaseType, Errors, Guild, models
+
+__all__ = ("IDIndex", "ErrorIndex", "error_ids", "CaseSummary", "CaseIndex", "case_index")
+
+logger = logging.getLogger(__name__)
+
+AUTOCOMPLETE_LIMIT = 25  # the most choices discord will show
+
+
+class IDIndex:
+    """
+    A sorted set of IDs that can be searched by what they start with or contain, newest (highest) first.
+
+    IDs are kept in an array, so a million of them take up 8MB. Prefix lookups are a few binary searches, since IDs
+    with the same number of digits that start with the same digits are next to each other when sorted, so they cover
+    every ID. Substring lookups scan one string of the newest ``substring_limit`` IDs, and stop as soon as they have
+    enough results. Substring searches of digit strings run at about a gigabyte a second, so scanning every ID would
+    take milliseconds at a million IDs, and old cases are rarely looked up by a fragment from the middle of their ID.
+    """
+
+    def __init__(self, ids: Iterable[int] = (), *, substring_limit: int = 25_000):
+        self.substring_limit = substring_limit
+        self._ids = array("q", sorted(set(ids)))
+        self._text = None  # "\n<newest id>\n...\n", or None if it needs rebuilding
+        self._text_count = 0  # how many IDs are in _text
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, item: int) -> bool:
+        position = bisect.bisect_left(self._ids, item)
+        return position < len(self._ids) and self._ids[position] == item
+
+    def replace(self, ids: Iterable[int]) -> None:
+        self._ids = array("q", sorted(set(ids)))
+        self._text = None
+
+    def add(self, item: int) -> None:
+        position = bisect.bisect_left(self._ids, item)
+        if position < len(self._ids) and self._ids[position] == item:
+            return
+        self._ids.insert(position, item)
+        if self._text is not None:
+            if position == len(self._ids) - 1 and self._text_count < self.substring_limit * 2:
+                # New IDs are almost always the newest, so this is the usual case. Older IDs past the limit are
+                # left in the text until it's next rebuilt.
+                self._text = "\n%d%s" % (item, self._text)
+                self._text_count += 1
+            else:
+                self._text = None
+
+    def discard(self, item: int) -> None:
+        position = bisect.bisect_left(self._ids, item)
+        if position < len(self._ids) and self._ids[position] == item:
+            del self._ids[position]
+            if self._text is not None:
+                text = self._text.replace("\n%d\n" % item, "\n", 1)
+                self._text_count -= len(text) != len(self._text)
+                self._text = text
+
+    @property
+    def oldest(self) -> Optional[int]:
+        return self._ids[0] if self._ids else None
+
+    def newest(self, limit: int = AUTOCOMPLETE_LIMIT) -> List[int]:
+        return self._ids[: -limit - 1 : -1].tolist() if limit else []
+
+    def _with_prefix(self, prefix: str) -> Iterator[int]:
+        if not self._ids or prefix[0] == "0":
+            return  # no ID has a leading zero
+        longest = len(str(self._ids[-1]))
+        start = int(prefix)
+        for digits in range(longest, len(prefix) - 1, -1):
+            scale = 10 ** (digits - len(prefix))
+            low = bisect.bisect_left(self._ids, start * scale)
+            high = bisect.bisect_left(self._ids, (start + 1) * scale)
+            for position in range(high - 1, low - 1, -1):
+                yield self._ids[position]
+
+    def _containing(self, query: str) -> Iterator[int]:
+        if self._text is None:
+            newest = self._ids[len(self._ids) - self.substring_limit :] if self.substring_limit else ()
+            self._text = "\n%s\n" % "\n".join(map(str, reversed(newest))) if newest else "\n"
+            self._text_count = len(newest)
+        text = self._text
+        position = text.find(query)
+        while position != -1:
+            start = text.rfind("\n", 0, position) + 1
+            end = text.find("\n", position)
+            yield int(text[start:end])
+            position = text.find(query, end)
+
+    def search(self, query: str, limit: int = AUTOCOMPLETE_LIMIT) -> List[int]:
+        """
+        Returns up to ``limit`` IDs containing ``query``, newest first. IDs that start with it come before IDs that only
+        contain it (which are only looked for among the newest ``substring_limit`` IDs). An empty query returns the
+        newest IDs, and a query that isn't a number returns nothing.
+        """
+        query = query.strip()
+        if not query:
+            return self.newest(limit)
+        if not query.isdecimal() or not query.isascii():
+            return []
+
+        results: List[int] = []
+        for item in self._with_prefix(query):
+            results.append(item)
+            if len(results) == limit:
+                return results
+        seen = set(results)
+        for item in self._containing(query):
+            if item not in seen:
+                results.append(item)
+                if len(results) == limit:
+                    break
+        return results
+
+
+class ErrorIndex(IDIndex):
+    """The IDs of every error case, for /get-error-case's autocomplete."""
+
+    async def load(self) -> None:
+        rows = await models.database.fetch_all(sqlalchemy.select(Errors.table.c.id))
+        self.replace(row[0] for row in rows)
+        logger.debug("Indexed %d error cases.", len(self))
+
+
+error_ids = ErrorIndex()
+
+
+class CaseSummary(NamedTuple):
+    id: int
+    type: CaseType
+    reason: str  # at most CaseIndex.REASON_LENGTH characters
+
+
+class _GuildCases:
+    def __init__(self, summaries: Iterable[CaseSummary]):
+        self.summaries: Dict[int, CaseSummary] = {}
+        self.folded: Dict[int, str] = {}  # case number -> casefolded reason, for case-insensitive matching
+        for summary in summaries:
+            self.set(summary)
+        self.ids = IDIndex(self.summaries)
+
+    def set(self, summary: CaseSummary) -> None:
+        self.summaries[summary.id] = summary
+        self.folded[summary.id] = summary.reason.casefold()
+
+    def remove(self, case_id: int) -> bool:
+        self.folded.pop(case_id, None)
+        return self.summaries.pop(case_id, None) is not None
+
+
+class CaseIndex:
+    """
+    The most recent cases of recently used guilds, for the case commands' autocomplete.
+
+    A guild's cases are loaded the first time they're looked up (concurrent lookups share one query), and kept up to
+    date by the Moderation cog as it creates, edits and deletes cases, so that lookups after that never touch the
+    database. Least recently used guilds are dropped once there are more than ``max_guilds``.
+    """
+
+    REASON_LENGTH = 200
+
+    def __init__(self, *, per_guild: int = 500, max_guilds: int = 1000):
+        """
+        Args:
+            per_guild: How many of each guild's newest cases to keep.
+            max_guilds: How many guilds to keep cases for.
+        """
+        self.per_guild = per_guild
+        self.max_guilds = max_guilds
+        self._guilds: "OrderedDict[int, _GuildCases]" = OrderedDict()
+        self._loading: Dict[int, asyncio.Task] = {}
+        self._changed: Set[int] = set()  # guilds whose cases changed while they were being loaded
+
+    @classmethod
+    def summarise(cls, case: Cases) -> CaseSummary:
+        return CaseSummary(case.id, case.type, case.reason[: cls.REASON_LENGTH])
+
+    async def _load(self, guild_id: int) -> _GuildCases:
+        try:
+            table = Cases.table
+            query = (
+                sqlalchemy.select(
+                    table.c.id, table.c.type, sqlalchemy.func.substr(table.c.reason, 1, self.REASON_LENGTH)
+                )
+                .select_from(table.join(Guild.table, table.c.guild == Guild.table.c.entry_id))
+                .where(Guild.table.c.id == guild_id)
+                .order_by(table.c.id.desc())
+                .limit(self.per_guild)
+            )
+            rows = await models.database.fetch_all(query)
+            cases = _GuildCases(CaseSummary(row[0], CaseType(row[1]), row[2]) for row in rows)
+            if guild_id in self._changed:
+                # A case changed while the query ran, so the results may already be out of date. They're still
+                # good enough to answer this lookup, but the next one loads them again.
+                return cases
+            self._guilds[guild_id] = cases
+            while len(self._guilds) > self.max_guilds:
+                self._guilds.popitem(last=False)
+            return cases
+        finally:
+            self._loading.pop(guild_id, None)
+            self._changed.discard(guild_id)
+
+    async def _guild(self, guild_id: int) -> _GuildCases:
+        cases = self._guilds.get(guild_id)
+        if cases is not None:
+            self._guilds.move_to_end(guild_id)
+            return cases
+        task = self._loading.get(guild_id)
+        if task is None:
+            task = self._loading[guild_id] = asyncio.create_task(self._load(guild_id))
+        return await asyncio.shield(task)
+
+    async def search(self, guild_id: int, query: str, limit: int = AUTOCOMPLETE_LIMIT) -> List[CaseSummary]:
+        """
+        Returns up to ``limit`` of the guild's recent cases, newest first. Cases whose number contains ``query`` (minus
+        any leading "#") come first, followed by cases whose reason contains it.
+        """
+        cases = await self._guild(guild_id)
+        query = query.strip()
+        numbers = cases.ids.search(query.lstrip("(#"), limit) if query else cases.ids.newest(limit)
+        results = [cases.summaries[number] for number in numbers]
+        if query and len(results) < limit:
+            folded = query.casefold()
+            seen = set(numbers)
+            for number in cases.ids.newest(len(cases.ids)):
+                if number not in seen and folded in cases.folded[number]:
+                    results.append(cases.summaries[number])
+                    if len(results) == limit:
+                        break
+        return results
+
+    def add(self, guild_id: int, case: Cases) -> None:
+        """Adds a new case, or updates an edited one. Does nothing if the guild's cases aren't loaded."""
+        cases = self._guilds.get(guild_id)
+        if cases is None:
+            if guild_id in self._loading:
+                self._changed.add(guild_id)
+            return
+        cases.set(self.summarise(case))
+        cases.ids.add(case.id)
+        while len(cases.ids) > self.per_guild:
+            oldest = cases.ids.oldest
+            cases.ids.discard(oldest)
+            cases.remove(oldest)
+
+    def discard(self, guild_id: int, case_id: int) -> None:
+        cases = self._guilds.get(guild_id)
+        if cases is None:
+            if guild_id in self._loading:
+                self._changed.add(guild_id)
+        elif cases.remove(case_id):
+            cases.ids.discard(case_id)
+
+    def invalidate(self, guild_id: int) -> None:
+        """Forgets a guild's cases, so they're loaded again on the next lookup."""
+        self._guilds.pop(guild_id, None)
+
+
+case_index = CaseIndex()
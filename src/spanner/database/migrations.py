@@ -0,0 +1,157 @@
+"""
+Versioned schema migrations.
+
+``models.create_all()`` only creates tables that don't exist yet, so any change to an existing table (such as a new
+index) has to be applied by a migration. Migrations are applied in version order at startup, each in its own
+transaction, and recorded in the ``schema_migrations`` table so that they only ever run once per database.
+
+Migrations must be safe to run against a database that was freshly created by ``create_all``, as those already
+have the latest schema but no migration history.
+"""
+import logging
+from typing import Awaitable, Callable, List, NamedTuple
+
+import databases
+import discord.utils
+import sqlalchemy
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from .models import CaseCounter, Cases, Guild, models
+
+__all__ = ("Migration", "MIGRATIONS", "migration", "run_migrations")
+
+logger = logging.getLogger(__name__)
+
+schema_migrations = sqlalchemy.Table(
+    "schema_migrations",
+    sqlalchemy.MetaData(),
+    sqlalchemy.Column("version", sqlalchemy.Integer, primary_key=True, autoincrement=False),
+    sqlalchemy.Column("description", sqlalchemy.String(length=256), nullable=False),
+    sqlalchemy.Column("applied_at", sqlalchemy.DateTime, nullable=False),
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[databases.Database], Awaitable[None]]
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str):
+    """Registers the decorated coroutine function as a migration."""
+
+    def decorator(func: Callable[[databases.Database], Awaitable[None]]):
+        if any(m.version == version for m in MIGRATIONS):
+            raise ValueError("Duplicate migration version %d." % version)
+        MIGRATIONS.append(Migration(version, description, func))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return func
+
+    return decorator
+
+
+def _compile_ddl(database: databases.Database, element: sqlalchemy.schema.DDLElement) -> str:
+    # DDL is compiled up-front, as not every `databases` backend can compile DDL elements itself.
+    dialect = sqlalchemy.engine.make_url("%s://" % database.url.dialect).get_dialect()()
+    return str(element.compile(dialect=dialect))
+
+
+def _declared_index(name: str) -> sqlalchemy.Index:
+    for table in models.metadata.tables.values():
+        for index in table.indexes:
+            if index.name == name:
+                return index
+    raise KeyError("No index named %r is declared on any model." % name)
+
+
+async def _create_indexes(database: databases.Database, *names: str) -> None:
+    for name in names:
+        logger.info("Creating index %s.", name)
+        await database.execute(_compile_ddl(database, CreateIndex(_declared_index(name), if_not_exists=True)))
+
+
+@migration(1, "Renumber duplicate case numbers and add the unique (guild, id) case index")
+async def _unique_case_numbers(database: databases.Database) -> None:
+    cases = Cases.table
+    duplicates = await database.fetch_all(
+        sqlalchemy.select(cases.c.guild, cases.c.id)
+        .group_by(cases.c.guild, cases.c.id)
+        .having(sqlalchemy.func.count() > 1)
+    )
+    for duplicate in duplicates:
+        guild, case_id = duplicate["guild"], duplicate["id"]
+        rows = await database.fetch_all(
+            sqlalchemy.select(cases.c.entry_id)
+            .where(cases.c.guild == guild, cases.c.id == case_id)
+            .order_by(cases.c.created_at)
+        )
+        # The oldest case keeps its number, the rest are moved to the end of the guild's case list.
+        for row in rows[1:]:
+            entry_id = row["entry_id"]
+            highest = await database.fetch_val(
+                sqlalchemy.select(sqlalchemy.func.max(cases.c.id)).where(cases.c.guild == guild)
+            )
+            await database.execute(cases.update().where(cases.c.entry_id == entry_id).values(id=highest + 1))
+            logger.warning("Renumbered duplicate case #%s (%s) to #%s.", case_id, entry_id, highest + 1)
+
+        # Make sure the guild's case counter (if it has one yet) doesn't hand out the numbers we just used.
+        highest = await database.fetch_val(
+            sqlalchemy.select(sqlalchemy.func.max(cases.c.id)).where(cases.c.guild == guild)
+        )
+        guild_id = await database.fetch_val(sqlalchemy.select(Guild.table.c.id).where(Guild.table.c.entry_id == guild))
+        counters = CaseCounter.table
+        await database.execute(
+            counters.update()
+            .where(counters.c.id == guild_id, counters.c.last_case_id < highest)
+            .values(last_case_id=highest)
+        )
+
+    await _create_indexes(database, "ix_cases_guild_id")
+
+
+@migration(2, "Add case, error, reaction role and welcome message lookup indexes")
+async def _lookup_indexes(database: databases.Database) -> None:
+    await _create_indexes(
+        database,
+        "ix_cases_guild_target",
+        "ix_errors_guild",
+        "ix_errors_author",
+        "ix_reaction_roles_guild_message_id",
+        "ix_welcome_messages_guild",
+    )
+
+
+async def run_migrations(database: databases.Database = None) -> List[int]:
+    """
+    Applies every migration that has not yet been applied to the database.
+
+    Args:
+        database: The database to migrate. Defaults to the one the models are currently using.
+
+    Returns:
+        The versions of the migrations that were applied.
+    """
+    database = database or models.database
+    await database.execute(_compile_ddl(database, CreateTable(schema_migrations, if_not_exists=True)))
+    applied = {row["version"] for row in await database.fetch_all(sqlalchemy.select(schema_migrations.c.version))}
+
+    ran = []
+    for m in MIGRATIONS:
+        if m.version in applied:
+            continue
+        logger.info("Applying migration %d: %s", m.version, m.description)
+        async with database.transaction():
+            await m.apply(database)
+            await database.execute(
+                schema_migrations.insert().values(
+                    version=m.version, description=m.description, applied_at=discord.utils.utcnow()
+                )
+            )
+        ran.append(m.version)
+
+    if ran:
+        logger.info("Applied %d migration(s); schema is now at version %d.", len(ran), ran[-1])
+    return ran
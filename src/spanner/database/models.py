@@ -1,11 +1,12 @@
 import datetime
 import enum
 import uuid
-from typing import TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING, Optional, Tuple
 
 import databases
 import discord.utils
 import orm
+import sqlalchemy
 
 __all__ = (
     "CaseType",
@@ -14,14 +15,43 @@ __all__ = (
     "ReactionRoles",
     "Cases",
     "Errors",
+    "CaseCounter",
     "CommandType",
+    "Index",
     "DB_STAT",
+    "use_database",
 )
 
 models = orm.ModelRegistry(databases.Database("sqlite:///main.db"))
 DB_STAT = None
 
 
+def use_database(database: databases.Database) -> None:
+    """Points the registry, and every model in it, at a different database."""
+    models.database = database
+    # orm copies the registry's database onto each model class when it's defined, and instance methods
+    # (update, delete, load) use that copy, so they have to be re-pointed too.
+    for model in models.models.values():
+        model.database = database
+
+
+class Index:
+    """
+    Declares a secondary index on a model. List these in a model's ``indexes`` attribute.
+
+    Indexes are named ``ix_<table>_<columns>``. Declared indexes are created along with new tables, however existing
+    databases only get them through a migration (see database.migrations).
+    """
+
+    def __init__(self, *columns: str, unique: bool = False):
+        self.columns: Tuple[str, ...] = columns
+        self.unique = unique
+
+    def build(self, model: "orm.Model") -> sqlalchemy.Index:
+        name = "ix_%s_%s" % (model.tablename, "_".join(self.columns))
+        return sqlalchemy.Index(name, *(model.table.c[column] for column in self.columns), unique=self.unique)
+
+
 class CaseType(enum.IntEnum):
     WARN = 0
     MUTE = 1
@@ -74,6 +104,7 @@ class WelcomeMessage(orm.Model):
         "ignore_bots": orm.Boolean(default=False),
         "delete_after": orm.Integer(default=3600 * 6),
     }
+    indexes = (Index("guild"),)
 
     if TYPE_CHECKING:
         entry_id: uuid.UUID
@@ -96,6 +127,7 @@ class ReactionRoles(orm.Model):
         "emoji": orm.String(min_length=1, max_length=16),
         "role": orm.BigInteger(default=None),
     }
+    indexes = (Index("guild", "message_id"),)
 
     if TYPE_CHECKING:
         entry_id: uuid.UUID
@@ -120,6 +152,11 @@ class Cases(orm.Model):
         type=orm.Enum(CaseType, default=CaseType.WARN),
         expire_at=orm.DateTime(allow_null=True, default=None),
     )
+    indexes = (
+        # Case numbers are unique per guild, and every case lookup is by (guild, id).
+        Index("guild", "id", unique=True),
+        Index("guild", "target"),
+    )
 
     if TYPE_CHECKING:
         entry_id: uuid.UUID
@@ -133,6 +170,21 @@ class Cases(orm.Model):
         expire_at: Optional[datetime.datetime]
 
 
+class CaseCounter(orm.Model):
+    """Holds the last case number handed out for each guild. See database.counters."""
+
+    tablename = "case_counters"
+    registry = models
+    fields = {
+        "id": orm.BigInteger(primary_key=True),  # guild_id
+        "last_case_id": orm.Integer(default=0),
+    }
+
+    if TYPE_CHECKING:
+        id: int
+        last_case_id: int
+
+
 class Errors(orm.Model):
     registry = models
 
@@ -141,7 +193,7 @@ class Errors(orm.Model):
         return discord.utils.generate_snowflake()
 
     fields = dict(
-        id=orm.Integer(primary_key=True, default=discord.utils.generate_snowflake),
+        id=orm.BigInteger(primary_key=True, default=discord.utils.generate_snowflake),
         traceback_text=orm.Text(),
         author=orm.BigInteger(),
         guild=orm.BigInteger(allow_null=True),
@@ -152,6 +204,7 @@ class Errors(orm.Model):
         permissions_guild=orm.BigInteger(),
         full_message=orm.String(min_length=2, max_length=4000, allow_null=True),
     )
+    indexes = (Index("guild"), Index("author"))
 
     if TYPE_CHECKING:
         id: int
@@ -169,3 +222,8 @@ class Errors(orm.Model):
 class APIToken(orm.Model):
     registry = models
     fields = {"id": orm.BigInteger(primary_key=True, default=discord.utils.generate_snowflake), "secret": orm.Text()}
+
+
+for _model in models.models.values():
+    for _index in getattr(_model, "indexes", ()):
+        _index.build(_model)
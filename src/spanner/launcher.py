@@ -8,7 +8,6 @@ from rich.logging import RichHandler
 
 import dotenv
 from setproctitle import setproctitle
-from .database.models import models
 
 dotenv.load_dotenv()
 
@@ -24,7 +23,7 @@ async def main(bot):
             install(console=bot.console, show_locals=True)
 
         logging.info("Initialising database")
-        await models.create_all()
+        await bot.setup_database()
 
         bot.console.log("Starting connections...")
         await bot.launch()
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Set, Tuple
+
+import discord
+
+from .cache import TTLCache
+
+__all__ = ("BanCounter",)
+
+logger = logging.getLogger(__name__)
+
+
+class BanCounter:
+    """
+    Counts guild bans without holding them in memory, caching the counts per guild.
+
+    Bans are streamed page by page, and counting stops at ``ceiling``, so guilds with huge ban lists show e.g.
+    "100,000+" instead of paging through every ban. Cached counts older than ``refresh_after`` seconds are still
+    returned, but are recounted in the background. Counts are dropped after ``ttl`` seconds, or when the guild's bans
+    change (see invalidate).
+    """
+
+    def __init__(self, *, ceiling: int = 100_000, refresh_after: float = 300.0, ttl: float = 3600.0):
+        self.ceiling = ceiling
+        self.refresh_after = refresh_after
+        # guild ID -> (counted at, count, whether counting stopped at the ceiling)
+        self.cache: TTLCache[int, Tuple[float, int, bool]] = TTLCache(max_size=1024, ttl=ttl)
+        self._counting: Dict[int, asyncio.Task] = {}
+        # Guilds whose bans changed while they were being counted, so that the (possibly outdated) count isn't cached.
+        self._changed: Set[int] = set()
+
+    async def count(self, guild: discord.Guild) -> Tuple[int, bool]:
+        """Counts a guild's bans, up to the ceiling. Returns the count, and whether the ceiling was reached."""
+        count = 0
+        async for _ in guild.bans(limit=None):
+            count += 1
+            if count >= self.ceiling:
+                return count, True
+        return count, False
+
+    async def _recount(self, guild: discord.Guild) -> Tuple[int, bool]:
+        try:
+            count, capped = await self.count(guild)
+            if guild.id not in self._changed:
+                self.cache.set(guild.id, (time.monotonic(), count, capped))
+            return count, capped
+        finally:
+            self._counting.pop(guild.id, None)
+            self._changed.discard(guild.id)
+
+    def _start_recount(self, guild: discord.Guild) -> asyncio.Task:
+        task = self._counting.get(guild.id)
+        if task is None:
+            task = self._counting[guild.id] = asyncio.create_task(self._recount(guild))
+            task.add_done_callback(self._log_failure)
+        return task
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task) -> None:
+        # Background recounts have nobody awaiting them, so failures would otherwise go unnoticed.
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Failed to count bans.", exc_info=task.exception())
+
+    async def get(self, guild: discord.Guild) -> Tuple[int, bool]:
+        """
+        Returns a guild's ban count, and whether it was capped at the ceiling.
+
+        Only the first call for a guild waits for the bans to be counted. Concurrent calls share one count, and
+        cancelling a call (e.g. with a timeout) leaves the count running, so the next call can use its result.
+        """
+        cached = self.cache.get(guild.id)
+        if cached is not None:
+            counted_at, count, capped = cached
+            if time.monotonic() - counted_at >= self.refresh_after:
+                self._start_recount(guild)
+            return count, capped
+        return await asyncio.shield(self._start_recount(guild))
+
+    def invalidate(self, guild_id: int) -> None:
+        """Forgets a guild's ban count. Call this whenever a member is banned or unbanned."""
+        if guild_id in self._counting:
+            self._changed.add(guild_id)
+        self.cache.invalidate(guild_id)
+
+    @staticmethod
+    def format(count: int, capped: bool) -> str:
+        return f"{count:,}+" if capped else f"{count:,}"
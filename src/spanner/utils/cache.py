@@ -0,0 +1,77 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+__all__ = ("TTLCache",)
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """
+    A bounded least-recently-used mapping where every entry also expires after a fixed time-to-live.
+
+    Lookups and writes are O(1). Hits and misses are counted so that callers can tell how effective the cache is.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300.0):
+        if max_size <= 0:
+            raise ValueError("max_size must be a positive integer.")
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[K, Tuple[float, V]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: K) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        """Fetches a value from the cache, counting the lookup as a hit or a miss."""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: K, value: V, *, ttl: Optional[float] = None) -> None:
+        """Inserts or replaces a value, evicting the least recently used entry if the cache is full."""
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: K) -> bool:
+        """Removes a key from the cache. Returns True if the key was present."""
+        return self._data.pop(key, None) is not None
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+        }
@@ -0,0 +1,53 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+__all__ = ("Debouncer",)
+
+
+class _Window:
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+        self.call: Optional[Callable[[], Awaitable[Any]]] = None
+
+
+class Debouncer:
+    """
+    Coalesces bursts of calls per key, such as the autocomplete requests sent for every keystroke a user types.
+
+    The first call for a key opens a window of ``delay`` seconds. Every call made during the window waits for it to
+    close, and then they all get the result of the newest call made in it. Only that one actually runs.
+    """
+
+    def __init__(self, delay: float = 0.15):
+        self.delay = delay
+        self._windows: Dict[Hashable, _Window] = {}
+
+    async def run(self, key: Hashable, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        window = self._windows.get(key)
+        if window is None:
+            loop = asyncio.get_running_loop()
+            window = self._windows[key] = _Window(loop.create_future())
+            loop.call_later(self.delay, self._close, key, window)
+        window.call = lambda: func(*args, **kwargs)
+        # Shielded, so that one caller being cancelled doesn't cancel the call for the others.
+        return await asyncio.shield(window.future)
+
+    def _close(self, key: Hashable, window: _Window) -> None:
+        if self._windows.get(key) is window:
+            del self._windows[key]
+        task = asyncio.ensure_future(window.call())
+        task.add_done_callback(lambda t: self._finish(window.future, t))
+
+    @staticmethod
+    def _finish(future: asyncio.Future, task: asyncio.Task) -> None:
+        if future.cancelled():
+            return
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+            # Marks it as retrieved. Callers that are still waiting get it anyway, and if they were all cancelled
+            # asyncio would otherwise log "Future exception was never retrieved".
+            future.exception()
+        else:
+            future.set_result(task.result())
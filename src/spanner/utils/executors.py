@@ -0,0 +1,107 @@
+"""
+Named, size-limited executors for running blocking code off the event loop.
+
+* ``default`` - general short blocking calls. Also the event loop's default executor once the bot starts.
+* ``io`` - calls that mostly wait on something else: subprocesses, file reads, synchronous HTTP clients.
+* ``cpu`` - CPU-heavy work, such as parsing HTML. This is a pool of processes, so it isn't held back by the GIL and
+  can't starve the thread pools. Functions sent to it (and their arguments and results) must be picklable, and the
+  functions must be importable without side effects, as workers are started with "spawn".
+
+Pool sizes can be changed with configure() before a pool is first used.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+from . import metrics
+
+__all__ = ("ExecutorPool", "Executors", "executors")
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorPool:
+    def __init__(self, name: str, workers: int, *, processes: bool = False):
+        self.name = name
+        self.workers = workers
+        self.processes = processes
+        self.in_flight = 0  # calls submitted through run() that haven't finished yet
+        self._executor: Optional[Executor] = None
+
+    @property
+    def executor(self) -> Executor:
+        """The underlying executor, created on first use."""
+        if self._executor is None:
+            if self.processes:
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="executor-" + self.name)
+        return self._executor
+
+    @property
+    def queue_depth(self) -> int:
+        """How many calls are waiting for a free worker."""
+        if isinstance(self._executor, ThreadPoolExecutor):
+            # Counts calls from loop.run_in_executor() too, not only ones made through run().
+            return self._executor._work_queue.qsize()
+        return max(0, self.in_flight - self.workers)
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, partial(func, *args, **kwargs))
+        finally:
+            self.in_flight -= 1
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+
+class Executors:
+    def __init__(self):
+        cpus = os.cpu_count() or 2
+        self.pools: Dict[str, ExecutorPool] = {
+            "default": ExecutorPool("default", min(32, cpus + 4)),
+            "io": ExecutorPool("io", 16),
+            "cpu": ExecutorPool("cpu", max(1, min(cpus - 1, 4)), processes=True),
+        }
+
+    def get(self, name: str) -> ExecutorPool:
+        try:
+            return self.pools[name]
+        except KeyError:
+            raise ValueError("There is no executor pool named %r." % name) from None
+
+    def configure(self, name: str, workers: int) -> None:
+        """Changes the size of a pool. This has no effect once the pool has been used."""
+        pool = self.get(name)
+        if pool._executor is not None:
+            logger.warning("Executor pool %r is already running, so its size can't be changed.", name)
+            return
+        pool.workers = workers
+
+    def shutdown(self, wait: bool = False) -> None:
+        for pool in self.pools.values():
+            pool.shutdown(wait)
+
+
+executors = Executors()
+
+metrics.registry.gauge(
+    "spanner_executor_queue_depth",
+    "Blocking calls waiting for a free worker, by executor pool.",
+    ("pool",),
+    lambda: {(name,): pool.queue_depth for name, pool in executors.pools.items()},
+)
+metrics.registry.gauge(
+    "spanner_executor_in_flight",
+    "Blocking calls submitted with run_blocking that haven't finished, by executor pool.",
+    ("pool",),
+    lambda: {(name,): pool.in_flight for name, pool in executors.pools.items()},
+)
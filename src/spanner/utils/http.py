@@ -0,0 +1,209 @@
+"""
+The HTTP client that every outbound request goes through (usually as ``utils.session``).
+
+One ``httpx.AsyncClient`` is shared by everything, so connections (and their TLS sessions) are kept alive and reused
+instead of being set up for every request. On top of httpx's pool limits, requests to any one host are capped by a
+semaphore so that one slow site can't take up the whole pool. Requests that fail in a way that's likely to be
+temporary (connection errors, timeouts, 429 and 5xx gateway responses) are retried with exponential backoff, but only
+for idempotent methods unless asked otherwise. HTTP/2 is used when the ``h2`` package is installed.
+"""
+import asyncio
+import contextlib
+import email.utils
+import importlib.util
+import logging
+import random
+import sys
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+import discord
+import httpx
+
+from . import metrics
+
+__all__ = ("HTTPClient",)
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+MAX_RETRY_AFTER = 30.0
+
+requests_total = metrics.registry.counter(
+    "spanner_http_requests_total", "Outbound HTTP requests, by method and outcome.", ("method", "outcome")
+)
+retries_total = metrics.registry.counter("spanner_http_retries_total", "Outbound HTTP requests that were retried.")
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+
+
+class HTTPClient:
+    def __init__(
+        self,
+        *,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 60.0,
+        per_host_limit: int = 10,
+        timeout: float = 15.0,
+        connect_timeout: float = 5.0,
+        retries: int = 2,
+        backoff: float = 0.5,
+    ):
+        """
+        Args:
+            max_connections: The most connections open at once, across all hosts.
+            max_keepalive_connections: The most idle connections kept open for reuse.
+            keepalive_expiry: How long idle connections are kept open, in seconds.
+            per_host_limit: The most requests in progress to any one host at once.
+            timeout: How long to wait for each read, write or free connection, in seconds.
+            connect_timeout: How long to wait for a connection to be established, in seconds.
+            retries: How many times to retry a request that failed in a way that may be temporary.
+            backoff: The delay before the first retry, in seconds. It doubles with every retry after that.
+        """
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.http2 = importlib.util.find_spec("h2") is not None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+
+    def configure(self, **options: Any) -> None:
+        """Changes any of the options given to the constructor. Pool options apply to the next client created."""
+        for name, value in options.items():
+            if not hasattr(self, name) or name.startswith("_"):
+                raise TypeError("Unknown HTTP client option %r." % name)
+            setattr(self, name, value)
+        self._host_limits.clear()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """The underlying httpx client. It's created on first use, and again if it has been closed."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers={
+                    "User-Agent": f"DiscordBot (Spanner/v2; https://github.com/EEKIM10/spanner-v2; "
+                    f"httpx/{httpx.__version__}); pycord/{discord.__version__}; "
+                    f"python/{'.'.join(map(str, sys.version_info[:3]))})"
+                },
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                http2=self.http2,
+            )
+        return self._client
+
+    @property
+    def is_closed(self) -> bool:
+        return self._client is None or self._client.is_closed
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+
+    def _host_limit(self, url: httpx.URL) -> asyncio.Semaphore:
+        semaphore = self._host_limits.get(url.host)
+        if semaphore is None:
+            semaphore = self._host_limits[url.host] = asyncio.Semaphore(self.per_host_limit)
+        return semaphore
+
+    async def request(self, method: str, url: str, *, retries: Optional[int] = None, **kwargs: Any) -> httpx.Response:
+        """
+        Sends a request, retrying it if it fails in a way that may be temporary. Takes the same arguments as
+        ``httpx.AsyncClient.request``.
+
+        Args:
+            retries: How many times to retry. Defaults to the client's setting for idempotent methods, and 0 otherwise.
+        """
+        method = method.upper()
+        if retries is None:
+            retries = self.retries if method in IDEMPOTENT_METHODS else 0
+        url = httpx.URL(url)
+
+        attempt = 0
+        while True:
+            try:
+                async with self._host_limit(url):
+                    response = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError:
+                requests_total.inc(method=method, outcome="error")
+                if attempt >= retries:
+                    raise
+                delay = None
+            else:
+                requests_total.inc(method=method, outcome="%dxx" % (response.status_code // 100))
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return response
+                delay = _retry_after(response)
+                await response.aclose()
+
+            if delay is None or delay < 0:
+                delay = self.backoff * 2**attempt * random.uniform(0.8, 1.2)
+            delay = min(delay, MAX_RETRY_AFTER)
+            attempt += 1
+            retries_total.inc()
+            logger.debug("Retrying %s %s in %.1f seconds (attempt %d).", method, url, delay, attempt + 1)
+            await asyncio.sleep(delay)
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def head(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("HEAD", url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def put(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("PUT", url, **kwargs)
+
+    async def delete(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("DELETE", url, **kwargs)
+
+    @contextlib.asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs: Any) -> AsyncIterator[httpx.Response]:
+        """
+        Sends a request without reading the response body, so that only as much of it as is needed has to be read.
+        The connection counts towards the host's limit until the block exits. Streamed requests are never retried.
+        """
+        method = method.upper()
+        url = httpx.URL(url)
+        async with self._host_limit(url):
+            try:
+                async with self.client.stream(method, url, **kwargs) as response:
+                    requests_total.inc(method=method, outcome="%dxx" % (response.status_code // 100))
+                    yield response
+            except httpx.TransportError:
+                requests_total.inc(method=method, outcome="error")
+                raise
+
+    def pool_stats(self) -> Dict[str, int]:
+        """Returns how many of the pool's connections are idle and in use, and how many requests wait on host caps."""
+        stats = {"idle": 0, "active": 0, "waiting": 0}
+        pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+        if pool is not None and not self.is_closed:
+            for connection in list(pool.connections):
+                stats["idle" if connection.is_idle() else "active"] += 1
+        for semaphore in self._host_limits.values():
+            stats["waiting"] += len(getattr(semaphore, "_waiters", None) or ())
+        return stats
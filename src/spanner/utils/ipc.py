@@ -0,0 +1,302 @@
+"""
+Inter-process communication between the clusters started by ``spanner run --clusters``.
+
+The supervising process runs an IPCBroker on a Unix socket and every cluster connects to it with the module-level
+``ipc`` client. Messages are newline-delimited JSON objects. Requests are addressed to a cluster ID (or to the broker
+itself, with a target of None), and the broker routes each response back to whoever sent the request. Broadcasts are
+fire-and-forget notifications (such as cache invalidations) that the broker passes on to every other cluster.
+
+When the bot isn't running as part of a cluster, ``ipc`` is never connected and requests for this process are
+handled locally, so callers don't need to special-case single-process deployments.
+"""
+import asyncio
+import json
+import logging
+import uuid
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Union
+
+__all__ = ("IPCError", "IPCBroker", "IPCClient", "ipc")
+
+logger = logging.getLogger(__name__)
+
+# Responses can carry whole trace files, so allow far longer lines than asyncio's 64KiB default.
+MAX_MESSAGE_SIZE = 32 * 1024 * 1024
+
+Handler = Callable[[Any], Awaitable[Any]]
+
+
+class IPCError(Exception):
+    """Raised when a request could not be delivered, or when the handler on the other end raised an error."""
+
+
+def _encode(message: Dict[str, Any]) -> bytes:
+    return json.dumps(message, separators=(",", ":"), default=str).encode() + b"\n"
+
+
+async def _read_messages(reader: asyncio.StreamReader) -> AsyncIterator[Dict[str, Any]]:
+    while True:
+        line = await reader.readline()
+        if not line:
+            return
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            logger.warning("Dropping malformed IPC message: %r", line[:100])
+
+
+class IPCBroker:
+    """Routes messages between the clusters. Runs in the supervising process."""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._clusters: Dict[int, asyncio.StreamWriter] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def clusters(self) -> List[int]:
+        return sorted(self._clusters)
+
+    async def start(self) -> None:
+        if self.path.exists():
+            self.path.unlink()
+        self._server = await asyncio.start_unix_server(self._handle, path=str(self.path), limit=MAX_MESSAGE_SIZE)
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for writer in self._clusters.values():
+            writer.close()
+        self._clusters.clear()
+        if self.path.exists():
+            self.path.unlink()
+
+    @staticmethod
+    async def _send(writer: asyncio.StreamWriter, message: Dict[str, Any]) -> None:
+        writer.write(_encode(message))
+        await writer.drain()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        cluster_id = None
+        try:
+            async for message in _read_messages(reader):
+                if message["op"] == "hello":
+                    cluster_id = message["source"]
+                    self._clusters[cluster_id] = writer
+                    logger.info("Cluster %s connected to IPC.", cluster_id)
+                elif message["op"] == "broadcast":
+                    await self._broadcast(writer, message)
+                elif message.get("target") is None:
+                    await self._answer(writer, message)
+                else:
+                    await self._forward(writer, message)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # The broker is shutting down. This is a top-level task, so there's nothing to propagate this to.
+            pass
+        finally:
+            if cluster_id is not None and self._clusters.get(cluster_id) is writer:
+                del self._clusters[cluster_id]
+                logger.info("Cluster %s disconnected from IPC.", cluster_id)
+            writer.close()
+
+    async def _answer(self, writer: asyncio.StreamWriter, message: Dict[str, Any]) -> None:
+        # Requests addressed to the broker itself.
+        response = {"op": "response", "id": message["id"], "source": None, "target": message["source"]}
+        if message["name"] == "clusters":
+            response["data"] = self.clusters
+        else:
+            response["error"] = "The broker has no handler named %r." % message["name"]
+        await self._send(writer, response)
+
+    async def _broadcast(self, sender: asyncio.StreamWriter, message: Dict[str, Any]) -> None:
+        for writer in list(self._clusters.values()):
+            if writer is not sender:
+                try:
+                    await self._send(writer, message)
+                except ConnectionError:
+                    pass
+
+    async def _forward(self, writer: asyncio.StreamWriter, message: Dict[str, Any]) -> None:
+        destination = self._clusters.get(message["target"])
+        if destination is not None:
+            try:
+                return await self._send(destination, message)
+            except ConnectionError:
+                pass
+        if message["op"] == "request":
+            await self._send(
+                writer,
+                {
+                    "op": "response",
+                    "id": message["id"],
+                    "source": None,
+                    "target": message["source"],
+                    "error": "Cluster %s is not connected." % message["target"],
+                },
+            )
+
+
+class IPCClient:
+    """A cluster's connection to the broker."""
+
+    def __init__(self):
+        self.cluster_id = 0
+        self.handlers: Dict[str, Handler] = {}
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._listener: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None
+
+    def add_handler(self, name: str, handler: Handler) -> None:
+        """Registers a coroutine function that answers requests named ``name``. It is given the request's data."""
+        self.handlers[name] = handler
+
+    def remove_handler(self, name: str) -> None:
+        self.handlers.pop(name, None)
+
+    async def connect(self, path: Union[str, Path], cluster_id: int) -> None:
+        self.cluster_id = cluster_id
+        reader, self._writer = await asyncio.open_unix_connection(str(path), limit=MAX_MESSAGE_SIZE)
+        await self._send({"op": "hello", "source": cluster_id})
+        self._listener = asyncio.create_task(self._listen(reader))
+
+    async def close(self) -> None:
+        writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.close()
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+
+    async def _send(self, message: Dict[str, Any]) -> None:
+        self._writer.write(_encode(message))
+        await self._writer.drain()
+
+    async def _listen(self, reader: asyncio.StreamReader) -> None:
+        try:
+            async for message in _read_messages(reader):
+                if message["op"] == "response":
+                    future = self._pending.get(message["id"])
+                    if future is None or future.done():
+                        continue
+                    if message.get("error"):
+                        future.set_exception(IPCError(message["error"]))
+                    else:
+                        future.set_result(message.get("data"))
+                elif message["op"] in ("request", "broadcast"):
+                    task = asyncio.create_task(self._respond(message))
+                    # The event loop only keeps weak references to tasks.
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+        finally:
+            if self._writer is not None:  # close() clears this first, so this is an unexpected disconnect.
+                logger.warning("Lost connection to the IPC broker.")
+            self._writer = None
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(IPCError("Lost connection to the IPC broker."))
+
+    async def _handle_locally(self, name: str, data: Any) -> Any:
+        handler = self.handlers.get(name)
+        if handler is None:
+            raise IPCError("Cluster %s has no handler named %r." % (self.cluster_id, name))
+        return await handler(data)
+
+    async def _respond(self, message: Dict[str, Any]) -> None:
+        if message["op"] == "broadcast":
+            try:
+                await self._handle_locally(message["name"], message.get("data"))
+            except Exception:
+                logger.exception("IPC broadcast handler %r failed.", message["name"])
+            return
+
+        response = {"op": "response", "id": message["id"], "source": self.cluster_id, "target": message["source"]}
+        try:
+            response["data"] = await self._handle_locally(message["name"], message.get("data"))
+        except Exception as e:
+            logger.exception("IPC handler %r failed.", message["name"])
+            response["error"] = "%s: %s" % (e.__class__.__name__, e)
+        try:
+            await self._send(response)
+        except (ConnectionError, AttributeError):
+            logger.warning("Could not send the response to IPC request %r.", message["name"])
+
+    async def request(self, name: str, data: Any = None, *, target: Optional[int], timeout: float = 10.0) -> Any:
+        """
+        Sends a request to a cluster and waits for its response.
+
+        Args:
+            name: The name of the handler to call.
+            data: JSON-serialisable data to pass to the handler.
+            target: The ID of the cluster to send the request to, or None to ask the broker.
+            timeout: How long to wait for a response, in seconds.
+
+        Raises:
+            IPCError: The request could not be delivered, or the handler raised an error.
+            asyncio.TimeoutError: No response arrived in time.
+        """
+        if target == self.cluster_id:
+            return await asyncio.wait_for(self._handle_locally(name, data), timeout)
+        if not self.connected:
+            raise IPCError("This process is not part of a cluster.")
+
+        request_id = uuid.uuid4().hex
+        future = self._pending[request_id] = asyncio.get_running_loop().create_future()
+        try:
+            await self._send(
+                {
+                    "op": "request",
+                    "id": request_id,
+                    "source": self.cluster_id,
+                    "target": target,
+                    "name": name,
+                    "data": data,
+                }
+            )
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def broadcast(self, name: str, data: Any = None) -> None:
+        """
+        Notifies every other cluster, without waiting for them to act on it.
+
+        Delivery is best-effort: failures are logged, not raised, as a missed notification must never break the
+        command that sent it. Does nothing outside of a cluster.
+        """
+        if not self.connected:
+            return
+        try:
+            await self._send({"op": "broadcast", "source": self.cluster_id, "name": name, "data": data})
+        except (ConnectionError, AttributeError):
+            logger.warning("Could not broadcast %r over IPC.", name, exc_info=True)
+
+    async def clusters(self, *, timeout: float = 10.0) -> List[int]:
+        """Returns the IDs of every connected cluster."""
+        if not self.connected:
+            return [self.cluster_id]
+        return await self.request("clusters", target=None, timeout=timeout)
+
+    async def request_all(self, name: str, data: Any = None, *, timeout: float = 10.0) -> Dict[int, Any]:
+        """
+        Sends a request to every cluster at once and waits for all the responses.
+
+        Returns:
+            Each cluster's response, keyed by cluster ID. Clusters that failed or timed out map to the exception.
+        """
+        cluster_ids = await self.clusters(timeout=timeout)
+        results = await asyncio.gather(
+            *(self.request(name, data, target=cluster_id, timeout=timeout) for cluster_id in cluster_ids),
+            return_exceptions=True,
+        )
+        return dict(zip(cluster_ids, results))
+
+
+ipc = IPCClient()
@@ -0,0 +1,135 @@
+"""
+Banning and kicking many users at once, e.g. to clear out a raid.
+
+Bans go through discord's bulk ban endpoint, up to 200 users per request, a couple of requests at a time. Discord has no
+bulk kick, so kicks are sent one per member, a few at a time. py-cord waits out any rate limits it hits, so the
+concurrency limits only decide how much work is queued up for it.
+"""
+import asyncio
+import datetime
+import re
+from typing import Iterable, List, Optional, Set
+
+import discord
+
+__all__ = ("parse_user_ids", "members_joined_within", "MassActionResult", "mass_ban", "mass_kick")
+
+BULK_BAN_LIMIT = 200
+USER_ID = re.compile(r"(?<!\d)\d{15,20}(?!\d)")  # bare IDs and the IDs in mentions (<@123...>)
+
+
+def parse_user_ids(text: str) -> List[int]:
+    """Finds every user ID (or mention) in some text, in the order they first appear."""
+    return list(dict.fromkeys(int(match.group(0)) for match in USER_ID.finditer(text)))
+
+
+async def members_joined_within(guild: discord.Guild, seconds: float) -> List[discord.Member]:
+    """Returns the members that joined in the last ``seconds`` seconds, newest first."""
+    if not guild.chunked:
+        await guild.chunk()
+    since = discord.utils.utcnow() - datetime.timedelta(seconds=seconds)
+    members = [member for member in guild.members if member.joined_at is not None and member.joined_at >= since]
+    members.sort(key=lambda member: member.joined_at, reverse=True)
+    return members
+
+
+class MassActionResult:
+    def __init__(self):
+        self.succeeded: List[int] = []  # user IDs, in the order they were given
+        self.failed: List[int] = []
+        self.error: Optional[Exception] = None  # what stopped the rest of the action, e.g. discord.Forbidden
+
+
+async def mass_ban(
+    guild: discord.Guild,
+    user_ids: Iterable[int],
+    *,
+    reason: Optional[str] = None,
+    delete_message_seconds: int = 0,
+    concurrency: int = 2,
+) -> MassActionResult:
+    """
+    Bans users by ID, whether or not they're in the guild.
+
+    If a request fails with an error such as discord.Forbidden, the requests that haven't started yet are skipped and
+    the error is kept in the result. Users banned by the requests that did go through are still in ``succeeded``.
+
+    Args:
+        guild: The guild to ban them from.
+        user_ids: The users to ban.
+        reason: The audit log reason, shared by every ban.
+        delete_message_seconds: How many seconds worth of their recent messages to delete.
+        concurrency: How many bulk ban requests to have in progress at once.
+    """
+    users = [discord.Object(id=user_id) for user_id in user_ids]
+    limit = asyncio.Semaphore(concurrency)
+    result = MassActionResult()
+
+    async def ban_chunk(chunk: List[discord.Object]) -> Set[int]:
+        async with limit:
+            if result.error is not None:
+                return set()
+            try:
+                banned, _ = await guild.bulk_ban(*chunk, reason=reason, delete_message_seconds=delete_message_seconds)
+            except discord.Forbidden as e:
+                result.error = e
+                return set()
+            except discord.HTTPException:
+                return set()  # raised when none of them could be banned, e.g. if they're all banned already
+            return {user.id for user in banned}
+
+    chunks = [users[start : start + BULK_BAN_LIMIT] for start in range(0, len(users), BULK_BAN_LIMIT)]
+    tasks = [asyncio.ensure_future(ban_chunk(chunk)) for chunk in chunks]
+    try:
+        outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    banned: Set[int] = set()
+    for outcome in outcomes:
+        if isinstance(outcome, Exception):
+            result.error = result.error or outcome  # e.g. a connection error
+        elif isinstance(outcome, BaseException):
+            raise outcome
+        else:
+            banned |= outcome
+    for user in users:
+        (result.succeeded if user.id in banned else result.failed).append(user.id)
+    return result
+
+
+async def mass_kick(
+    members: Iterable[discord.Member], *, reason: Optional[str] = None, concurrency: int = 5
+) -> MassActionResult:
+    """
+    Kicks members.
+
+    Args:
+        members: The members to kick.
+        reason: The audit log reason, shared by every kick.
+        concurrency: How many kicks to have in progress at once.
+    """
+    members = list(members)
+    limit = asyncio.Semaphore(concurrency)
+
+    async def kick(member: discord.Member) -> bool:
+        async with limit:
+            try:
+                await member.kick(reason=reason)
+            except discord.HTTPException:
+                # Usually because they left already, or have a higher role than the bot.
+                return False
+            return True
+
+    tasks = [asyncio.ensure_future(kick(member)) for member in members]
+    try:
+        kicked = await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    result = MassActionResult()
+    for member, ok in zip(members, kicked):
+        (result.succeeded if ok else result.failed).append(member.id)
+    return result
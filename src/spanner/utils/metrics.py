@@ -0,0 +1,231 @@
+"""
+A small metrics registry, exposed in the Prometheus text format over HTTP.
+
+Metrics are either updated as things happen (counters, histograms and settable gauges), or read when the endpoint is
+scraped (gauges given a function). The endpoint is only started if the ``metrics_port`` config key is set, and it only
+listens on localhost.
+"""
+import logging
+import math
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from aiohttp import web
+
+__all__ = (
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "MetricsRegistry",
+    "registry",
+    "commands_total",
+    "command_duration",
+    "db_query_duration",
+    "event_loop_lag",
+    "event_loop_blocks_total",
+    "start_http_server",
+)
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+# Functions given to gauges return either a single value, or a value for each set of label values.
+GaugeFunction = Callable[[], Union[float, Dict[LabelValues, float]]]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    escaped = (
+        str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for value in values
+    )
+    return "{" + ",".join('%s="%s"' % (name, value) for name, value in zip(names, escaped)) + "}"
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError("%s expects the labels %r, got %r." % (self.name, self.labelnames, tuple(labels)))
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterable[Tuple[str, Sequence[str], LabelValues, float]]:
+        """Yields (metric name, label names, label values, value) for every sample."""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = ["# HELP %s %s" % (self.name, self.documentation), "# TYPE %s %s" % (self.name, self.type)]
+        for name, labelnames, values, value in self.samples():
+            lines.append("%s%s %s" % (name, _format_labels(labelnames, values), _format_value(value)))
+        return lines
+
+
+class Counter(_Metric):
+    """A value that only ever goes up, such as the number of commands run. Names should end in ``_total``."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in list(self._values.items()):
+            yield self.name, self.labelnames, key, value
+
+
+class Gauge(_Metric):
+    """A value that can go up and down, either set directly or read from a function whenever it's scraped."""
+
+    type = "gauge"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), function: Optional[GaugeFunction] = None
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self.function = function
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: GaugeFunction) -> None:
+        self.function = function
+
+    def samples(self):
+        values = self._values
+        if self.function is not None:
+            try:
+                result = self.function()
+            except Exception:
+                logger.warning("Failed to collect the %s metric.", self.name, exc_info=True)
+                return
+            values = result if isinstance(result, dict) else {(): result}
+        for key, value in list(values.items()):
+            if value is not None:
+                yield self.name, self.labelnames, tuple(map(str, key)), value
+
+
+class Histogram(_Metric):
+    """Counts observations (such as durations, in seconds) into cumulative buckets."""
+
+    type = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> ([count per bucket, plus +Inf], sum)
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = entry
+        counts[bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def samples(self):
+        for key, (counts, total) in list(self._values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                yield self.name + "_bucket", (*self.labelnames, "le"), (*key, _format_value(bound)), cumulative
+            yield self.name + "_sum", self.labelnames, key, total[0]
+            yield self.name + "_count", self.labelnames, key, cumulative
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self.metrics:
+            raise ValueError("A metric named %r is already registered." % metric.name)
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), function: Optional[GaugeFunction] = None
+    ) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+commands_total = registry.counter(
+    "spanner_commands_total", "Commands invoked, by command, type and outcome.", ("command", "type", "status")
+)
+command_duration = registry.histogram(
+    "spanner_command_duration_seconds", "How long commands took to run, by command and type.", ("command", "type")
+)
+db_query_duration = registry.histogram(
+    "spanner_db_query_duration_seconds", "How long database queries took, by kind of query.", ("operation",)
+)
+event_loop_lag = registry.histogram(
+    "spanner_event_loop_lag_seconds",
+    "How late the event loop ran a timer scheduled by the watchdog.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+event_loop_blocks_total = registry.counter(
+    "spanner_event_loop_blocks_total", "Times the event loop was blocked for longer than the watchdog's threshold."
+)
+
+
+async def _handle_metrics(_: web.Request) -> web.Response:
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_http_server(port: int, host: str = "127.0.0.1") -> web.AppRunner:
+    """Serves the registry's metrics on ``http://<host>:<port>/metrics``. Call ``cleanup()`` on the result to stop."""
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Serving metrics on http://%s:%d/metrics", host, port)
+    return runner
@@ -0,0 +1,173 @@
+"""
+A sampling profiler for the event loop thread and executor threads.
+
+A daemon thread looks at every profiled thread's current stack (with ``sys._current_frames()``) a fixed number of
+times a second, and counts how often each stack is seen. Nothing is traced between samples, so the overhead depends
+only on the sampling rate, and is low enough to profile production for a few minutes at a time. While a coroutine is
+running, its frames are part of the event loop thread's stack, so CPU-heavy coroutines show up like any function.
+
+Results can be exported as collapsed stacks (for flamegraph.pl and most flame graph tools), or as a speedscope file
+(https://www.speedscope.app).
+"""
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from types import CodeType
+from typing import Dict, Optional, Tuple
+
+__all__ = ("SamplingProfiler",)
+
+# Threads with these name prefixes are profiled along with the event loop thread.
+EXECUTOR_THREAD_PREFIXES = ("executor-", "asyncio_", "ThreadPoolExecutor")
+MAX_DEPTH = 128
+
+
+class SamplingProfiler:
+    def __init__(self, rate: float = 100.0):
+        """
+        Args:
+            rate: How many times a second to sample the stacks.
+        """
+        if not 0 < rate <= 1000:
+            raise ValueError("The sampling rate must be between 0 and 1000 samples per second.")
+        self.interval = 1 / rate
+        # (thread name, code objects from outermost to innermost) -> times seen
+        self.samples: Counter[Tuple[str, Tuple[CodeType, ...]]] = Counter()
+        self.sample_count = 0
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+        self.overhead = 0.0  # seconds spent taking samples
+        self._loop_thread: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Starts sampling. Call this from the event loop thread, which is always profiled."""
+        if self._thread is not None:
+            raise RuntimeError("This profiler has already been started.")
+        self._loop_thread = threading.get_ident()
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="spanner-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.stopped_at = time.perf_counter()
+
+    @staticmethod
+    def _function_name(code: CodeType) -> str:
+        return getattr(code, "co_qualname", code.co_name)  # co_qualname is new in 3.11
+
+    def _thread_names(self) -> Dict[int, str]:
+        names = {}
+        for thread in threading.enumerate():
+            if thread.ident == self._loop_thread:
+                names[thread.ident] = "event loop"
+            elif thread.name.startswith(EXECUTOR_THREAD_PREFIXES):
+                names[thread.ident] = thread.name
+        return names
+
+    def _sample(self, thread_names: Dict[int, str]) -> None:
+        for ident, frame in sys._current_frames().items():
+            name = thread_names.get(ident)
+            if name is None:
+                continue
+            # Only code objects are kept while sampling. Turning them into names is left until the results are exported.
+            stack = []
+            while frame is not None and len(stack) < MAX_DEPTH:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            stack.reverse()
+            self.samples[name, tuple(stack)] += 1
+
+    def _run(self) -> None:
+        thread_names = self._thread_names()
+        names_refreshed = time.perf_counter()
+        next_sample = time.perf_counter()
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            if start - names_refreshed >= 1:  # executor threads come and go
+                thread_names = self._thread_names()
+                names_refreshed = start
+            self._sample(thread_names)
+            self.sample_count += 1
+            end = time.perf_counter()
+            self.overhead += end - start
+            next_sample += self.interval
+            # If sampling falls behind, skip ahead rather than sampling in a burst to catch up.
+            next_sample = max(next_sample, end)
+            self._stop.wait(next_sample - end)
+
+    @property
+    def duration(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.stopped_at or time.perf_counter()) - self.started_at
+
+    def collapsed(self) -> str:
+        """Returns the samples as collapsed stacks: one ``thread;outer;...;inner count`` line per unique stack."""
+        labels = {}
+        lines = []
+        for (thread, stack), count in self.samples.most_common():
+            for code in stack:
+                if code not in labels:
+                    labels[code] = "%s (%s:%d)" % (self._function_name(code), code.co_filename, code.co_firstlineno)
+            lines.append("%s %d" % (";".join((thread, *(labels[code] for code in stack))), count))
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name: str = "spanner") -> str:
+        """Returns the samples as a speedscope JSON file, with one profile per thread. Weights are in milliseconds."""
+        frames = []
+        frame_indexes: Dict[CodeType, int] = {}
+        profiles: Dict[str, dict] = {}
+        weight = self.interval * 1000
+        for (thread, stack), count in self.samples.items():
+            profile = profiles.get(thread)
+            if profile is None:
+                profile = profiles[thread] = {
+                    "type": "sampled",
+                    "name": thread,
+                    "unit": "milliseconds",
+                    "startValue": 0,
+                    "endValue": 0,
+                    "samples": [],
+                    "weights": [],
+                }
+            indexes = []
+            for code in stack:
+                index = frame_indexes.get(code)
+                if index is None:
+                    index = frame_indexes[code] = len(frames)
+                    frames.append(
+                        {"name": self._function_name(code), "file": code.co_filename, "line": code.co_firstlineno}
+                    )
+                indexes.append(index)
+            profile["samples"].append(indexes)
+            profile["weights"].append(count * weight)
+            profile["endValue"] += count * weight
+
+        event_loop = list(profiles).index("event loop") if "event loop" in profiles else 0
+        return json.dumps(
+            {
+                "$schema": "https://www.speedscope.app/file-format-schema.json",
+                "name": name,
+                "activeProfileIndex": event_loop,
+                "exporter": "spanner",
+                "shared": {"frames": frames},
+                "profiles": list(profiles.values()),
+            }
+        )
+
+    def summary(self) -> str:
+        if not self.sample_count:
+            return "No samples taken."
+        return "%d samples over %.1fs (%.0f/s), %.2f%% of one core spent sampling." % (
+            self.sample_count,
+            self.duration,
+            self.sample_count / self.duration,
+            self.overhead / self.duration * 100,
+        )
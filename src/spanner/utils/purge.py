@@ -0,0 +1,281 @@
+"""
+Bulk message deletion.
+
+Purger streams a channel's history page by page and deletes matching messages while it carries on reading, instead of
+collecting everything first. Matches are deleted in bulk batches of up to 100, a few batches at a time. Messages older
+than 14 days can't be bulk deleted, so they're deleted one by one (also a few at a time). py-cord waits out any rate
+limits it hits, so the concurrency limits only decide how much work is queued up for it.
+
+Content patterns come from users, and a pathological one can backtrack for minutes on a single message. They're run
+in a worker process a page at a time instead of on the event loop, and the worker is killed if a page takes too long.
+"""
+import asyncio
+import datetime
+import multiprocessing
+import re
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Awaitable, Callable, Iterable, List, Optional, Sequence, Set, Union
+
+import discord
+
+__all__ = ("PatternTimeout", "PatternMatcher", "PurgeFilter", "PurgeResult", "Purger")
+
+BULK_DELETE_LIMIT = 100
+# Discord refuses to bulk delete messages older than 14 days. The margin covers clock drift and slow batches.
+BULK_DELETE_MAX_AGE = datetime.timedelta(days=14) - datetime.timedelta(minutes=5)
+PATTERN_TIMEOUT = 5.0  # seconds a content pattern gets to search one page of messages
+
+Snowflake = Union[discord.abc.Snowflake, datetime.datetime]
+
+
+def _search_all(pattern: str, contents: List[str]) -> List[bool]:
+    # Runs in the worker process. re caches compiled patterns, so this only compiles once per worker.
+    compiled = re.compile(pattern)
+    return [compiled.search(content) is not None for content in contents]
+
+
+class PatternTimeout(Exception):
+    """The content pattern took too long to search a page of messages."""
+
+
+class PatternMatcher:
+    """
+    Searches message content for a regular expression in a worker process of its own.
+
+    The worker isn't shared with the ``cpu`` executor pool, since a stuck search can only be stopped by killing the
+    process running it.
+
+    Args:
+        pattern: The regular expression. Raises re.error if it's invalid.
+        timeout: How many seconds one call to search() may take before the worker is killed.
+    """
+
+    def __init__(self, pattern: str, *, timeout: float = PATTERN_TIMEOUT):
+        self.pattern = re.compile(pattern).pattern
+        self.timeout = timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    async def search(self, contents: List[str]) -> List[bool]:
+        """
+        Returns whether each of ``contents`` contains a match.
+
+        Raises:
+            PatternTimeout: The search took longer than ``timeout`` seconds, so the worker was killed.
+        """
+        loop = asyncio.get_running_loop()
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn"))
+            # Starts the worker outside of the timeout, since spawning it can take a while.
+            await loop.run_in_executor(self._executor, _search_all, self.pattern, [])
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(self._executor, _search_all, self.pattern, contents), self.timeout
+            )
+        except asyncio.TimeoutError:
+            self.close()
+            raise PatternTimeout(
+                "The pattern took longer than %s seconds to search %d messages." % (self.timeout, len(contents))
+            ) from None
+
+    def close(self) -> None:
+        """Stops the worker, even if it's in the middle of a search."""
+        if self._executor is None:
+            return
+        for process in list(self._executor._processes.values()):
+            process.terminate()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+
+class PurgeFilter:
+    """
+    Decides which messages to delete. Only the checks for the options given are run.
+
+    Args:
+        authors: Only delete messages by these user IDs.
+        bots: True to only delete messages by bots (and system messages), False to only delete messages by humans.
+        include_pinned: Whether pinned messages can be deleted.
+        content: A regular expression. Only delete messages whose content contains a match.
+    """
+
+    def __init__(
+        self,
+        *,
+        authors: Optional[Iterable[int]] = None,
+        bots: Optional[bool] = None,
+        include_pinned: bool = False,
+        content: Optional[str] = None,
+    ):
+        checks: List[Callable[[discord.Message], bool]] = []
+        if not include_pinned:
+            checks.append(lambda message: not message.pinned)
+        if authors is not None:
+            author_ids: Set[int] = set(authors)
+            checks.append(lambda message: message.author.id in author_ids)
+        if bots is not None:
+            checks.append(lambda message: (message.author.bot or message.author.system) is bots)
+        self.checks = tuple(checks)
+        self.matcher = PatternMatcher(content) if content is not None else None  # raises re.error if invalid
+
+    async def select(self, messages: Sequence[discord.Message]) -> List[discord.Message]:
+        """
+        Returns the messages to delete, in order. The content pattern is only run on messages that pass every other
+        check.
+
+        Raises:
+            PatternTimeout: The content pattern took too long.
+        """
+        selected = [message for message in messages if all(check(message) for check in self.checks)]
+        if self.matcher is None or not selected:
+            return selected
+        matches = await self.matcher.search([message.content for message in selected])
+        return [message for message, match in zip(selected, matches) if match]
+
+    def close(self) -> None:
+        if self.matcher is not None:
+            self.matcher.close()
+
+
+class PurgeResult:
+    def __init__(self):
+        self.scanned = 0
+        self.deleted = 0
+        self.failed = 0
+        self.authors: Counter = Counter()  # author ID -> messages deleted
+
+    def breakdown(self, limit: int = 10) -> str:
+        """Returns the authors with the most deleted messages, one per line."""
+        return "\n".join(
+            f"<@{author_id}>: {count:,} ({round(count / self.deleted * 100)}% of messages)"
+            for author_id, count in self.authors.most_common(limit)
+        )
+
+
+class Purger:
+    def __init__(
+        self,
+        channel: discord.abc.Messageable,
+        *,
+        limit: Optional[int],
+        check: Optional[PurgeFilter] = None,
+        before: Optional[Snowflake] = None,
+        after: Optional[Snowflake] = None,
+        reason: Optional[str] = None,
+        bulk_concurrency: int = 2,
+        single_concurrency: int = 5,
+    ):
+        """
+        Args:
+            channel: The channel to delete messages from.
+            limit: How many messages to look through (not how many to delete). None looks through all of them.
+            check: Decides which messages to delete. Defaults to every unpinned message.
+            before: Only look at messages before this message or time.
+            after: Only look at messages after this message or time.
+            reason: The audit log reason.
+            bulk_concurrency: How many bulk deletes to have in progress at once.
+            single_concurrency: How many single (old message) deletes to have in progress at once.
+        """
+        self.channel = channel
+        self.limit = limit
+        self.check = check or PurgeFilter()
+        self.before = before
+        self.after = after
+        self.reason = reason
+        self.result = PurgeResult()
+        self._bulk_limit = asyncio.Semaphore(bulk_concurrency)
+        self._single_limit = asyncio.Semaphore(single_concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+        self._batch: List[discord.Message] = []  # recent matches waiting for a full bulk delete
+
+    def _record(self, messages: List[discord.Message]) -> None:
+        self.result.deleted += len(messages)
+        self.result.authors.update(message.author.id for message in messages)
+
+    async def _delete_bulk(self, messages: List[discord.Message]) -> None:
+        async with self._bulk_limit:
+            try:
+                await self.channel.delete_messages(messages, reason=self.reason)
+            except discord.NotFound:
+                # Some were deleted by someone else first, so the batch was rejected. Fall back to deleting singly.
+                await asyncio.gather(*(self._delete_single(message) for message in messages))
+                return
+            except discord.Forbidden:
+                raise
+            except discord.HTTPException:
+                self.result.failed += len(messages)
+                return
+        self._record(messages)
+
+    async def _delete_single(self, message: discord.Message) -> None:
+        async with self._single_limit:
+            try:
+                await message.delete(reason=self.reason)
+            except discord.NotFound:
+                return
+            except discord.Forbidden:
+                raise
+            except discord.HTTPException:
+                self.result.failed += 1
+                return
+        self._record([message])
+
+    def _start(self, coroutine: Awaitable[None]) -> None:
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _reap(self) -> None:
+        # Surfaces errors (e.g. Forbidden) from finished deletes as soon as possible.
+        for task in [task for task in self._tasks if task.done()]:
+            task.result()
+
+    def _delete(self, messages: List[discord.Message]) -> None:
+        for message in messages:
+            if discord.utils.utcnow() - message.created_at > BULK_DELETE_MAX_AGE:
+                self._start(self._delete_single(message))
+            else:
+                self._batch.append(message)
+                if len(self._batch) == BULK_DELETE_LIMIT:
+                    self._start(self._delete_bulk(self._batch))
+                    self._batch = []
+
+    async def run(
+        self, progress: Optional[Callable[[PurgeResult], Awaitable[None]]] = None, progress_interval: float = 2.0
+    ) -> PurgeResult:
+        """
+        Deletes every matching message, calling ``progress`` with the running totals at most every
+        ``progress_interval`` seconds.
+
+        Raises:
+            discord.Forbidden: Missing permissions to read history or delete messages. Other deletes are cancelled.
+            PatternTimeout: The filter's content pattern took too long. Other deletes are cancelled.
+        """
+        page: List[discord.Message] = []
+        last_progress = time.monotonic()
+        try:
+            async for message in self.channel.history(limit=self.limit, before=self.before, after=self.after):
+                self.result.scanned += 1
+                page.append(message)
+                if len(page) < BULK_DELETE_LIMIT:
+                    continue
+
+                # Once per page of history.
+                self._delete(await self.check.select(page))
+                page = []
+                self._reap()
+                if progress is not None and time.monotonic() - last_progress >= progress_interval:
+                    last_progress = time.monotonic()
+                    await progress(self.result)
+
+            self._delete(await self.check.select(page))
+            if self._batch:
+                self._start(self._delete_bulk(self._batch))
+                self._batch = []
+            await asyncio.gather(*self._tasks)
+        finally:
+            self.check.close()
+            for task in self._tasks:
+                task.cancel()
+        return self.result
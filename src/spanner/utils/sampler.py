@@ -0,0 +1,116 @@
+"""
+A background sampler for system and process resource usage.
+
+psutil's CPU percentages are measured over an interval, and measuring on demand means sleeping for that interval
+(in an executor thread) every time. Instead, one daemon thread takes a cheap, non-blocking reading every few seconds
+and keeps the most recent readings in a ring buffer, which anything that wants resource usage can read instantly.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Deque, List, NamedTuple, Optional, Tuple
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+__all__ = ("Sample", "SystemSampler", "sampler")
+
+logger = logging.getLogger(__name__)
+
+
+class Sample(NamedTuple):
+    timestamp: float  # unix timestamp
+    cpu_total: float  # percent, across all cores
+    cpu_per_core: Tuple[float, ...]  # percent
+    cpu_process: float  # percent of one core
+    ram_used: int  # bytes
+    ram_total: int  # bytes
+    ram_process: int  # bytes (unique set size)
+    threads: int
+    disk_used: int  # bytes
+    disk_total: int  # bytes
+
+
+class SystemSampler:
+    def __init__(self, interval: float = 5.0, history: int = 720):
+        """
+        Args:
+            interval: How often to take a reading, in seconds.
+            history: How many readings to keep. The default keeps an hour's worth.
+        """
+        self.interval = interval
+        self.samples: Deque[Sample] = deque(maxlen=history)
+        self.disk_path = Path(__file__).drive or "/"
+        self._process = psutil.Process() if psutil else None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def available(self) -> bool:
+        return psutil is not None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if not self.available or self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="spanner-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _take_sample(self) -> Sample:
+        # With no interval, cpu_percent() compares against the previous call instead of sleeping.
+        per_core = tuple(psutil.cpu_percent(None, True))
+        ram = psutil.virtual_memory()
+        disk = psutil.disk_usage(self.disk_path)
+        with self._process.oneshot():
+            cpu_process = self._process.cpu_percent(None)
+            ram_process = self._process.memory_full_info().uss
+            threads = self._process.num_threads()
+        return Sample(
+            timestamp=time.time(),
+            cpu_total=round(sum(per_core) / len(per_core), 1),
+            cpu_per_core=per_core,
+            cpu_process=cpu_process,
+            ram_used=ram.used,
+            ram_total=ram.total,
+            ram_process=ram_process,
+            threads=threads,
+            disk_used=disk.used,
+            disk_total=disk.total,
+        )
+
+    def _run(self) -> None:
+        # The first CPU readings are always 0, as there's nothing to compare them with yet.
+        psutil.cpu_percent(None, True)
+        self._process.cpu_percent(None)
+        delay = min(self.interval, 1.0)
+        while not self._stop.wait(delay):
+            try:
+                self.samples.append(self._take_sample())
+            except Exception:
+                logger.exception("Failed to sample system metrics.")
+            delay = self.interval
+
+    def latest(self) -> Optional[Sample]:
+        """Returns the most recent reading, or None if there aren't any yet."""
+        try:
+            return self.samples[-1]
+        except IndexError:
+            return None
+
+    def since(self, timestamp: float) -> List[Sample]:
+        """Returns every reading taken at or after the given unix timestamp, oldest first."""
+        return [sample for sample in tuple(self.samples) if sample.timestamp >= timestamp]
+
+
+sampler = SystemSampler()
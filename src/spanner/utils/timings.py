@@ -0,0 +1,191 @@
+"""
+Per-command timing breakdowns.
+
+While a command runs, its CommandTiming is kept in a context variable, so database queries and REST calls made
+anywhere inside it (including in tasks it starts) are added to that command's breakdown. When the command finishes,
+its timings are recorded in per-command histograms, and invocations slower than the threshold are logged.
+"""
+import contextlib
+import logging
+import math
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+__all__ = ("LatencyHistogram", "CommandTiming", "CommandTimings", "current_timing", "timings")
+
+logger = logging.getLogger(__name__)
+
+current_timing: ContextVar[Optional["CommandTiming"]] = ContextVar("current_timing", default=None)
+
+
+class LatencyHistogram:
+    """
+    A fixed-precision latency histogram, in the style of HdrHistogram.
+
+    Values are recorded in microseconds, into buckets that are 2**-SUB_BUCKET_BITS (about 3%) wide relative to their
+    value, so memory stays small no matter how many values are recorded or how far apart they are, while percentiles
+    stay within ~3% of the true value.
+    """
+
+    SUB_BUCKET_BITS = 5
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+    def __init__(self):
+        self.counts: Dict[int, int] = defaultdict(int)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @classmethod
+    def _index(cls, micros: int) -> int:
+        if micros < cls.SUB_BUCKETS:
+            return micros
+        shift = micros.bit_length() - cls.SUB_BUCKET_BITS - 1
+        return (shift + 1) * cls.SUB_BUCKETS + (micros >> shift) - cls.SUB_BUCKETS
+
+    @classmethod
+    def _upper_bound(cls, index: int) -> int:
+        """The highest value, in microseconds, that falls into a bucket."""
+        if index < cls.SUB_BUCKETS:
+            return index
+        shift = index // cls.SUB_BUCKETS - 1
+        return ((index % cls.SUB_BUCKETS + cls.SUB_BUCKETS + 1) << shift) - 1
+
+    def record(self, seconds: float) -> None:
+        self.counts[self._index(max(0, int(seconds * 1_000_000)))] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, percent: float) -> float:
+        """Returns the given percentile (0-100) of the recorded values, in seconds."""
+        if not self.count:
+            return 0.0
+        wanted = max(1, math.ceil(self.count * percent / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= wanted:
+                return min(self._upper_bound(index) / 1_000_000, self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class CommandTiming:
+    """The timing breakdown of a single command invocation. All durations are in seconds."""
+
+    def __init__(self, command: str, kind: str):
+        self.command = command
+        self.kind = kind
+        self.started = time.perf_counter()
+        self.total: Optional[float] = None
+        self.first_response: Optional[float] = None
+        self.db_time = 0.0
+        self.db_queries = 0
+        self.rest_time = 0.0
+        self.rest_calls = 0
+
+    def responded(self) -> None:
+        if self.first_response is None:
+            self.first_response = time.perf_counter() - self.started
+
+    def describe(self) -> str:
+        first_response = "never" if self.first_response is None else "%.0fms" % (self.first_response * 1000)
+        return "%s command %r took %.0fms (first response %s, %d DB queries %.0fms, %d REST calls %.0fms)" % (
+            self.kind,
+            self.command,
+            (self.total or 0) * 1000,
+            first_response,
+            self.db_queries,
+            self.db_time * 1000,
+            self.rest_calls,
+            self.rest_time * 1000,
+        )
+
+
+class CommandStats:
+    def __init__(self):
+        self.total = LatencyHistogram()
+        self.first_response = LatencyHistogram()
+        self.db_time = 0.0
+        self.rest_time = 0.0
+
+
+class CommandTimings:
+    def __init__(self, *, slow_threshold: float = 2.0, slow_log_size: int = 100):
+        """
+        Args:
+            slow_threshold: Invocations that take at least this many seconds are logged as slow.
+            slow_log_size: How many of the most recent slow invocations to keep.
+        """
+        self.slow_threshold = slow_threshold
+        self.stats: Dict[Tuple[str, str], CommandStats] = defaultdict(CommandStats)
+        self.slow_log: Deque[Tuple[float, CommandTiming]] = deque(maxlen=slow_log_size)
+
+    @contextlib.contextmanager
+    def track(self, command: str, kind: str) -> Iterator[CommandTiming]:
+        """Times the body of the with statement as an invocation of ``command``."""
+        timing = CommandTiming(command, kind)
+        token = current_timing.set(timing)
+        try:
+            yield timing
+        finally:
+            current_timing.reset(token)
+            timing.total = time.perf_counter() - timing.started
+            self.record(timing)
+
+    def record(self, timing: CommandTiming) -> None:
+        stats = self.stats[timing.command, timing.kind]
+        stats.total.record(timing.total)
+        if timing.first_response is not None:
+            stats.first_response.record(timing.first_response)
+        stats.db_time += timing.db_time
+        stats.rest_time += timing.rest_time
+        if timing.total >= self.slow_threshold:
+            self.slow_log.append((time.time(), timing))
+            logger.warning("Slow command: %s.", timing.describe())
+
+    def slowest(self, limit: int = 10, percentile: float = 99) -> List[Tuple[str, str, CommandStats]]:
+        """Returns (command, kind, stats) for the commands with the highest latency at the given percentile."""
+        ranked = sorted(self.stats.items(), key=lambda item: item[1].total.percentile(percentile), reverse=True)
+        return [(command, kind, stats) for (command, kind), stats in ranked[:limit]]
+
+    @staticmethod
+    def on_query(_: str, duration: float) -> None:
+        """A database.connection query listener that adds queries to the running command's breakdown."""
+        timing = current_timing.get()
+        if timing is not None:
+            timing.db_queries += 1
+            timing.db_time += duration
+
+    @staticmethod
+    def wrap_request(request: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        """
+        Wraps a discord REST request function (taking a Route first), adding each call to the running command's
+        breakdown. Interaction callbacks and sent messages count as the command's first response.
+        """
+
+        @wraps(request)
+        async def wrapper(route, *args, **kwargs):
+            timing = current_timing.get()
+            if timing is None:
+                return await request(route, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return await request(route, *args, **kwargs)
+            finally:
+                timing.rest_calls += 1
+                timing.rest_time += time.perf_counter() - start
+                if route.path.endswith("/callback") or (route.method == "POST" and route.path.endswith("/messages")):
+                    timing.responded()
+
+        return wrapper
+
+
+timings = CommandTimings()
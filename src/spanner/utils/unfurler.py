@@ -0,0 +1,245 @@
+"""
+Resolves invite shortlinks (dsc.gg, invite.gg, bit.ly, ...) to the discord server or bot invite they point to.
+
+Resolved URLs are cached, including URLs that couldn't be resolved (for a shorter time), so popular shortlinks are
+only looked up once in a while. Concurrent lookups of the same URL share one resolution. Pages are streamed, and only
+the first ``max_body`` characters are read, as the invite is always near the top of the page. The body is scanned as it
+arrives, and reading stops as soon as an invite is found or every tag worth looking at has been seen.
+"""
+import asyncio
+import re
+from html.parser import HTMLParser
+from typing import Dict, Iterable, List, NamedTuple, Optional, Union
+from urllib.parse import urlparse
+
+import discord
+import httpx
+
+from .cache import TTLCache
+from .utils import session
+
+__all__ = ("UnfurlResult", "InviteUnfurler", "SERVER_INVITE", "BOT_INVITE", "SERVICES", "unfurler")
+
+SERVER_INVITE = re.compile(r"(?:https?://)?discord(app)?\.(com|gg)(/invite)?/.{5,16}")
+BOT_INVITE = re.compile(r"(?:https?://)?discord.com/oauth2/authorize\?.*(?P<client_id>client_id=\d+).*")
+DIRECT_INVITES = {"bot": BOT_INVITE, "server": SERVER_INVITE}
+MAX_REDIRECTS = 5
+_CLIENT_ID = re.compile(r"client_id=(\d+)")
+
+# Dear maintainers,
+# This tuple is designed to fully automate and streamline the gathering of scraped data.
+# If it has to have its own function, define it in a lambda. If you cannot do that, the service cannot be used.
+# Make sure that:
+# * The `domain` regex returns a URl that can be parsed.
+# * The `invites.server` regex has a `url` group in it that returns the invite URL, or matches only the URL
+# * The `invites.bot` regex has a `client_id` group in it that returns the client ID
+# * The `invites.server` regex returns a discord(app).gg|com URL
+# * Do not include an invite type in the `invites` dictionary if that domain does not support that type of invite.
+# * `query_tags.names` is as minimal as possible. The more we search, the more performance hit we take.
+# * `query_tags.max_search` is also as minimal as can be, if not exact. Again, fewer iterations = more performance
+SERVICES = (
+    {
+        "domain": re.compile(r"(https?://)?dsc.(gg|lol)/.+"),
+        "invites": {
+            "server": re.compile(r"window\.location\.href(\s)?=(\s)?\"(?P<url>%s)\"" % SERVER_INVITE.pattern),
+            "bot": re.compile(r"window\.location\.href\s?=\s?\"(?P<url>%s)\"" % BOT_INVITE.pattern),
+        },
+        "query_tags": {"names": ("script",), "max_search": 3},
+    },
+    {
+        "domain": re.compile(r"(https?://)?invite.gg/.+"),
+        "invites": {"server": re.compile(r"href=([\"'])(?P<url>%s)([\"'])" % SERVER_INVITE.pattern)},
+        "query_tags": {"names": ("a",), "max_search": 2},
+    },
+    {
+        "domain": re.compile(r"(https?://)?bit.ly/.+"),
+        "trust_status": (301, 302, 307, 308),
+        "invites": {"server": SERVER_INVITE, "bot": BOT_INVITE},
+        "query_tags": {
+            # backup
+            "names": ("a",),
+            "max_search": 3,  # there's only one A tag there
+        },
+    },
+)
+
+
+class UnfurlResult(NamedTuple):
+    kind: Optional[str]  # "server", "bot", or None if the URL didn't lead to an invite
+    url: Optional[str] = None  # the invite URL
+    client_id: Optional[int] = None  # the bot's ID, for bot invites
+
+    @classmethod
+    def from_match(cls, kind: str, match: re.Match) -> "UnfurlResult":
+        url = match.groupdict().get("url") or match.group(0)
+        client_id = None
+        if kind == "bot":
+            client_id = int(_CLIENT_ID.search(url).group(1))
+        return cls(kind, url, client_id)
+
+
+NOT_AN_INVITE = UnfurlResult(None)
+
+
+def _qualify(unsanitary_url: str) -> str:
+    return urlparse(unsanitary_url, "https").geturl()
+
+
+def _match_invite(url: str, invites: Dict[str, re.Pattern]) -> Optional[UnfurlResult]:
+    for invite_type, invite_regex in invites.items():
+        if _m := invite_regex.match(url):
+            return UnfurlResult.from_match(invite_type, _m)
+
+
+class TagScanner(HTMLParser):
+    """
+    Incrementally scans HTML for the first few tags with the given names, without building a document tree.
+
+    Each scanned tag gives its text (like BeautifulSoup's ``get_text(strip=True)``), followed by each of its
+    attributes written as ``name="value"``.
+    """
+
+    def __init__(self, tag_names: Iterable[str], max_per_tag: int):
+        super().__init__(convert_charrefs=True)
+        self.remaining: Dict[str, int] = {name: max_per_tag for name in tag_names}
+        self._found: List[str] = []
+        self._open: Optional[str] = None
+        self._depth = 0
+        self._text: List[str] = []
+        self._attributes: List[str] = []
+
+    @property
+    def done(self) -> bool:
+        """Whether every tag worth scanning has been seen."""
+        return self._open is None and not any(self.remaining.values())
+
+    def scan(self, chunk: str) -> List[str]:
+        """Feeds the next chunk of the document, returning the text and attributes of tags that finished in it."""
+        self.feed(chunk)
+        found, self._found = self._found, []
+        return found
+
+    def handle_starttag(self, tag, attrs):
+        if self._open is not None:
+            if tag == self._open:
+                self._depth += 1
+        elif self.remaining.get(tag):
+            self._open, self._depth, self._text = tag, 1, []
+            self._attributes = ['%s="%s"' % (name, value) for name, value in attrs if value is not None]
+
+    def handle_endtag(self, tag):
+        if tag == self._open:
+            self._depth -= 1
+            if not self._depth:
+                self.remaining[tag] -= 1
+                self._found.append("".join(self._text).strip())
+                self._found.extend(self._attributes)
+                self._open = None
+
+    def handle_data(self, data):
+        if self._open is not None:
+            self._text.append(data.strip())
+
+
+class InviteUnfurler:
+    def __init__(
+        self, *, cache_size: int = 1024, ttl: float = 3600.0, negative_ttl: float = 300.0, max_body: int = 64 * 1024
+    ):
+        """
+        Args:
+            cache_size: How many resolved URLs to keep.
+            ttl: How long to keep URLs that resolved to an invite, in seconds.
+            negative_ttl: How long to keep URLs that didn't resolve to an invite, or failed to load, in seconds.
+            max_body: The most characters of a page to read when looking for an invite in it.
+        """
+        self.negative_ttl = negative_ttl
+        self.max_body = max_body
+        # URL -> what it resolved to, or the error raised while loading it
+        self.cache: TTLCache[str, Union[UnfurlResult, httpx.HTTPError]] = TTLCache(max_size=cache_size, ttl=ttl)
+        self._resolving: Dict[str, asyncio.Task] = {}
+
+    async def unfurl(self, url: str) -> UnfurlResult:
+        """
+        Finds out which invite a URL leads to.
+
+        Raises:
+            httpx.HTTPError: The page the URL points to could not be loaded. This is cached like any other result.
+        """
+        url = _qualify(url)
+        direct = _match_invite(url, DIRECT_INVITES)
+        if direct is not None:
+            return direct
+
+        cached = self.cache.get(url)
+        if cached is None:
+            task = self._resolving.get(url)
+            if task is None:
+                task = self._resolving[url] = asyncio.create_task(self._resolve_and_cache(url))
+            # Shielded, so that one caller timing out doesn't cancel the lookup for everyone else waiting on it.
+            cached = await asyncio.shield(task)
+        if isinstance(cached, httpx.HTTPError):
+            raise cached
+        return cached
+
+    async def _resolve_and_cache(self, url: str) -> Union[UnfurlResult, httpx.HTTPError]:
+        try:
+            try:
+                result = await self._resolve(url)
+            except httpx.HTTPError as e:
+                result = e
+            ttl = None if isinstance(result, UnfurlResult) and result.kind is not None else self.negative_ttl
+            self.cache.set(url, result, ttl=ttl)
+            return result
+        finally:
+            self._resolving.pop(url, None)
+
+    async def _resolve(self, url: str) -> UnfurlResult:
+        service = discord.utils.find(lambda entry: entry["domain"].match(url), SERVICES)
+        if service is not None:
+            return await self._scrape(url, service)
+
+        # Not a known shortlink, so the only thing left to try is whether discord recognises it as an invite.
+        from bot.client import bot
+
+        try:
+            return UnfurlResult("server", (await bot.fetch_invite(url)).url)
+        except discord.HTTPException:
+            return NOT_AN_INVITE
+
+    async def _scrape(self, url: str, service: dict) -> UnfurlResult:
+        if service.get("trust_status") is not None:
+            head = await session.head(url)
+            if head.status_code in service["trust_status"] and head.headers.get("Location") is not None:
+                result = _match_invite(_qualify(head.headers["Location"]), service["invites"])
+                if result is not None:
+                    return result
+
+        for _ in range(MAX_REDIRECTS + 1):
+            async with session.stream("GET", url) as response:
+                if response.is_redirect and response.next_request is not None:
+                    # Redirects are checked before they're followed, as they often lead straight to the invite.
+                    url = str(response.next_request.url)
+                    result = _match_invite(url, DIRECT_INVITES)
+                    if result is not None:
+                        return result
+                    continue
+                response.raise_for_status()
+                return await self._scan(response, service)
+        raise httpx.TooManyRedirects("Exceeded maximum allowed redirects.", request=response.request)
+
+    async def _scan(self, response: httpx.Response, service: dict) -> UnfurlResult:
+        # Scanning a chunk is cheap enough to do on the event loop, and most pages are done within the first few.
+        scanner = TagScanner(service["query_tags"]["names"], service["query_tags"]["max_search"])
+        read = 0
+        async for chunk in response.aiter_text():
+            read += len(chunk)
+            for location in scanner.scan(chunk):
+                result = _match_invite(location, service["invites"])
+                if result is not None:
+                    return result
+            if scanner.done or read >= self.max_body:
+                break
+        return NOT_AN_INVITE
+
+
+unfurler = InviteUnfurler()
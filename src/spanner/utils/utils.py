@@ -1,18 +1,22 @@
 import asyncio
 import datetime
+import math
 import re
-import sys
 import traceback
 import typing
 import warnings
-from functools import partial
 from typing import Any, Callable, List, Optional, Iterable, Coroutine
 
 import discord
 import httpx
 from discord.ext import commands
 
+from database.indexes import error_ids
 from database.models import Guild, CommandType, Errors
+from .cache import TTLCache
+from .executors import executors
+from .http import HTTPClient
+from .ipc import ipc
 
 __all__ = (
     "case_type_names",
@@ -22,11 +26,14 @@ __all__ = (
     "get_guild",
     "get_prefix",
     "format_time",
+    "format_latency",
     "parse_time",
     "chunk",
     "SessionWrapper",
     "MaxConcurrency",
     "get_guild_config",
+    "update_guild_config",
+    "guild_config_cache",
     "load_colon_int_list",
     "TimeFormat",
     "avatar",
@@ -49,51 +56,48 @@ case_type_names = {
 
 class _SessionContainer:
     if typing.TYPE_CHECKING:
-        session: httpx.AsyncClient
-        get: "session.get"
-        post: "session.post"
-        put: "session.put"
-        delete: "session.delete"
+        get: "HTTPClient.get"
+        head: "HTTPClient.head"
+        post: "HTTPClient.post"
+        put: "HTTPClient.put"
+        delete: "HTTPClient.delete"
+        request: "HTTPClient.request"
 
     def __init__(self):
-        self.session = httpx.AsyncClient(
-            headers={
-                "User-Agent": f"DiscordBot (Spanner/v2; https://github.com/EEKIM10/spanner-v2; "
-                f"httpx/{httpx.__version__}); pycord/{discord.__version__}; "
-                f"python/{'.'.join(map(str, sys.version_info[:3]))})"
-            }
-        )
+        # Requests made through here are pooled, capped per host and retried (see utils.http).
+        self.http = HTTPClient()
+
+    @property
+    def session(self) -> httpx.AsyncClient:
+        return self.http.client
 
     def __getattr__(self, item):
         # hacky but who cares.
-        return getattr(self.session, item)
+        return getattr(self.http, item)
 
     def __del__(self):
         if warnings:
             warnings.simplefilter("ignore", Warning)
-            if self.session is not None and self.session.is_closed is False and asyncio is not None:
+            if not self.http.is_closed and asyncio is not None:
                 try:
-                    asyncio.create_task(self.session.aclose())
+                    asyncio.create_task(self.http.aclose())
                 except RuntimeError:
                     pass
             warnings.simplefilter("default", Warning)
 
     async def __aenter__(self):
-        return self.session
+        return self.http
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         pass  # We don't need to close the session
 
-    def __bool__(self):
-        return not self.session.is_closed
-
 
 class SessionWrapper:
     async def __aenter__(self):
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        await session.session.aclose()
+        await session.http.aclose()
 
 
 class Emojis:
@@ -119,23 +123,25 @@ class Emojis:
 
 
 session = _SessionContainer()
+# Guild configs are read by nearly every guild command, so they're kept in memory in front of the database.
+# Anything that writes to a Guild row must go through update_guild_config (or invalidate the entry) to keep this fresh.
+guild_config_cache: TTLCache[int, Guild] = TTLCache(max_size=2048, ttl=600.0)
 
 
-async def run_blocking(func: Callable, *args, **kwargs) -> Optional[Any]:
+async def run_blocking(func: Callable, *args, pool: str = "default", **kwargs) -> Optional[Any]:
     """
     Run a function in a blocking manner.
 
     Args:
         func: The function to run.
         *args: The positional arguments to pass to the function.
+        pool: The executor pool to run the function in: "default", "io" or "cpu" (see utils.executors).
         **kwargs: The keyword arguments to pass to the function.
 
     Returns:
         The return value of the function.
     """
-    from bot.client import bot
-
-    return await bot.loop.run_in_executor(None, partial(func, *args, **kwargs))
+    return await executors.get(pool).run(func, *args, **kwargs)
 
 
 async def get_guild_config(
@@ -155,7 +161,40 @@ async def get_guild_config(
     elif hasattr(guild_id, "id"):
         guild_id = guild_id.id
     guild_id: int
-    return (await Guild.objects.get_or_create({}, id=guild_id))[0]
+    guild = guild_config_cache.get(guild_id)
+    if guild is None:
+        guild = (await Guild.objects.get_or_create({}, id=guild_id))[0]
+        guild_config_cache.set(guild_id, guild)
+    return guild
+
+
+async def update_guild_config(guild: Guild, **values) -> Guild:
+    """
+    Updates a guild's configuration, keeping the guild config cache in sync.
+
+    Args:
+        guild: The guild database object to update.
+        **values: The fields to change.
+
+    Returns:
+        The updated guild database object
+    """
+    try:
+        await guild.update(**values)
+    except Exception:
+        guild_config_cache.invalidate(guild.id)
+        raise
+    guild_config_cache.set(guild.id, guild)
+    await ipc.broadcast("guild_config_changed", guild.id)
+    return guild
+
+
+async def _on_guild_config_changed(guild_id: int) -> None:
+    # Another cluster changed this guild's config, so our cached copy is stale.
+    guild_config_cache.invalidate(guild_id)
+
+
+ipc.add_handler("guild_config_changed", _on_guild_config_changed)
 
 
 async def get_prefix(_, message: discord.Message) -> List[str]:
@@ -185,6 +224,16 @@ def format_time(seconds: int):
     return ", ".join(values)
 
 
+def format_latency(seconds: float) -> str:
+    """
+    Formats a websocket latency for display. Shards that haven't heartbeated yet have an infinite latency, and the
+    average over no connected shards is NaN.
+    """
+    if not math.isfinite(seconds):
+        return "connecting"
+    return "%sms" % round(seconds * 1000, 2)
+
+
 class TimeFormat:
     # TIME_DEFINITE_REGEX = re.compile(
     #     r"^((?P<date>\d{1,2}/\d{1,2}/\d{2,4})?\sat\s)?(?P<time>\d{1,2}(:\d{2})?(am|pm)?)$"
@@ -244,7 +293,7 @@ def parse_time(time: str) -> int:
 
 @discord.utils.deprecated("get_guild_config")
 async def get_guild(guild: discord.Guild):
-    return await Guild.objects.get(id=guild.id)
+    return await get_guild_config(guild)
 
 
 @discord.utils.copy_doc(discord.utils.as_chunks)
@@ -288,6 +337,7 @@ async def create_error(context: typing.Union[commands.Context, discord.Applicati
         kwargs["command_type"] = cmd_type
 
     entry = await Errors.objects.create(**kwargs)
+    error_ids.add(entry.id)
     return entry
 
 
@@ -16,7 +16,7 @@ if TYPE_CHECKING:
     from database.models import Guild, ReactionRoles, ReactionRoleMenu
     from bot import Bot
 
-__all__ = ("YesNoPrompt", "StealEmojiView", "EmbedCreatorView", "PersistentReactionRolesView")
+__all__ = ("YesNoPrompt", "StealEmojiView", "EmbedCreatorView", "PersistentReactionRolesView", "LazyPaginator")
 
 
 class AutoDisableView(View):
@@ -60,6 +60,38 @@ class AutoDisableView(View):
         await super().on_error(error, item, interaction)
 
 
+class LazyPaginator(pages.Paginator):
+    """
+    A paginator that only builds each page the first time it's shown, and keeps the pages it has built.
+
+    ``get_page`` is called with the (zero-indexed) page number, and returns anything pages.Paginator accepts as a page.
+    """
+
+    def __init__(self, page_count: int, get_page: Callable[[int], Coroutine[Any, Any, Any]], **kwargs):
+        self.get_page = get_page
+        super().__init__([None] * page_count, **kwargs)
+
+    async def load_page(self, page_number: int) -> None:
+        if self.pages[page_number] is None:
+            self.pages[page_number] = await self.get_page(page_number)
+
+    async def goto_page(self, page_number: int = 0, *, interaction: discord.Interaction = None) -> None:
+        await self.load_page(page_number)
+        await super().goto_page(page_number, interaction=interaction)
+
+    async def respond(self, *args, **kwargs):
+        await self.load_page(self.current_page)
+        return await super().respond(*args, **kwargs)
+
+    async def send(self, *args, **kwargs):
+        await self.load_page(self.current_page)
+        return await super().send(*args, **kwargs)
+
+    async def edit(self, *args, **kwargs):
+        await self.load_page(self.current_page)
+        return await super().edit(*args, **kwargs)
+
+
 class TenMinuteTimeoutModal(discord.ui.Modal):
     def __init__(self, *children, title: str, custom_id: str = None, timeout: float = 600.0):
         super().__init__(*children, title=title, custom_id=custom_id, timeout=timeout)
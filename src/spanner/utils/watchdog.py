@@ -0,0 +1,113 @@
+"""
+Watches the event loop for blocking calls.
+
+A coroutine on the loop ticks every ``interval`` seconds and measures how late each tick was (the loop's lag). A
+separate thread watches those ticks, and when the loop hasn't ticked for ``threshold`` seconds, something is blocking
+it, so the thread captures the loop thread's stack while it's still blocked. Lag measurements and blocking events are
+kept in ring buffers, and exported as metrics.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+from . import metrics
+
+__all__ = ("BlockedLoop", "LoopWatchdog", "watchdog")
+
+logger = logging.getLogger(__name__)
+
+
+class BlockedLoop:
+    """A time the event loop was blocked for longer than the watchdog's threshold."""
+
+    def __init__(self, timestamp: float, stack: List[str]):
+        self.timestamp = timestamp  # unix timestamp of when the blocking was noticed
+        self.stack = stack  # formatted frames, outermost first
+        self.duration: Optional[float] = None  # seconds, set once the loop is running again
+
+    def describe(self) -> str:
+        duration = "still blocked" if self.duration is None else "blocked for %.0fms" % (self.duration * 1000)
+        return "Event loop %s at:\n%s" % (duration, "".join(self.stack))
+
+
+class LoopWatchdog:
+    def __init__(self, *, interval: float = 0.1, threshold: float = 0.25, history: int = 50, lag_history: int = 3000):
+        """
+        Args:
+            interval: How often the loop ticks, in seconds.
+            threshold: How long the loop can go without ticking before its stack is captured, in seconds.
+            history: How many blocking events to keep.
+            lag_history: How many lag measurements to keep. The default keeps five minutes' worth.
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self.blocks: Deque[BlockedLoop] = deque(maxlen=history)
+        self.lag: Deque[Tuple[float, float]] = deque(maxlen=lag_history)  # (unix timestamp, lag in seconds)
+        self._last_tick = time.monotonic()
+        self._blocked: Optional[BlockedLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """Starts watching the running event loop. Must be called from the loop's thread."""
+        if self.running:
+            return
+        self._loop_thread = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._task = asyncio.create_task(self._tick())
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="spanner-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _tick(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self._last_tick = time.monotonic()
+            self.lag.append((time.time(), lag))
+            metrics.event_loop_lag.observe(lag)
+
+            blocked = self._blocked
+            if blocked is not None:
+                self._blocked = None
+                blocked.duration = lag + self.interval
+                logger.warning("%s", blocked.describe())
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.threshold / 2):
+            if self._blocked is not None or time.monotonic() - self._last_tick < self.threshold + self.interval:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:  # the loop's thread has exited
+                return
+            blocked = BlockedLoop(time.time(), traceback.format_stack(frame))
+            self.blocks.append(blocked)
+            metrics.event_loop_blocks_total.inc()
+            self._blocked = blocked
+
+    def recent_lag(self, seconds: float = 60.0) -> List[float]:
+        """Returns the lag measurements (in seconds) taken in the last ``seconds`` seconds."""
+        since = time.time() - seconds
+        return [lag for timestamp, lag in tuple(self.lag) if timestamp >= since]
+
+
+watchdog = LoopWatchdog()
@@ -0,0 +1,38 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+# The bot imports its packages (database, utils, ...) from src/spanner.
+sys.path.insert(0, str(Path(__file__).parents[1] / "src" / "spanner"))
+
+from database.connection import create_database  # noqa: E402
+from database.migrations import run_migrations  # noqa: E402
+from database.models import models, use_database  # noqa: E402
+
+
+async def connect(url: str):
+    database = create_database(url)
+    use_database(database)
+    await models.create_all()
+    await database.connect()
+    await run_migrations(database)
+    return database
+
+
+@pytest.fixture
+def run_with_database(tmp_path):
+    """Returns a function that runs ``func(database)`` in a new event loop, connected to a fresh SQLite database."""
+
+    def run(func, name: str = "test.db"):
+        async def main():
+            database = await connect("sqlite:///%s" % (tmp_path / name))
+            try:
+                return await func(database)
+            finally:
+                await database.disconnect()
+
+        return asyncio.run(main())
+
+    return run
@@ -0,0 +1,59 @@
+import asyncio
+
+from database.models import Guild
+
+
+def test_other_tasks_are_not_rolled_back_with_a_transaction(run_with_database):
+    async def main(database):
+        await Guild.objects.count()  # the first query, which every task created after it used to share
+        started = asyncio.Event()
+        created = asyncio.Event()
+
+        async def rolled_back():
+            transaction = await database.transaction()
+            await Guild.objects.create(id=1)
+            started.set()
+            await asyncio.sleep(0.05)
+            await transaction.rollback()
+
+        async def independent():
+            await started.wait()
+            await Guild.objects.create(id=2)
+            created.set()
+
+        await asyncio.gather(rolled_back(), independent())
+        assert created.is_set()
+        return [guild.id for guild in await Guild.objects.all()]
+
+    assert run_with_database(main) == [2]
+
+
+def test_concurrent_tasks_use_separate_connections(run_with_database):
+    async def main(database):
+        await Guild.objects.create(id=1)
+
+        async def read():
+            # One query per task isn't enough to overlap, so each task holds a transaction-free connection open.
+            async with database.connection() as connection:
+                await connection.fetch_all("SELECT * FROM guilds")
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(read() for _ in range(20)))
+        return database._backend.pool.stats()
+
+    stats = run_with_database(main)
+    assert stats["opened"] > 1
+    assert stats["in_use"] == 0
+
+
+def test_transactions_in_different_tasks_do_not_nest(run_with_database):
+    async def main(database):
+        async def write(guild_id: int):
+            async with database.transaction():
+                await Guild.objects.create(id=guild_id)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(write(guild_id) for guild_id in range(10)))
+        return await Guild.objects.count()
+
+    assert run_with_database(main) == 10
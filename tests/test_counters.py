@@ -0,0 +1,34 @@
+import asyncio
+
+from database.counters import case_ids
+from database.models import Cases, CaseType, Guild
+
+
+def test_concurrent_allocations_across_guilds(run_with_database):
+    async def main(database):
+        guild = await Guild.objects.create(id=4)
+        for case_id in (3, 9):
+            await Cases.objects.create(id=case_id, guild=guild, moderator=1, target=2, reason="r", type=CaseType.BAN)
+        return await asyncio.gather(*(case_ids.allocate(guild_id, 5) for guild_id in (1, 2, 3, 4)))
+
+    assert run_with_database(main) == [range(1, 6), range(1, 6), range(1, 6), range(10, 15)]
+
+
+def test_concurrent_allocations_never_overlap(run_with_database):
+    async def main(database):
+        blocks = await asyncio.gather(
+            *(case_ids.allocate(guild_id, count) for guild_id in (1, 2) for count in (1, 3, 1, 7, 2) * 4)
+        )
+        return blocks[:20], blocks[20:]
+
+    for blocks in run_with_database(main):
+        numbers = sorted(number for block in blocks for number in block)
+        assert numbers == list(range(1, len(numbers) + 1))
+
+
+def test_counter_persists(run_with_database):
+    async def main(database):
+        await case_ids.allocate(1, 3)
+        return await case_ids.next(1)
+
+    assert run_with_database(main) == 4
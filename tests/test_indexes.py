@@ -0,0 +1,43 @@
+import random
+
+from database.indexes import IDIndex
+
+
+def brute_force(ids, query, limit):
+    ids = sorted(set(ids), reverse=True)
+    if not query:
+        return ids[:limit]
+    starts = [item for item in ids if str(item).startswith(query)]
+    contains = [item for item in ids if query in str(item) and item not in starts]
+    return (starts + contains)[:limit]
+
+
+def test_search_matches_brute_force():
+    generator = random.Random(0)
+    ids = [generator.randrange(1, 10**6) for _ in range(5000)] + list(range(1, 200))
+    index = IDIndex(ids)
+    for query in ["", "1", "12", "123", "99", "0", "05", "500000", "999999", "7"]:
+        assert index.search(query) == brute_force(ids, query, 25), query
+
+
+def test_search_ignores_non_numbers():
+    index = IDIndex([1, 2, 3])
+    assert index.search("abc") == []
+    assert index.search("١") == []  # a decimal digit, but not an ASCII one
+    assert index.search("  2 ") == [2]
+
+
+def test_substring_search_only_covers_the_newest_ids():
+    index = IDIndex([150, 250, 350, 1500], substring_limit=2)
+    assert index.search("50") == [1500, 350]
+
+
+def test_updates_are_searchable():
+    index = IDIndex([10, 20, 30])
+    index.search("0")  # builds the substring text
+    index.add(40)
+    index.discard(20)
+    assert index.search("0") == [40, 30, 10]
+    assert 20 not in index and 40 in index
+    assert index.newest(2) == [40, 30]
+    assert index.oldest == 10
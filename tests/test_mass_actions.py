@@ -0,0 +1,56 @@
+import asyncio
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+from cogs.official.mod import Moderation
+from database.counters import case_ids
+from database.models import Cases, CaseType, Guild
+from utils import mass_actions
+
+
+class FakeGuild:
+    def __init__(self, forbidden_chunks):
+        self.forbidden_chunks = forbidden_chunks
+        self.requests = 0
+
+    async def bulk_ban(self, *users, reason=None, delete_message_seconds=0):
+        self.requests += 1
+        await asyncio.sleep(0)
+        if self.requests in self.forbidden_chunks:
+            response = SimpleNamespace(status=403, reason="Forbidden")
+            raise discord.Forbidden(response, {"code": 50013, "message": "Missing Permissions"})
+        return users, []
+
+
+def test_mass_ban_keeps_chunks_banned_before_an_error():
+    guild = FakeGuild(forbidden_chunks={2})
+    user_ids = list(range(1, 1001))  # 5 chunks
+
+    result = asyncio.run(mass_actions.mass_ban(guild, user_ids, concurrency=1))
+    assert isinstance(result.error, discord.Forbidden)
+    assert result.succeeded == list(range(1, 201))
+    assert result.failed == list(range(201, 1001))
+    assert guild.requests == 2  # the chunks after the error aren't sent
+
+
+def test_mass_ban_without_errors():
+    result = asyncio.run(mass_actions.mass_ban(FakeGuild(forbidden_chunks=set()), range(1, 451)))
+    assert result.error is None
+    assert result.succeeded == list(range(1, 451))
+    assert result.failed == []
+
+
+def test_create_cases_rolls_back_case_numbers(run_with_database):
+    async def main(database):
+        guild = await Guild.objects.create(id=1)
+        with pytest.raises(Exception):
+            # The second target is missing, so inserting fails after the numbers were allocated.
+            await Moderation.create_cases(None, guild, [5, None], moderator=1, reason="raid", type=CaseType.BAN)
+        assert await Cases.objects.count() == 0
+
+        cases = await Moderation.create_cases(None, guild, [5, 6], moderator=1, reason="raid", type=CaseType.BAN)
+        return [case.id for case in cases], await case_ids.next(1)
+
+    assert run_with_database(main) == ([1, 2], 3)
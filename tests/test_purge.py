@@ -0,0 +1,71 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+from utils.purge import PatternMatcher, PatternTimeout, PurgeFilter, Purger
+
+
+class FakeChannel:
+    def __init__(self, messages):
+        self.messages = messages
+        self.deleted = []
+
+    async def history(self, limit=None, before=None, after=None):
+        for message in self.messages[:limit]:
+            yield message
+
+    async def delete_messages(self, messages, reason=None):
+        self.deleted.extend(messages)
+
+
+def fake_message(message_id: int, content: str):
+    author = SimpleNamespace(id=message_id % 3, bot=False, system=False)
+    return SimpleNamespace(
+        id=message_id, content=content, author=author, pinned=False, created_at=discord.utils.utcnow()
+    )
+
+
+def test_purge_matching():
+    messages = [fake_message(i, "spam" if i % 4 == 0 else "hello") for i in range(250)]
+    channel = FakeChannel(messages)
+
+    async def main():
+        return await Purger(channel, limit=None, check=PurgeFilter(content="^sp.m$")).run()
+
+    result = asyncio.run(main())
+    assert result.scanned == 250
+    assert result.deleted == 63
+    assert sorted(message.id for message in channel.deleted) == list(range(0, 250, 4))
+
+
+def test_slow_pattern_times_out_without_blocking_the_loop():
+    matcher = PatternMatcher("(a+)+$", timeout=0.5)
+
+    async def main():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.05)
+                ticks += 1
+
+        assert await matcher.search(["baa", "ccc"]) == [True, False]
+        ticker = asyncio.ensure_future(tick())
+        start = time.monotonic()
+        try:
+            with pytest.raises(PatternTimeout):
+                await matcher.search(["a" * 40 + "b"])
+        finally:
+            ticker.cancel()
+        return time.monotonic() - start, ticks
+
+    try:
+        elapsed, ticks = asyncio.run(main())
+    finally:
+        matcher.close()
+    assert elapsed < 5
+    assert ticks >= 5
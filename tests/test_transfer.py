@@ -0,0 +1,141 @@
+import asyncio
+import gzip
+import io
+import json
+import sqlite3
+
+import pytest
+
+from conftest import connect
+from database.counters import case_ids
+from database.models import Cases, CaseType, Guild
+from database.transfer import _is_integrity_error, copy_database, export_cases, import_cases
+
+
+async def add_cases(guild_id: int, count: int) -> Guild:
+    guild = await Guild.objects.create(id=guild_id)
+    for case_id in range(1, count + 1):
+        await Cases.objects.create(
+            id=case_id, guild=guild, moderator=1, target=100 + case_id, reason="reason %d" % case_id, type=CaseType.BAN
+        )
+    return guild
+
+
+def test_copy_database(tmp_path):
+    source_url = "sqlite:///%s" % (tmp_path / "source.db")
+    target_url = "sqlite:///%s" % (tmp_path / "target.db")
+
+    async def main():
+        source = await connect(source_url)
+        await add_cases(1, 120)
+        await add_cases(2, 3)
+        await source.disconnect()
+
+        copied = await copy_database(source_url, target_url, batch_size=50)
+        target = await connect(target_url)
+        try:
+            cases = await Cases.objects.filter(guild__id=1).order_by("id").all()
+            return copied, [case.id for case in cases], cases[-1].reason, await Guild.objects.count()
+        finally:
+            await target.disconnect()
+
+    copied, case_numbers, reason, guilds = asyncio.run(main())
+    assert copied["guilds"] == 2
+    assert copied["cases"] == 123
+    assert case_numbers == list(range(1, 121))
+    assert reason == "reason 120"
+    assert guilds == 2
+
+
+def test_copy_database_refuses_a_used_target(tmp_path):
+    source_url = "sqlite:///%s" % (tmp_path / "source.db")
+    target_url = "sqlite:///%s" % (tmp_path / "target.db")
+
+    async def main():
+        for url in (source_url, target_url):
+            database = await connect(url)
+            await add_cases(1, 1)
+            await database.disconnect()
+        await copy_database(source_url, target_url)
+
+    with pytest.raises(ValueError):
+        asyncio.run(main())
+
+
+def test_export_import_round_trip(run_with_database):
+    async def main(database):
+        await add_cases(1, 250)
+        exported = io.BytesIO()
+        assert await export_cases(1, exported, batch_size=100) == 250
+
+        exported.seek(0)
+        assert await import_cases(exported, guild_id=2, batch_size=100) == 250
+        copy = io.BytesIO()
+        await export_cases(2, copy)
+        return exported.getvalue(), copy.getvalue(), await case_ids.next(2)
+
+    original, copy, next_case = run_with_database(main)
+    original_lines = gzip.decompress(original).decode().splitlines()
+    copy_lines = gzip.decompress(copy).decode().splitlines()
+    assert json.loads(copy_lines[0])["guild"] == 2
+    assert len(copy_lines) == 251
+    # Cases copied into another guild in the same database get new entry IDs, but are otherwise identical.
+    for before, after in zip(original_lines[1:], copy_lines[1:]):
+        before, after = json.loads(before), json.loads(after)
+        assert before.pop("entry_id") != after.pop("entry_id")
+        assert before == after
+    assert next_case == 251
+
+
+def test_import_rejects_bad_files(run_with_database):
+    async def main(database):
+        await add_cases(1, 2)
+        exported = io.BytesIO()
+        await export_cases(1, exported)
+        lines = gzip.decompress(exported.getvalue()).decode().splitlines()
+
+        with pytest.raises(ValueError, match="not a case export"):
+            await import_cases(io.BytesIO(b"not gzip"), guild_id=2)
+        exported.seek(0)
+        with pytest.raises(ValueError, match="already has cases"):
+            await import_cases(exported, guild_id=1)
+        repeated = gzip.compress("\n".join([lines[0], lines[1], lines[1]]).encode())
+        with pytest.raises(ValueError):
+            await import_cases(io.BytesIO(repeated), guild_id=3)
+        # Nothing from the failed import is kept.
+        return await Cases.objects.filter(guild__id=3).count()
+
+    assert run_with_database(main) == 0
+
+
+def test_failed_import_keeps_other_writes(run_with_database):
+    async def main(database):
+        await add_cases(1, 1)
+        exported = io.BytesIO()
+        await export_cases(1, exported)
+        lines = gzip.decompress(exported.getvalue()).decode().splitlines()
+        repeated = gzip.compress("\n".join([lines[0]] + [lines[1]] * 50).encode())
+
+        results = await asyncio.gather(
+            import_cases(io.BytesIO(repeated), guild_id=3, batch_size=10),
+            *(Guild.objects.create(id=guild_id) for guild_id in range(10, 15)),
+            return_exceptions=True,
+        )
+        assert isinstance(results[0], ValueError)
+        return await Cases.objects.filter(guild__id=3).count(), await Guild.objects.filter(id__gte=10).count()
+
+    assert run_with_database(main) == (0, 5)
+
+
+def test_integrity_errors_from_any_driver():
+    # Mirrors asyncpg's exception hierarchy, which doesn't share a base class with sqlite3's.
+    class IntegrityConstraintViolationError(Exception):
+        pass
+
+    class UniqueViolationError(IntegrityConstraintViolationError):
+        pass
+
+    assert _is_integrity_error(UniqueViolationError())
+    assert _is_integrity_error(sqlite3.IntegrityError())
+    assert not _is_integrity_error(sqlite3.OperationalError())
+    assert not _is_integrity_error(ValueError())